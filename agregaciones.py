@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Cubo de rutas compartido por todas las gráficas.
+#
+# En lugar de copiar el df completo y agruparlo de nuevo para cada gráfica,
+#   construimos una sola vez un cubo con la cantidad de movimientos y el monto
+#   por (dirección, origen, destino, año, medio de transporte, producto).
+#   Cada vista es solo una agregación pequeña sobre este cubo.
+
+import pandas as pd
+
+
+# Llaves del cubo, en este orden
+LLAVES_CUBO = ['direction', 'origin', 'destination', 'year',
+               'transport_mode', 'product']
+
+
+def construir_cubo(df):
+    """Agrupa el df una sola vez y regresa la cuenta y suma de cada celda."""
+    return (df.groupby(LLAVES_CUBO, observed=True)['total_value']
+              .agg(movimientos='count', monto='sum')
+              .reset_index())
+
+
+def combinar_cubos(cubos, llaves=LLAVES_CUBO):
+    """Suma varios cubos parciales en uno solo."""
+    cubos = [cubo for cubo in cubos if len(cubo)]
+    if not cubos:
+        vacio = pd.DataFrame({llave: pd.Series(dtype=object) for llave in llaves})
+        vacio['movimientos'] = pd.Series(dtype='int64')
+        vacio['monto'] = pd.Series(dtype='int64')
+        return vacio
+    # Unimos las categorías de cada llave para que concat no convierta las
+    #   columnas a texto
+    for llave in llaves:
+        if all(isinstance(c[llave].dtype, pd.CategoricalDtype) for c in cubos):
+            union = pd.api.types.union_categoricals(
+                [c[llave] for c in cubos], sort_categories=True).categories
+            cubos = [c.assign(**{llave: c[llave].cat.set_categories(union)})
+                     for c in cubos]
+    return (pd.concat(cubos, ignore_index=True)
+              .groupby(llaves, observed=True)[['movimientos', 'monto']]
+              .sum().reset_index())
+
+
+def cubo_de_partes(partes):
+    """Construye el cubo a partir de un iterador de dfs sin guardarlos.
+
+    Cada parte se agrupa y se suma al cubo acumulado antes de leer la
+    siguiente, así la memoria depende de la cantidad de celdas del cubo y no
+    de la cantidad de registros. Regresa el cubo y el último register_id.
+    """
+    cubo = None
+    ultimo_id = 0
+    for parte in partes:
+        if len(parte) == 0:
+            continue
+        ultimo_id = max(ultimo_id, int(parte['register_id'].max()))
+        parcial = construir_cubo(parte)
+        cubo = parcial if cubo is None else combinar_cubos([cubo, parcial])
+    if cubo is None:
+        cubo = combinar_cubos([])
+    return cubo, ultimo_id
+
+
+def rebanar(cubo, llaves, valores=('movimientos', 'monto')):
+    """Suma las columnas de valores del cubo agrupando solo por las llaves."""
+    return (cubo.groupby(llaves, observed=True)[list(valores)]
+                .sum().reset_index())
+
+
+def rutas_por_conteo(cubo):
+    """Cantidad de movimientos por dirección, origen y destino."""
+    return rebanar(cubo, ['direction', 'origin', 'destination'],
+                   ['movimientos'])
+
+
+def rutas_por_monto(cubo):
+    """Monto total por dirección, origen y destino."""
+    return rebanar(cubo, ['direction', 'origin', 'destination'], ['monto'])
+
+
+def transportes_por_anio(cubo):
+    """Monto total por año y medio de transporte."""
+    return rebanar(cubo, ['year', 'transport_mode'], ['monto'])
@@ -0,0 +1,397 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Almacén de los registros en SQLite, para datos que no caben en memoria.
+#
+# El CSV se carga por partes a un archivo de SQLite con tres tablas: los
+#   registros, el cubo de rutas y el monto por día (por año, dirección, medio
+#   y producto). El cubo y los días se agregan con SQL después de cargar los
+#   registros y tienen índices sobre las columnas de los filtros, así las
+#   consultas del dashboard (rutas, medios de transporte y Pareto) se
+#   resuelven en SQLite leyendo solo las celdas filtradas. Solo el filtro por
+#   empresa necesita los registros, que tienen su propio índice. En memoria
+#   queda el cubo completo; los registros se quedan en disco.
+#
+# IndiceSQLite tiene los mismos métodos que los índices de indice.py, así que
+#   el resto de la app no cambia. Con varios workers de gunicorn todos
+#   comparten el archivo: solo uno lo construye y la ingesta de cada uno
+#   agrega únicamente los registros que otro no guardó antes.
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Fuera de Unix no hay workers de gunicorn que construyan a la vez
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+from agregaciones import LLAVES_CUBO, construir_cubo
+from datos import a_dias, hash_archivo, leer_csv_por_partes
+from indice import normalizar_filtros
+
+
+# Se incrementa cuando cambia el esquema
+VERSION = 1
+# Registros por parte al cargar el CSV
+PARTES = 1000000
+# Columnas de los registros, en el orden del CSV
+COLUMNAS = ['register_id', 'direction', 'origin', 'destination', 'year',
+            'date', 'product', 'transport_mode', 'company_name', 'total_value']
+# Llaves de la tabla de días, sin la fecha
+LLAVES_DIAS = ['year', 'direction', 'transport_mode', 'product']
+# Las llaves con que se filtra van primero en los índices
+LLAVES_INDICE = ['year', 'direction', 'transport_mode', 'product', 'origin',
+                 'destination']
+
+ESQUEMA = '''
+CREATE TABLE meta (llave TEXT PRIMARY KEY, valor TEXT);
+CREATE TABLE registros (
+    register_id INTEGER, direction TEXT, origin TEXT, destination TEXT,
+    year INTEGER, date INTEGER, product TEXT, transport_mode TEXT,
+    company_name TEXT, total_value INTEGER);
+CREATE TABLE cubo (
+    direction TEXT, origin TEXT, destination TEXT, year INTEGER,
+    transport_mode TEXT, product TEXT, movimientos INTEGER, monto INTEGER);
+CREATE TABLE dias (
+    date INTEGER, year INTEGER, direction TEXT, transport_mode TEXT,
+    product TEXT, monto INTEGER);
+'''
+
+AGREGADOS = '''
+INSERT INTO cubo
+SELECT {cubo}, COUNT(*), SUM(total_value) FROM registros GROUP BY {cubo};
+INSERT INTO dias
+SELECT date, {dias}, SUM(total_value) FROM registros GROUP BY date, {dias};
+CREATE UNIQUE INDEX cubo_llaves ON cubo ({indice});
+CREATE UNIQUE INDEX dias_llaves ON dias ({dias}, date);
+CREATE INDEX registros_empresa ON registros (company_name, year);
+'''.format(cubo=', '.join(LLAVES_CUBO), dias=', '.join(LLAVES_DIAS),
+           indice=', '.join(LLAVES_INDICE))
+
+SUMAR_CUBO = '''
+INSERT INTO cubo ({llaves}, movimientos, monto) VALUES ({marcas}, ?, ?)
+ON CONFLICT ({indice}) DO UPDATE SET
+    movimientos = movimientos + excluded.movimientos,
+    monto = monto + excluded.monto
+'''.format(llaves=', '.join(LLAVES_CUBO),
+           marcas=', '.join('?' * len(LLAVES_CUBO)),
+           indice=', '.join(LLAVES_INDICE))
+
+SUMAR_DIAS = '''
+INSERT INTO dias (date, {llaves}, monto) VALUES (?, {marcas}, ?)
+ON CONFLICT ({llaves}, date) DO UPDATE SET monto = monto + excluded.monto
+'''.format(llaves=', '.join(LLAVES_DIAS),
+           marcas=', '.join('?' * len(LLAVES_DIAS)))
+
+INSERTAR_REGISTROS = 'INSERT INTO registros VALUES ({})'.format(
+    ', '.join('?' * len(COLUMNAS)))
+
+
+def renglones(df):
+    """Tuplas de los registros de un df del CSV, en el orden de COLUMNAS."""
+    columnas = []
+    for columna in COLUMNAS:
+        if columna == 'date':
+            columnas.append(a_dias(df['date']).tolist())
+        elif columna in ('register_id', 'year', 'total_value'):
+            columnas.append(df[columna].to_numpy(dtype=np.int64).tolist())
+        else:
+            columnas.append(df[columna].astype(str).tolist())
+    return zip(*columnas)
+
+
+def renglones_de(df, columnas):
+    """Tuplas de unas columnas de un df con tipos de Python."""
+    return zip(*(df[columna].astype(str).tolist()
+                 if isinstance(df[columna].dtype, pd.CategoricalDtype)
+                 else df[columna].to_numpy(dtype=np.int64).tolist()
+                 for columna in columnas))
+
+
+def leer_meta(ruta):
+    """Metadatos del almacén, vacío si no existe o no se puede leer."""
+    if not os.path.exists(ruta):
+        return {}
+    try:
+        conexion = sqlite3.connect('file:{}?mode=ro'.format(ruta), uri=True)
+        try:
+            return dict(conexion.execute('SELECT llave, valor FROM meta'))
+        finally:
+            conexion.close()
+    except sqlite3.Error:
+        return {}
+
+
+@contextmanager
+def candado_archivo(ruta):
+    """Candado entre procesos sobre ruta + '.lock' mientras dura el bloque."""
+    if fcntl is None:
+        yield
+        return
+    with open(ruta + '.lock', 'a') as archivo:
+        fcntl.flock(archivo, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(archivo, fcntl.LOCK_UN)
+
+
+def construir(ruta_csv, ruta, huella, tamano_parte=PARTES):
+    """Carga el CSV por partes en un almacén nuevo y lo pone en ruta.
+
+    Se escribe en un archivo temporal y luego se mueve, así ningún proceso
+    lee un almacén a medio construir. ruta no debe estar abierta: abrir usa
+    un archivo distinto para cada versión del CSV.
+    """
+    temporal = '{}.tmp-{}'.format(ruta, os.getpid())
+    if os.path.exists(temporal):
+        os.remove(temporal)
+    conexion = sqlite3.connect(temporal)
+    try:
+        # El archivo temporal no necesita diario, si falla se descarta
+        conexion.execute('PRAGMA journal_mode = OFF')
+        conexion.execute('PRAGMA synchronous = OFF')
+        conexion.executescript(ESQUEMA)
+        ultimo_id = 0
+        for parte in leer_csv_por_partes(ruta_csv, tamano_parte):
+            if len(parte) == 0:
+                continue
+            conexion.executemany(INSERTAR_REGISTROS, renglones(parte))
+            ultimo_id = max(ultimo_id, int(parte['register_id'].max()))
+        conexion.executescript(AGREGADOS)
+        conexion.executemany('INSERT INTO meta VALUES (?, ?)',
+                             [('version', str(VERSION)), ('hash', huella),
+                              ('ultimo_id', str(ultimo_id))])
+        conexion.commit()
+        # Con WAL las lecturas no esperan a la ingesta
+        conexion.execute('PRAGMA journal_mode = WAL')
+    finally:
+        conexion.close()
+    os.replace(temporal, ruta)
+
+
+def archivo_de(ruta, huella):
+    """Archivo del almacén para una versión del esquema y un hash del CSV."""
+    return '{}.v{}.{}'.format(ruta, VERSION, huella[:16])
+
+
+def abrir(ruta_csv, ruta, tamano_parte=PARTES):
+    """Índice sobre el almacén del CSV, lo construye si no existe o cambió.
+
+    ruta es el prefijo de los archivos: cada versión del CSV tiene el suyo, así
+    una reconstrucción nunca reemplaza un archivo que otro worker (o la
+    instantánea anterior) tiene abierto junto con sus -wal y -shm. Los workers
+    que arrancan a la vez esperan al que lo está construyendo.
+    """
+    huella = hash_archivo(ruta_csv)
+    archivo = archivo_de(ruta, huella)
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+    with candado_archivo(ruta):
+        meta = leer_meta(archivo)
+        if meta.get('version') != str(VERSION) or meta.get('hash') != huella:
+            construir(ruta_csv, archivo, huella, tamano_parte)
+    return IndiceSQLite(archivo)
+
+
+def donde(filtros):
+    """Cláusula WHERE y parámetros de unos filtros normalizados."""
+    anios, direcciones, medios, productos, empresas = filtros
+    condiciones = []
+    parametros = []
+    if anios:
+        condiciones.append('year BETWEEN ? AND ?')
+        parametros.extend(int(anio) for anio in anios)
+    for columna, valores in (('direction', direcciones),
+                             ('transport_mode', medios),
+                             ('product', productos),
+                             ('company_name', empresas)):
+        if valores:
+            condiciones.append('{} IN ({})'.format(
+                columna, ', '.join('?' * len(valores))))
+            parametros.extend(valores)
+    if not condiciones:
+        return '', parametros
+    return ' WHERE ' + ' AND '.join(condiciones), parametros
+
+
+class IndiceSQLite:
+    """Filtros y agregaciones resueltos en SQLite sobre un almacén en disco.
+
+    Cada hilo (y cada worker después del fork) abre su propia conexión. La
+    ingesta escribe con el candado tomado; con WAL las lecturas siguen
+    mientras tanto. El cubo en memoria corresponde a ultimo_id; leer
+    cualquiera de los dos revisa el último register_id guardado y, si otro
+    worker agregó registros, vuelve a leer el cubo.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._local = threading.local()
+        # Reentrante: agregar sincroniza con el candado tomado
+        self._candado = threading.RLock()
+        self._ultimo_id = None
+        self.sincronizar()
+
+    @property
+    def ultimo_id(self):
+        """Último register_id guardado, también las llaves de las cachés."""
+        self.sincronizar()
+        return self._ultimo_id
+
+    @property
+    def cubo(self):
+        """Cubo de rutas completo del último register_id guardado."""
+        self.sincronizar()
+        return self._cubo
+
+    def conexion(self):
+        """Conexión de este hilo al almacén."""
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.conexion = sqlite3.connect(self.ruta)
+            local.pid = os.getpid()
+        return local.conexion
+
+    def consultar(self, sql, parametros=()):
+        return self.conexion().execute(sql, parametros).fetchall()
+
+    def ultimo_guardado(self):
+        """Último register_id que tiene el archivo, quizá de otro worker."""
+        valor, = self.conexion().execute(
+            "SELECT valor FROM meta WHERE llave = 'ultimo_id'").fetchone()
+        return int(valor)
+
+    def sincronizar(self):
+        """Vuelve a leer el cubo si el archivo tiene otro último register_id.
+
+        Sin cambios solo cuesta leer un renglón de meta.
+        """
+        if self.ultimo_guardado() == self._ultimo_id:
+            return
+        with self._candado:
+            conexion = self.conexion()
+            with conexion:
+                # Una transacción de lectura: el cubo y el register_id son de
+                #   la misma versión aunque otro worker escriba mientras tanto
+                conexion.execute('BEGIN')
+                ultimo_id = self.ultimo_guardado()
+                if ultimo_id != self._ultimo_id:
+                    self._actualizar_cubo()
+                    self._ultimo_id = ultimo_id
+
+    def _actualizar_cubo(self):
+        """Lee las categorías de cada llave y el cubo completo."""
+        self._categorias = {llave: [valor for valor, in self.consultar(
+            'SELECT DISTINCT {0} FROM cubo ORDER BY {0}'.format(llave))]
+            for llave in LLAVES_CUBO if llave != 'year'}
+        self._cubo = self.cubo_filtrado(normalizar_filtros())
+
+    def a_cubo(self, filas):
+        """DataFrame con los tipos del cubo de agregaciones.py."""
+        cubo = pd.DataFrame(filas, columns=LLAVES_CUBO + ['movimientos', 'monto'])
+        for llave, categorias in self._categorias.items():
+            # Valores que otro worker agregó después de leer las categorías
+            nuevas = sorted(set(cubo[llave]).difference(categorias))
+            cubo[llave] = pd.Categorical(cubo[llave],
+                                         categories=categorias + nuevas)
+        return cubo.astype({'year': 'int16', 'movimientos': 'int64',
+                            'monto': 'int64'})
+
+    def opciones(self, columna):
+        """Valores disponibles de una columna."""
+        tabla = 'cubo' if columna in LLAVES_CUBO else 'registros'
+        return [valor for valor, in self.consultar(
+            'SELECT DISTINCT {0} FROM {1} ORDER BY {0}'.format(columna, tabla))]
+
+    def montos_por(self, columna, filtros):
+        """Monto total de cada valor de una columna con los filtros dados."""
+        if columna in LLAVES_CUBO and not filtros[4]:
+            tabla, monto = 'cubo', 'monto'
+        else:
+            tabla, monto = 'registros', 'total_value'
+        condicion, parametros = donde(filtros)
+        filas = self.consultar(
+            'SELECT {0}, SUM({1}) FROM {2}{3} GROUP BY {0} ORDER BY {0}'.format(
+                columna, monto, tabla, condicion), parametros)
+        return pd.Series([monto for _, monto in filas],
+                         index=pd.Index([valor for valor, _ in filas],
+                                        name=columna), dtype='int64')
+
+    def montos_por_dia(self, columna, filtros):
+        """Monto de cada día y cada valor de una columna con los filtros dados.
+
+        Regresa lo mismo que IndiceFiltros.montos_por_dia.
+        """
+        if columna in LLAVES_DIAS and not filtros[4]:
+            tabla, monto = 'dias', 'monto'
+        else:
+            tabla, monto = 'registros', 'total_value'
+        condicion, parametros = donde(filtros)
+        filas = self.consultar(
+            'SELECT date, {0}, SUM({1}) FROM {2}{3} GROUP BY date, {0}'.format(
+                columna, monto, tabla, condicion), parametros)
+        if not filas:
+            return (np.empty(0, dtype=np.int64), [],
+                    np.empty((0, 0), dtype=np.int64))
+        fechas, valores, montos = zip(*filas)
+        dias, renglon = np.unique(np.asarray(fechas, dtype=np.int64),
+                                  return_inverse=True)
+        categorias, posicion = np.unique(np.asarray(valores, dtype=object),
+                                         return_inverse=True)
+        matriz = np.zeros((len(dias), len(categorias)), dtype=np.int64)
+        matriz[renglon, posicion] = montos
+        return dias, categorias.tolist(), matriz
+
+    def agregar(self, nuevos):
+        """Guarda registros nuevos y los suma al cubo y a los días.
+
+        Cada worker lee los mismos registros nuevos del CSV. La transacción
+        toma el candado de escritura de SQLite antes de leer el último
+        register_id guardado, así solo se agregan los que ningún otro worker
+        guardó; los demás solo vuelven a leer el cubo.
+        """
+        if len(nuevos) == 0:
+            return
+        with self._candado:
+            conexion = self.conexion()
+            with conexion:
+                conexion.execute('BEGIN IMMEDIATE')
+                ultimo_id = self.ultimo_guardado()
+                nuevos = nuevos.loc[nuevos['register_id'] > ultimo_id]
+                if len(nuevos):
+                    delta = construir_cubo(nuevos)
+                    diario = (nuevos.assign(date=a_dias(nuevos['date']))
+                                    .groupby(['date'] + LLAVES_DIAS, observed=True)
+                                    ['total_value'].sum().reset_index())
+                    ultimo_id = int(nuevos['register_id'].max())
+                    conexion.executemany(INSERTAR_REGISTROS, renglones(nuevos))
+                    conexion.executemany(SUMAR_CUBO, renglones_de(
+                        delta, LLAVES_CUBO + ['movimientos', 'monto']))
+                    conexion.executemany(SUMAR_DIAS, renglones_de(
+                        diario, ['date'] + LLAVES_DIAS + ['total_value']))
+                    conexion.execute("UPDATE meta SET valor = ? "
+                                     "WHERE llave = 'ultimo_id'",
+                                     (str(ultimo_id),))
+            self.sincronizar()
+
+    def cubo_filtrado(self, filtros):
+        """Cubo de rutas calculado en SQLite solo con lo filtrado.
+
+        Sin filtro por empresa se leen las celdas del cubo; con él se agrupan
+        los registros de esas empresas.
+        """
+        condicion, parametros = donde(filtros)
+        llaves = ', '.join(LLAVES_CUBO)
+        if filtros[4]:
+            sql = ('SELECT {0}, COUNT(*), SUM(total_value) FROM registros{1} '
+                   'GROUP BY {0} ORDER BY {0}').format(llaves, condicion)
+        else:
+            sql = ('SELECT {0}, movimientos, monto FROM cubo{1} '
+                   'ORDER BY {0}').format(llaves, condicion)
+        return self.a_cubo(self.consultar(sql, parametros))
+
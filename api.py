@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# coding: utf-8
+# API de consulta de los agregados del dashboard.
+#
+# Un blueprint en /api expone las tablas con que se construyen las gráficas:
+#   las rutas con sus movimientos y monto (/api/routes), el monto por año y
+#   medio de transporte (/api/transports) y el análisis de Pareto
+#   (/api/pareto). Los parámetros year, direction, transport_mode, product y
+#   company_name filtran igual que los controles del dashboard. Con
+#   ?format=arrow o Accept: application/vnd.apache.arrow.stream la respuesta
+#   es un stream de Arrow IPC, que el cliente lee sin copiar las columnas;
+#   si no, JSON. Cada respuesta lleva un ETag que depende de la versión de
+#   los datos (el hash del CSV y el último register_id) y de la consulta,
+#   así que repetirla con If-None-Match regresa un 304 sin calcular nada.
+
+import hashlib
+import json
+
+from flask import Blueprint, Response, request
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+import agregaciones
+import pareto
+from indice import IndiceCubo, normalizar_filtros
+
+
+# Tipo de los streams de Arrow IPC
+TIPO_ARROW = 'application/vnd.apache.arrow.stream'
+# Parámetros de filtro después del año, en el orden de normalizar_filtros
+PARAMETROS_FILTRO = ['direction', 'transport_mode', 'product', 'company_name']
+# Valores de by en /api/pareto y su agrupación en pareto.AGRUPACIONES o
+#   pareto.AGRUPACIONES_REGISTROS
+AGRUPACIONES = {'route': 'ruta', 'origin': 'origen', 'destination': 'destino',
+                'product': 'producto', 'transport_mode': 'medio',
+                'company': 'empresa'}
+
+
+def valores(args, nombre):
+    """Valores de un parámetro repetido o separado por comas."""
+    return [valor.strip() for texto in args.getlist(nombre)
+            for valor in texto.split(',') if valor.strip()]
+
+
+def filtros_de(args, indice):
+    """Filtros normalizados a partir de los parámetros de la URL.
+
+    year es un año (2016) o un rango (2015-2018). Lanza ValueError si algún
+    parámetro no se puede usar.
+    """
+    anios = None
+    if args.get('year'):
+        desde, _, hasta = args['year'].partition('-')
+        try:
+            anios = [int(desde), int(hasta or desde)]
+        except ValueError:
+            raise ValueError('year debe ser un año o un rango como 2015-2018')
+    filtro = normalizar_filtros(anios, *(valores(args, nombre)
+                                         for nombre in PARAMETROS_FILTRO))
+    if filtro[4] and isinstance(indice, IndiceCubo):
+        raise ValueError('company_name necesita los registros')
+    return filtro
+
+
+def opciones_de(consulta, args, indice):
+    """Opciones propias de cada consulta, ya validadas."""
+    if consulta == 'routes':
+        limite = int(args['limit']) if args.get('limit') else None
+        if limite is not None and limite < 0:
+            raise ValueError('limit no puede ser negativo')
+        return (('limit', limite),)
+    if consulta == 'pareto':
+        agrupacion = args.get('by', 'route')
+        if agrupacion not in AGRUPACIONES:
+            raise ValueError('by debe ser uno de ' + ', '.join(AGRUPACIONES))
+        if (AGRUPACIONES[agrupacion] in pareto.AGRUPACIONES_REGISTROS
+                and isinstance(indice, IndiceCubo)):
+            raise ValueError('by={} necesita los registros'.format(agrupacion))
+        umbral = float(args.get('threshold', pareto.UMBRAL))
+        if not 0 < umbral <= 1:
+            raise ValueError('threshold debe estar entre 0 y 1')
+        return (('by', agrupacion), ('threshold', umbral))
+    return ()
+
+
+def rutas(indice, filtro, limit=None):
+    """Movimientos y monto por dirección, origen y destino."""
+    tabla = agregaciones.rebanar(indice.cubo_filtrado(filtro),
+                                 ['direction', 'origin', 'destination'])
+    tabla = tabla.sort_values('monto', ascending=False, kind='stable')
+    return tabla.head(limit) if limit is not None else tabla
+
+
+def transportes(indice, filtro):
+    """Monto total por año y medio de transporte."""
+    return agregaciones.transportes_por_anio(indice.cubo_filtrado(filtro))
+
+
+def analisis_pareto(indice, filtro, by='route', threshold=pareto.UMBRAL):
+    """Grupos ordenados por monto con su porcentaje acumulado."""
+    agrupacion = AGRUPACIONES[by]
+    if agrupacion in pareto.AGRUPACIONES_REGISTROS:
+        montos = indice.montos_por(pareto.AGRUPACIONES_REGISTROS[agrupacion],
+                                   filtro)
+    else:
+        montos = pareto.montos_por(indice.cubo_filtrado(filtro), agrupacion)
+    return pareto.analizar(montos, threshold)
+
+
+# Tabla de cada consulta a partir del índice, el filtro y sus opciones
+CONSULTAS = {'routes': rutas, 'transports': transportes,
+             'pareto': analisis_pareto}
+
+
+def formato_pedido(peticion):
+    """'arrow' o 'json' según el parámetro format o el encabezado Accept."""
+    formato = peticion.args.get('format')
+    if formato is None:
+        # Solo cuando Arrow se pide por nombre, */* sigue siendo JSON
+        arrow = max([calidad for tipo, calidad in peticion.accept_mimetypes
+                     if tipo == TIPO_ARROW], default=0)
+        formato = ('arrow' if arrow and
+                   arrow >= peticion.accept_mimetypes['application/json']
+                   else 'json')
+    if formato not in ('arrow', 'json'):
+        raise ValueError('format debe ser arrow o json')
+    return formato
+
+
+def a_arrow(tabla, version):
+    """Stream de Arrow IPC de un df, con la versión en los metadatos."""
+    tabla = pa.Table.from_pandas(tabla, preserve_index=False)
+    tabla = tabla.replace_schema_metadata(
+        dict(tabla.schema.metadata or {}, version=version))
+    salida = pa.BufferOutputStream()
+    with pa.ipc.new_stream(salida, tabla.schema) as escritor:
+        escritor.write_table(tabla)
+    return salida.getvalue().to_pybytes()
+
+
+def a_json(tabla, version):
+    """JSON con la versión de los datos y un objeto por renglón."""
+    return '{{"version": {}, "data": {}}}'.format(
+        json.dumps(version), tabla.to_json(orient='records')).encode('utf-8')
+
+
+def error(estado_http, mensaje):
+    return Response(json.dumps({'error': mensaje}), status=estado_http,
+                    mimetype='application/json')
+
+
+def crear_blueprint(estado):
+    """Blueprint de /api con los datos y la caché de un Estado de fabrica.py."""
+    api = Blueprint('api', __name__, url_prefix='/api')
+
+    @api.route('/<consulta>')
+    def consultar(consulta):
+        if consulta not in CONSULTAS:
+            return error(404, 'No existe la consulta ' + consulta)
+        # Toda la petición usa la misma instantánea aunque la recarga la cambie
+        instantanea = estado.instantanea
+        try:
+            formato = formato_pedido(request)
+            filtro = filtros_de(request.args, instantanea.indice)
+            opciones = opciones_de(consulta, request.args, instantanea.indice)
+        except ValueError as excepcion:
+            return error(400, str(excepcion))
+        if formato == 'arrow' and pa is None:
+            return error(406, 'pyarrow no está instalado, use format=json')
+
+        version = instantanea.version()
+        llave = (version, consulta, filtro, opciones, formato)
+        etag = hashlib.sha256(repr(llave).encode('utf-8')).hexdigest()[:32]
+        if request.if_none_match.contains(etag):
+            # El cliente ya tiene esta respuesta, no calculamos nada
+            respuesta = Response(status=304)
+        else:
+            def construir():
+                tabla = CONSULTAS[consulta](
+                    instantanea.indice, filtro, **dict(opciones))
+                return (a_arrow(tabla, version) if formato == 'arrow'
+                        else a_json(tabla, version))
+
+            respuesta = Response(estado.cache_api.obtener(llave, construir),
+                                 mimetype=TIPO_ARROW if formato == 'arrow'
+                                 else 'application/json')
+        respuesta.set_etag(etag)
+        # Se puede guardar, pero siempre se revisa con el ETag
+        respuesta.headers['Cache-Control'] = 'no-cache'
+        respuesta.vary.add('Accept')
+        return respuesta
+
+    return api
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Tiempos de cada etapa del dashboard y latencia de las peticiones HTTP.
+#
+# Para cada tamaño genera (o reutiliza) un CSV sintético y mide la carga del
+#   CSV, la caché columnar, el cubo de rutas, los filtros, el análisis de
+#   Pareto, la serie de tiempo, la construcción de las gráficas y la
+#   serialización del layout. Después crea la app con ese mismo CSV
+#   (fabrica.create_app, sin build precalculado) y mide la latencia y el
+#   throughput de sus peticiones a través del cliente de pruebas de Flask.
+#   Los resultados se guardan en JSON para compararlos entre commits.
+#
+#   python benchmarks/bench_etapas.py --filas 10000 1000000 --salida etapas.json
+#   python benchmarks/bench_etapas.py --comparar etapas.json
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, RAIZ)
+
+import numpy as np  # noqa: E402
+import plotly.utils  # noqa: E402
+
+import agregaciones  # noqa: E402
+import figuras  # noqa: E402
+import pareto  # noqa: E402
+import series  # noqa: E402
+from datos import leer_csv, leer_csv_por_partes, preparar_cache  # noqa: E402
+from indice import IndiceFiltros, normalizar_filtros  # noqa: E402
+from sinteticos import generar_csv  # noqa: E402
+from tabla import cargar_tabla  # noqa: E402
+
+
+# Arriba de estos registros solo se mide la carga por partes, la tabla
+#   completa en memoria no cabe en una máquina normal
+MAX_EN_MEMORIA = 20000000
+# Registros por parte de la app cuando la tabla no cabe en memoria
+PARTES = 1000000
+
+# Filtros de ejemplo para las etapas y las peticiones
+FILTROS = [
+    normalizar_filtros(),
+    normalizar_filtros([2016, 2018], ['Exports'], ['Sea', 'Air']),
+    normalizar_filtros([2019, 2020], ['Imports'], None, ['Cars']),
+]
+
+
+def medir(funcion, repeticiones):
+    """Mejor tiempo de varias repeticiones y el resultado de la última."""
+    mejor = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        segundos = time.perf_counter() - inicio
+        mejor = segundos if mejor is None else min(mejor, segundos)
+    return mejor, resultado
+
+
+def etapas(ruta, filas, repeticiones, max_en_memoria=MAX_EN_MEMORIA):
+    """Segundos de cada etapa con el CSV de `ruta`."""
+    tiempos = {}
+    tiempos['cubo_por_partes'], (cubo, _) = medir(
+        lambda: agregaciones.cubo_de_partes(leer_csv_por_partes(ruta)), 1)
+    if filas > max_en_memoria:
+        return tiempos
+
+    tiempos['csv'], _ = medir(lambda: leer_csv(ruta), 1)
+    directorio = tempfile.mkdtemp(prefix='bench-cache-')
+    try:
+        tiempos['cache_escritura'], _ = medir(
+            lambda: preparar_cache(ruta, directorio), 1)
+        tiempos['cache_lectura'], tabla = medir(
+            lambda: cargar_tabla(ruta, directorio), repeticiones)
+        tiempos['cache_lectura_mmap'], _ = medir(
+            lambda: cargar_tabla(ruta, directorio, mmap=True), repeticiones)
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    tiempos['cubo'], indice = medir(lambda: IndiceFiltros(tabla), repeticiones)
+    cubo = indice.cubo
+    tiempos['filtros'], _ = medir(
+        lambda: [indice.cubo_filtrado(filtro) for filtro in FILTROS],
+        repeticiones)
+    tiempos['pareto'], _ = medir(
+        lambda: pareto.analizar(pareto.montos_por(cubo, 'ruta'), pareto.UMBRAL),
+        repeticiones)
+    tiempos['serie_transporte'], _ = medir(
+        lambda: series.SeriesTiempo(*indice.montos_por_dia(
+            'transport_mode', FILTROS[0])).serie(), repeticiones)
+    tiempos['figuras'], _ = medir(lambda: figuras.construir_figuras(cubo),
+                                  repeticiones)
+    return tiempos
+
+
+def carga_util(app, salida, valores):
+    """Cuerpo de /_dash-update-component para el callback de `salida`."""
+    for llave, callback in app.callback_map.items():
+        if salida in llave:
+            break
+    else:
+        raise KeyError(salida)
+    salidas = [parte.rsplit('.', 1) for parte in llave.strip('.').split('...')]
+    entradas = [dict(entrada, value=valores.get(entrada['id']))
+                for entrada in callback['inputs']]
+    estados = [dict(estado, value=valores.get(estado['id']))
+               for estado in callback.get('state', [])]
+    outputs = [{'id': i, 'property': p} for i, p in salidas]
+    return {'output': llave,
+            'outputs': outputs if llave.startswith('..') else outputs[0],
+            'inputs': entradas,
+            'state': estados,
+            'changedPropIds': [entradas[0]['id'] + '.' + entradas[0]['property']]}
+
+
+def percentiles(tiempos):
+    """Resumen en milisegundos de una lista de segundos."""
+    milisegundos = np.array(tiempos) * 1000
+    return {'peticiones': len(tiempos),
+            'p50_ms': float(np.percentile(milisegundos, 50)),
+            'p95_ms': float(np.percentile(milisegundos, 95)),
+            'media_ms': float(milisegundos.mean()),
+            'por_segundo': len(tiempos) / max(sum(tiempos), 1e-9)}
+
+
+def http(ruta, filas, peticiones, max_en_memoria=MAX_EN_MEMORIA):
+    """Latencia de las peticiones a la app con el CSV de `ruta`."""
+    from fabrica import create_app
+    config = {'fuente': os.path.abspath(ruta), 'precalculado': False}
+    if filas > max_en_memoria:
+        # Solo el cubo de rutas, como la app con SYNERGY_PARTES
+        config['partes'] = PARTES
+    directorio = os.getcwd()
+    os.chdir(RAIZ)
+    try:
+        inicio = time.perf_counter()
+        app = create_app(config, registro=None)
+        crear = time.perf_counter() - inicio
+    finally:
+        os.chdir(directorio)
+    estado = app.server.extensions['synergy']
+    cliente = app.server.test_client()
+    resultados = {'crear_app_s': crear}
+
+    resultados['layout_serializar'] = percentiles([
+        medir(lambda: json.dumps(app.layout,
+                                 cls=plotly.utils.PlotlyJSONEncoder), 1)[0]
+        for _ in range(peticiones)])
+
+    def pedir(metodo, url, **opciones):
+        inicio = time.perf_counter()
+        respuesta = metodo(url, **opciones)
+        segundos = time.perf_counter() - inicio
+        assert respuesta.status_code in (200, 204), respuesta.status_code
+        return segundos
+
+    resultados['index'] = percentiles(
+        [pedir(cliente.get, '/') for _ in range(peticiones)])
+    resultados['layout'] = percentiles(
+        [pedir(cliente.get, '/_dash-layout') for _ in range(peticiones)])
+
+    # Cada filtro se pide una vez sin caché y luego con la caché llena
+    anios = estado.anios
+    for salida in ('heatmap_count', 'bar_origin_100'):
+        cuerpos = []
+        for anio in anios:
+            cuerpos.append(carga_util(app, salida, {
+                'filtro_anios': [anio, anio],
+                'filtro_umbral': pareto.UMBRAL,
+                'version_datos': estado.instantanea.version(),
+                'secciones': 'rutas' if salida == 'heatmap_count' else 'pareto'}))
+        estado.cache_figuras.limpiar()
+        resultados[salida + '_sin_cache'] = percentiles(
+            [pedir(cliente.post, '/_dash-update-component', json=cuerpo)
+             for cuerpo in cuerpos])
+        resultados[salida + '_con_cache'] = percentiles(
+            [pedir(cliente.post, '/_dash-update-component',
+                   json=cuerpos[i % len(cuerpos)])
+             for i in range(peticiones)])
+    return resultados
+
+
+def commit_actual():
+    """Hash del commit del repositorio o None si no se puede obtener."""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=RAIZ,
+                                       stderr=subprocess.DEVNULL
+                                       ).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(anterior, actual):
+    """Imprime el cambio de cada etapa respecto a otro resultado."""
+    for filas, tiempos in actual['tamanos'].items():
+        previos = anterior.get('tamanos', {}).get(filas, {})
+        for etapa, segundos in tiempos.items():
+            if etapa in previos:
+                print('{:>10} {:<20} {:9.4f} s  {:9.4f} s  x{:5.2f}'.format(
+                    filas, etapa, previos[etapa], segundos,
+                    segundos / max(previos[etapa], 1e-9)))
+    for filas, medidas in actual.get('http', {}).items():
+        previas = anterior.get('http', {}).get(filas, {})
+        for nombre, medida in medidas.items():
+            previa = previas.get(nombre)
+            if isinstance(medida, dict) and isinstance(previa, dict):
+                print('{:>10} {:<20} {:9.2f} ms {:9.2f} ms x{:5.2f}'.format(
+                    filas, nombre, previa['p50_ms'], medida['p50_ms'],
+                    medida['p50_ms'] / max(previa['p50_ms'], 1e-9)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--filas', type=int, nargs='+',
+                        default=[10000, 1000000],
+                        help='Tamaños a medir, p. ej. 10000 1000000 100000000')
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--peticiones', type=int, default=50,
+                        help='Peticiones HTTP por cada medición')
+    parser.add_argument('--directorio', default='.',
+                        help='Dónde guardar los CSV sintéticos')
+    parser.add_argument('--sin-http', action='store_true',
+                        help='No medir las peticiones a la app')
+    parser.add_argument('--salida', default=None,
+                        help='Archivo JSON donde guardar los resultados')
+    parser.add_argument('--comparar', default=None,
+                        help='JSON de otra corrida para comparar')
+    args = parser.parse_args()
+
+    resultados = {'commit': commit_actual(),
+                  'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                  'python': platform.python_version(),
+                  'cpus': os.cpu_count(),
+                  'tamanos': {},
+                  'http': {}}
+    for filas in args.filas:
+        ruta = os.path.join(args.directorio, 'sintetico-{}.csv'.format(filas))
+        if not os.path.exists(ruta):
+            print('Generando {} registros en {}'.format(filas, ruta))
+            generar_csv(ruta, filas)
+        tiempos = etapas(ruta, filas, args.repeticiones)
+        resultados['tamanos'][str(filas)] = tiempos
+        for etapa, segundos in tiempos.items():
+            print('{:>10} {:<20} {:9.4f} s'.format(filas, etapa, segundos))
+
+        if not args.sin_http:
+            medidas = http(ruta, filas, args.peticiones)
+            resultados['http'][str(filas)] = medidas
+            for nombre, medida in medidas.items():
+                if isinstance(medida, dict):
+                    print('{:>10} {:<20} p50 {:8.2f} ms  p95 {:8.2f} ms  '
+                          '{:7.1f}/s'.format(filas, nombre, medida['p50_ms'],
+                                             medida['p95_ms'],
+                                             medida['por_segundo']))
+
+    if args.comparar:
+        with open(args.comparar) as archivo:
+            comparar(json.load(archivo), resultados)
+    if args.salida:
+        with open(args.salida, 'w') as archivo:
+            json.dump(resultados, archivo, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Escalamiento del cubo de rutas en paralelo.
+#
+# Genera (o reutiliza) un CSV sintético y mide cuánto tarda cubo_paralelo con
+#   distintas cantidades de procesos. Imprime el tiempo, la aceleración
+#   respecto a un proceso y la eficiencia de cada uno.
+#
+#   python benchmarks/bench_paralelo.py --filas 5000000 --procesos 1 2 4 8
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from paralelo import cubo_paralelo  # noqa: E402
+from sinteticos import generar_csv  # noqa: E402
+
+
+def medir(ruta, procesos, repeticiones):
+    """Mejor tiempo de varias repeticiones de cubo_paralelo."""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        cubo_paralelo(ruta, procesos)
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--filas', type=int, default=2000000)
+    parser.add_argument('--procesos', type=int, nargs='+',
+                        default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--archivo', default=None,
+                        help='CSV a usar, se genera si no existe')
+    parser.add_argument('--salida', default=None,
+                        help='Archivo JSON donde guardar los resultados')
+    args = parser.parse_args()
+
+    ruta = args.archivo or 'sintetico-{}.csv'.format(args.filas)
+    if not os.path.exists(ruta):
+        print('Generando {} registros en {}'.format(args.filas, ruta))
+        generar_csv(ruta, args.filas)
+
+    resultados = []
+    base = None
+    for procesos in sorted(set(args.procesos)):
+        segundos = medir(ruta, procesos, args.repeticiones)
+        base = base or segundos
+        aceleracion = base / segundos
+        resultados.append({'procesos': procesos,
+                           'segundos': segundos,
+                           'aceleracion': aceleracion,
+                           'eficiencia': aceleracion / procesos})
+        print('{:>3} procesos  {:8.3f} s  x{:5.2f}  {:4.0%}'.format(
+            procesos, segundos, aceleracion, aceleracion / procesos))
+
+    if args.salida:
+        with open(args.salida, 'w') as archivo:
+            json.dump({'archivo': ruta,
+                       'filas': args.filas,
+                       'cpus': os.cpu_count(),
+                       'resultados': resultados}, archivo, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Bytes que se envían de cada gráfica, antes y después de recortarlas.
+#
+# Construye las gráficas sin filtros con el CSV real dos veces: como antes,
+#   con la plantilla completa de plotly y los colores en cada layout, y como
+#   ahora, con la plantilla de figuras.PLANTILLA y sin los valores que
+#   plotly.js ya supone. Para cada una imprime el JSON sin comprimir, con
+#   gzip (lo que usa Flask-Compress) y con brotli (lo que sirve WhiteNoise
+#   del build precalculado), y cuánto se ahorró.
+#
+#   python benchmarks/bench_payload.py
+#   python benchmarks/bench_payload.py --salida payload.json
+
+import argparse
+import gzip
+import json
+import os
+import sys
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, RAIZ)
+
+import plotly.utils  # noqa: E402
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+import figuras  # noqa: E402
+
+
+def colores_sin_plantilla(figura):
+    """Como aplicaba los colores figuras.aplicar_colores antes."""
+    figura.update_layout(plot_bgcolor=figuras.colors['background'],
+                         paper_bgcolor=figuras.colors['background'],
+                         font_color=figuras.colors['text'])
+    return figura
+
+
+def construir(estado, recortadas=True):
+    """Gráficas sin filtros, como ahora o como antes."""
+    original = figuras.aplicar_colores
+    if not recortadas:
+        figuras.aplicar_colores = colores_sin_plantilla
+    try:
+        return {nombre: figura for nombre, figura
+                in estado.figuras_sin_filtros().items()
+                if not isinstance(figura, (str, list))}
+    finally:
+        figuras.aplicar_colores = original
+
+
+def tamanos(figura):
+    """Bytes del JSON de una gráfica sin comprimir, con gzip y con brotli."""
+    datos = json.dumps(figura, cls=plotly.utils.PlotlyJSONEncoder).encode()
+    resultado = {'json': len(datos), 'gzip': len(gzip.compress(datos, 6))}
+    if brotli is not None:
+        resultado['br'] = len(brotli.compress(datos))
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--salida', help='archivo JSON con los resultados')
+    argumentos = parser.parse_args()
+
+    os.environ['SYNERGY_PRECALCULADO'] = '0'
+    os.chdir(RAIZ)
+    from fabrica import Estado, configuracion
+    estado = Estado(configuracion())
+
+    antes = construir(estado, recortadas=False)
+    despues = construir(estado)
+    resultados = {}
+    total = {}
+    print('{:<24} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8}'.format(
+        'gráfica', 'json', 'ahora', 'gzip', 'ahora', 'br', 'ahora'))
+    for nombre in antes:
+        resultados[nombre] = {'antes': tamanos(antes[nombre]),
+                              'despues': tamanos(despues[nombre])}
+        fila = []
+        for formato in ('json', 'gzip', 'br'):
+            for momento in ('antes', 'despues'):
+                valor = resultados[nombre][momento].get(formato)
+                total.setdefault(momento, {}).setdefault(formato, 0)
+                if valor is not None:
+                    total[momento][formato] += valor
+                fila.append('-' if valor is None else valor)
+        print('{:<24} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8}'.format(
+            nombre, *fila))
+    resultados['total'] = total
+    for formato in ('json', 'gzip', 'br'):
+        if total['antes'][formato]:
+            ahorro = total['antes'][formato] - total['despues'][formato]
+            print('{:<5} ahorro total {:>8} bytes ({:.0%})'.format(
+                formato, ahorro, ahorro / total['antes'][formato]))
+
+    if argumentos.salida:
+        with open(argumentos.salida, 'w') as archivo:
+            json.dump(resultados, archivo, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Generador de bases de datos sintéticas con el esquema de
+#   synergy_logistics_database.csv, para medir el rendimiento con muchos más
+#   registros de los que tiene el archivo real.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# Archivo real del que tomamos los valores de cada columna
+ARCHIVO_BASE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '..', 'synergy_logistics_database.csv')
+
+COLUMNAS = ['register_id', 'direction', 'origin', 'destination', 'year',
+            'date', 'product', 'transport_mode', 'company_name', 'total_value']
+
+
+def generar_csv(ruta, filas, semilla=0, tamano_parte=1000000,
+                archivo_base=ARCHIVO_BASE):
+    """Escribe un CSV sintético de `filas` registros en `ruta`.
+
+    Cada registro copia la ruta, producto, medio y empresa de un renglón real
+    elegido al azar, con fecha y monto nuevos. Se escribe por partes, así se
+    pueden generar archivos mucho más grandes que la memoria.
+    """
+    base = pd.read_csv(archivo_base, encoding='utf-8-sig')
+    generador = np.random.default_rng(semilla)
+    inicio = pd.Timestamp('2015-01-01')
+    dias = (pd.Timestamp('2020-12-31') - inicio).days + 1
+
+    with open(ruta, 'w', newline='') as archivo:
+        archivo.write(','.join(COLUMNAS) + '\n')
+        escritos = 0
+        while escritos < filas:
+            n = min(tamano_parte, filas - escritos)
+            parte = base.iloc[generador.integers(0, len(base), n)].copy()
+            fechas = inicio + pd.to_timedelta(
+                generador.integers(0, dias, n), unit='D')
+            parte['register_id'] = np.arange(escritos + 1, escritos + n + 1)
+            parte['year'] = fechas.year
+            parte['date'] = fechas.strftime('%d/%m/%y')
+            parte['total_value'] = generador.integers(1, 300, n) * 1000000
+            parte[COLUMNAS].to_csv(archivo, header=False, index=False)
+            escritos += n
+    return ruta
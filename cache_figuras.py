@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Caché de las gráficas que regresan los callbacks.
+#
+# La llave es la tupla normalizada de los filtros, así dos usuarios con los
+#   mismos filtros reciben las mismas gráficas sin volver a construirlas. En
+#   memoria se guarda un LRU con tamaño máximo y TTL opcional. Si se indica un
+#   directorio, las gráficas también se guardan ahí para que todos los workers
+#   de gunicorn las compartan (un directorio en /dev/shm las deja en memoria
+#   compartida). El directorio y los archivos solo los puede leer y escribir
+#   el usuario del proceso; si el directorio es de otro usuario o lo pueden
+#   escribir otros, no se usa, porque sus archivos se cargan con pickle.
+#   Cada entrada guarda su tamaño aproximado en bytes (el de su pickle, o el
+#   que regrese la función medir), así se sabe cuánta memoria ocupa la caché.
+
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+
+logger = logging.getLogger(__name__)
+
+
+def directorio_propio(directorio):
+    """Crea el directorio si hace falta y revisa que solo sea de este usuario."""
+    try:
+        os.makedirs(directorio, mode=0o700, exist_ok=True)
+        estado = os.stat(directorio)
+    except OSError:
+        return False
+    return estado.st_uid == os.getuid() and not estado.st_mode & 0o022
+
+
+def tamano_pickle(valor):
+    """Bytes aproximados de un valor: el tamaño de su pickle."""
+    try:
+        return len(pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL))
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return 0
+
+
+class CacheFiguras:
+    """LRU de resultados con TTL opcional y contadores de aciertos y fallos.
+
+    medir regresa los bytes de un valor, por omisión tamano_pickle; sirve
+    para no contar lo que el valor comparte con otros objetos.
+    """
+
+    def __init__(self, max_entradas=256, ttl=None, directorio=None,
+                 max_archivos=None, medir=tamano_pickle):
+        self.max_entradas = max_entradas
+        # Segundos que vive cada entrada, None para que no expiren
+        self.ttl = ttl
+        self.directorio = directorio
+        self.max_archivos = max_archivos or max_entradas * 4
+        self.medir = medir
+        self.aciertos = 0
+        self.fallos = 0
+        # Bytes aproximados de las entradas en memoria
+        self.bytes = 0
+        self._entradas = OrderedDict()
+        self._candado = threading.Lock()
+        if directorio and not directorio_propio(directorio):
+            logger.warning('No se usa %s para la caché: no es un directorio '
+                           'privado de este usuario', directorio)
+            self.directorio = None
+
+    def obtener(self, llave, construir):
+        """Regresa el valor guardado para la llave o lo construye."""
+        ahora = time.time()
+        with self._candado:
+            entrada = self._entradas.get(llave)
+            if entrada is not None and not self._expirada(entrada[0], ahora):
+                self._entradas.move_to_end(llave)
+                self.aciertos += 1
+                return entrada[1]
+
+        entrada = self._leer_archivo(llave, ahora)
+        if entrada is None:
+            # Construimos fuera del candado para no bloquear otras peticiones
+            valor = construir()
+            self._escribir_archivo(llave, valor, ahora)
+            tamano = self.medir(valor)
+            with self._candado:
+                self.fallos += 1
+                self._guardar(llave, valor, ahora, tamano)
+        else:
+            # Otro worker ya la construyó, conservamos su fecha para el TTL
+            creada, valor = entrada
+            tamano = self.medir(valor)
+            with self._candado:
+                self.aciertos += 1
+                self._guardar(llave, valor, creada, tamano)
+        return valor
+
+    def limpiar(self):
+        """Elimina todas las entradas en memoria y en el directorio."""
+        with self._candado:
+            self._entradas.clear()
+            self.bytes = 0
+        for nombre in self._archivos():
+            self._borrar(nombre)
+
+    def estadisticas(self):
+        """Aciertos, fallos, entradas en memoria y tasa de aciertos."""
+        with self._candado:
+            total = self.aciertos + self.fallos
+            return {'aciertos': self.aciertos,
+                    'fallos': self.fallos,
+                    'entradas': len(self._entradas),
+                    'bytes': self.bytes,
+                    'tasa_aciertos': self.aciertos / total if total else 0.0}
+
+    def _expirada(self, guardada, ahora):
+        return self.ttl is not None and ahora - guardada > self.ttl
+
+    def _guardar(self, llave, valor, creada, tamano):
+        anterior = self._entradas.pop(llave, None)
+        if anterior is not None:
+            self.bytes -= anterior[2]
+        self._entradas[llave] = (creada, valor, tamano)
+        self.bytes += tamano
+        # Sacamos las entradas menos usadas recientemente
+        while len(self._entradas) > self.max_entradas:
+            _, (_, _, tamano) = self._entradas.popitem(last=False)
+            self.bytes -= tamano
+
+    # Respaldo en disco compartido entre procesos
+
+    def _ruta(self, llave):
+        nombre = hashlib.sha1(repr(llave).encode('utf-8')).hexdigest()
+        return os.path.join(self.directorio, nombre + '.pkl')
+
+    def _archivos(self):
+        if not self.directorio:
+            return []
+        return [nombre for nombre in os.listdir(self.directorio)
+                if nombre.endswith('.pkl')]
+
+    def _borrar(self, nombre):
+        try:
+            os.remove(os.path.join(self.directorio, nombre))
+        except OSError:
+            pass
+
+    def _leer_archivo(self, llave, ahora):
+        if not self.directorio:
+            return None
+        ruta = self._ruta(llave)
+        try:
+            with open(ruta, 'rb') as archivo:
+                guardada, creada, valor = pickle.load(archivo)
+            # La fecha de modificación marca el último uso, para el LRU
+            os.utime(ruta)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return None
+        # Dos llaves distintas podrían compartir el mismo hash
+        if guardada != llave or self._expirada(creada, ahora):
+            return None
+        return creada, valor
+
+    def _escribir_archivo(self, llave, valor, ahora):
+        if not self.directorio:
+            return
+        ruta = self._ruta(llave)
+        # Escribimos a un archivo temporal y lo renombramos para que otro
+        #   worker nunca lea un archivo a medias
+        temporal = '{}.{}.tmp'.format(ruta, os.getpid())
+        try:
+            descriptor = os.open(temporal, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                                 0o600)
+            with os.fdopen(descriptor, 'wb') as archivo:
+                pickle.dump((llave, ahora, valor), archivo,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporal, ruta)
+        except OSError:
+            return
+        self._recortar_archivos()
+
+    def _recortar_archivos(self):
+        """Borra los archivos usados hace más tiempo si hay demasiados."""
+        archivos = self._archivos()
+        if len(archivos) <= self.max_archivos:
+            return
+        fechas = []
+        for nombre in archivos:
+            try:
+                fechas.append((os.path.getmtime(
+                    os.path.join(self.directorio, nombre)), nombre))
+            except OSError:
+                pass
+        fechas.sort()
+        for _, nombre in fechas[:len(fechas) - self.max_archivos]:
+            self._borrar(nombre)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Callbacks del dashboard.
+#
+# registrar(app, estado) agrega a una app de fabrica.py los callbacks de los
+#   filtros, de cada sección y de la tabla de registros. Cada callback toma la
+#   instantánea actual del estado una sola vez, así la recarga en segundo
+#   plano nunca le cambia los datos a media petición.
+
+from dash import Input, Output, State, no_update
+from dash.exceptions import PreventUpdate
+
+# Índice para los filtros y construcción de las gráficas
+from indice import IndiceFiltros, normalizar_filtros
+import figuras
+# Series de tiempo por día, semana, mes y año
+import series
+# Tabla de registros paginada en el servidor
+import registros
+from metricas import tramo
+
+
+def posicion_ventana(numero):
+    """Posición desde 0 del número de nodo que escribe el usuario (desde 1)."""
+    try:
+        return max(int(numero) - 1, 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def registrar(app, estado):
+    """Agrega los callbacks del dashboard a la app."""
+    perezoso = estado.config['perezoso']
+
+    # Revisamos si la ingesta o la recarga cambiaron los datos desde que se
+    #   mostró la página
+    @app.callback(
+        Output('version_datos', 'data'),
+        Input('intervalo_datos', 'n_intervals'),
+        State('version_datos', 'data'),
+        prevent_initial_call=True)
+    def revisar_version(n_intervals, version):
+        actual = estado.instantanea.version()
+        if actual == version:
+            return no_update
+        return actual
+
+    # Filtros comunes a todas las secciones
+    entradas_filtros = [
+        Input('filtro_anios', 'value'),
+        Input('filtro_direccion', 'value'),
+        Input('filtro_medio', 'value'),
+        Input('filtro_producto', 'value'),
+        Input('filtro_empresa', 'value'),
+        Input('version_datos', 'data'),
+    ]
+    # En modo perezoso cada sección también depende de la pestaña seleccionada
+    entrada_seccion = [Input('secciones', 'value')] if perezoso else []
+
+    def figuras_de_seccion(seccion, activa, filtros, umbral=None, ventana=None):
+        """Gráficas de una sección con los filtros, desde la caché si ya existen.
+
+        En modo perezoso no se construye nada si la sección no es la pestaña
+        seleccionada, se construye cuando el usuario la abra.
+        """
+        if activa is not None and activa != seccion:
+            raise PreventUpdate
+        filtro = normalizar_filtros(*filtros)
+        # Toda la petición usa la misma instantánea aunque la recarga la cambie
+        instantanea = estado.instantanea
+        # Solo construimos las gráficas si nadie ha pedido antes esta sección con
+        #   los mismos filtros y la misma versión de los datos
+        def construir():
+            with tramo('figuras_' + seccion):
+                return figuras.construir_seccion(
+                    instantanea.indice.cubo_filtrado(filtro), seccion, umbral,
+                    ventana)
+
+        resultado = estado.cache_figuras.obtener(
+            (instantanea.version(), seccion, filtro, umbral, ventana), construir)
+        return [resultado[componente] for componente in figuras.SECCIONES[seccion]]
+
+    # Recalculamos las gráficas cada que cambia un filtro o llegan datos nuevos.
+    #   El índice regresa el cubo con solo los registros filtrados, así que cada
+    #   callback solo agrega unos cientos de celdas. Sin modo perezoso las
+    #   gráficas iniciales ya están en el layout
+    @app.callback(
+        Output('heatmap_count', 'figure'),
+        Output('heatmap_sum', 'figure'),
+        *entradas_filtros,
+        Input('ventana_origen', 'value'),
+        Input('ventana_destino', 'value'),
+        *entrada_seccion,
+        prevent_initial_call=not perezoso)
+    def actualizar_rutas(anios, direcciones, medios, productos, empresas, version,
+                         desde_origen, desde_destino, activa=None):
+        return figuras_de_seccion(
+            'rutas', activa, (anios, direcciones, medios, productos, empresas),
+            ventana=(posicion_ventana(desde_origen),
+                     posicion_ventana(desde_destino)))
+
+    # El navegador reporta el ancho de la ventana al cargar la página. La gráfica
+    #   ocupa 3/5 del 80% del ancho
+    app.clientside_callback(
+        """
+        function(version) {
+            return Math.round(window.innerWidth * 0.48);
+        }
+        """,
+        Output('ancho_transportes', 'data'),
+        Input('version_datos', 'data'))
+
+    # La serie de tiempo también cambia con el zoom: con el rango visible y el
+    #   ancho de la gráfica elegimos el nivel (día, semana, mes o año) para que
+    #   cada línea tenga unos cientos de puntos
+    @app.callback(
+        Output('plot_medios_transporte', 'figure'),
+        *entradas_filtros,
+        Input('plot_medios_transporte', 'relayoutData'),
+        Input('ancho_transportes', 'data'),
+        *entrada_seccion,
+        prevent_initial_call=not perezoso)
+    def actualizar_transporte(anios, direcciones, medios, productos, empresas,
+                              version, relayout, ancho, activa=None):
+        if activa is not None and activa != 'transporte':
+            raise PreventUpdate
+        filtro = normalizar_filtros(anios, direcciones, medios, productos, empresas)
+        rango = series.rango_de_relayout(relayout)
+        puntos = series.puntos_para(ancho)
+        instantanea = estado.instantanea
+        return estado.cache_figuras.obtener(
+            (instantanea.version(), 'transporte', filtro, rango, puntos),
+            lambda: estado.figura_transportes(instantanea, filtro, rango, puntos))
+
+    # El umbral de Pareto solo cambia las gráficas de su sección
+    @app.callback(
+        Output('bar_origin_100', 'figure'),
+        Output('bar_origin_80', 'figure'),
+        Output('par_paises_descartados', 'children'),
+        *entradas_filtros,
+        Input('filtro_umbral', 'value'),
+        *entrada_seccion,
+        prevent_initial_call=not perezoso)
+    def actualizar_pareto(anios, direcciones, medios, productos, empresas, version,
+                          umbral, activa=None):
+        return figuras_de_seccion(
+            'pareto', activa, (anios, direcciones, medios, productos, empresas),
+            umbral)
+
+    # Página de la tabla de registros con los filtros del dashboard, el
+    #   filter_query y el sort_by de la tabla
+    if isinstance(estado.instantanea.indice, IndiceFiltros):
+        @app.callback(
+            Output('tabla_registros', 'data'),
+            Output('tabla_registros', 'page_count'),
+            Output('total_registros', 'children'),
+            *entradas_filtros,
+            Input('tabla_registros', 'page_current'),
+            Input('tabla_registros', 'page_size'),
+            Input('tabla_registros', 'sort_by'),
+            Input('tabla_registros', 'filter_query'),
+            *entrada_seccion)
+        def actualizar_registros(anios, direcciones, medios, productos, empresas,
+                                 version, pagina, tamano, orden, consulta,
+                                 activa=None):
+            if activa is not None and activa != 'registros':
+                raise PreventUpdate
+            filtro = normalizar_filtros(anios, direcciones, medios, productos,
+                                        empresas)
+            instantanea = estado.instantanea
+            criterios = tuple((criterio['column_id'], criterio['direction'])
+                              for criterio in orden or [])
+            tabla, posiciones = estado.cache_registros.obtener(
+                (instantanea.version(), filtro, consulta or '', criterios),
+                lambda: registros.ordenar(
+                    *instantanea.indice.tabla_filtrada(filtro), consulta, orden))
+            renglones, paginas, total = registros.pagina(tabla, posiciones,
+                                                         pagina, tamano)
+            return renglones, paginas, '{:,} registros'.format(total)
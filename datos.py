@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Carga de la base de datos de Synergy Logistics con una caché columnar.
+#
+# La primera vez que se lee el CSV se guarda cada columna como un archivo .npy
+#   dentro de DIRECTORIO_CACHE. Las siguientes cargas (y cada worker de
+#   gunicorn) leen directamente esos arreglos binarios, sin volver a parsear el
+#   texto. La caché se reconstruye solo cuando cambia el hash del CSV. Las
+#   columnas de texto se guardan como códigos int16 con sus valores en el
+#   manifiesto y la fecha como número de día int32, el mismo formato que usa
+#   la tabla codificada de tabla.py.
+
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+
+# Archivo por defecto, relativo al directorio desde donde se inicia la app
+ARCHIVO_CSV = 'synergy_logistics_database.csv'
+# Directorio donde guardamos las columnas ya procesadas
+DIRECTORIO_CACHE = os.environ.get('SYNERGY_CACHE', '.cache')
+
+# Columnas de texto con pocos valores distintos, las guardamos como categorías
+COLUMNAS_CATEGORICAS = ['direction', 'origin', 'destination', 'product',
+                        'transport_mode', 'company_name']
+# Tipos para las columnas numéricas
+TIPOS_NUMERICOS = {'register_id': 'int64',
+                   'year': 'int16',
+                   'total_value': 'int64'}
+# Formato de las fechas en el CSV, p. ej. 31/01/15
+FORMATO_FECHA = '%d/%m/%y'
+
+# Se incrementa cuando cambia la forma en que guardamos la caché
+VERSION_CACHE = 2
+
+
+def tipo_codigos(cantidad):
+    """Tipo entero más chico para los códigos de `cantidad` valores."""
+    return np.int16 if cantidad <= np.iinfo(np.int16).max else np.int32
+
+
+def a_dias(fechas):
+    """Días desde 1970-01-01 de cada fecha, como int32."""
+    return (np.asarray(fechas).astype('datetime64[D]').astype(np.int64)
+                              .astype(np.int32))
+
+
+# Hash de cada archivo ya leído por (ruta, tamaño, fecha de modificación)
+_hashes = {}
+
+
+def hash_archivo(ruta, tamano_bloque=1 << 20):
+    """Regresa el hash sha256 del contenido del archivo.
+
+    Al arrancar lo piden la caché columnar y el build precalculado; mientras
+    el archivo no cambie de tamaño ni de fecha solo se lee una vez.
+    """
+    estado = os.stat(ruta)
+    llave = (os.path.abspath(ruta), estado.st_size, estado.st_mtime_ns)
+    if llave in _hashes:
+        return _hashes[llave]
+    huella = hashlib.sha256()
+    with open(ruta, 'rb') as archivo:
+        for bloque in iter(lambda: archivo.read(tamano_bloque), b''):
+            huella.update(bloque)
+    _hashes[llave] = huella.hexdigest()
+    return _hashes[llave]
+
+
+def parsear_fechas(serie):
+    """Convierte las fechas de texto del CSV a datetime64.
+
+    Hay pocas fechas distintas comparadas con la cantidad de registros, así
+    que parseamos cada fecha distinta una sola vez y luego las repartimos.
+    """
+    codigos, unicas = pd.factorize(serie)
+    fechas = pd.to_datetime(unicas, format=FORMATO_FECHA).to_numpy()
+    return fechas[codigos]
+
+
+def leer_csv(ruta, **opciones):
+    """Lee el CSV original y regresa un DataFrame con tipos definidos.
+
+    Las opciones extra se pasan a pd.read_csv, por ejemplo header y names
+    para leer un fragmento del archivo que no trae encabezado.
+    """
+    tipos = dict(TIPOS_NUMERICOS)
+    tipos.update({columna: 'category' for columna in COLUMNAS_CATEGORICAS})
+    # utf-8-sig elimina el BOM que trae el archivo al inicio
+    df = pd.read_csv(ruta, dtype=tipos, encoding='utf-8-sig', **opciones)
+    df['date'] = parsear_fechas(df['date'])
+    return df
+
+
+def leer_csv_por_partes(ruta, tamano_parte=1000000):
+    """Lee el CSV en partes de tamano_parte registros, con los mismos tipos.
+
+    Es un generador, cada parte se puede descartar después de procesarla, así
+    el archivo completo nunca está en memoria.
+    """
+    tipos = dict(TIPOS_NUMERICOS)
+    tipos.update({columna: 'category' for columna in COLUMNAS_CATEGORICAS})
+    with pd.read_csv(ruta, dtype=tipos, encoding='utf-8-sig',
+                     chunksize=tamano_parte) as partes:
+        for parte in partes:
+            parte['date'] = parsear_fechas(parte['date'])
+            yield parte
+
+
+def directorio_de(ruta, directorio_cache=DIRECTORIO_CACHE):
+    """Directorio de la caché que corresponde a un CSV."""
+    nombre = os.path.splitext(os.path.basename(ruta))[0]
+    return os.path.join(directorio_cache, nombre)
+
+
+def escribir_columnas(df, directorio):
+    """Guarda cada columna del df como .npy, regresa sus entradas.
+
+    Las entradas (nombre, tipo y categorías) son las que leer_cache espera
+    en manifiesto['columnas'].
+    """
+    entradas = []
+    for columna in df.columns:
+        serie = df[columna]
+        entrada = {'nombre': columna}
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            # Guardamos solo los códigos, las categorías van al manifiesto
+            entrada['categorias'] = [str(c) for c in serie.cat.categories]
+            datos = serie.cat.codes.to_numpy().astype(
+                tipo_codigos(len(entrada['categorias'])))
+        elif columna == 'date':
+            datos = a_dias(serie)
+        else:
+            datos = serie.to_numpy()
+        entrada['tipo'] = str(datos.dtype)
+        np.save(os.path.join(directorio, columna + '.npy'), datos)
+        entradas.append(entrada)
+    return entradas
+
+
+def guardar_cache(df, directorio, huella, ultimo_id=None):
+    """Guarda cada columna del df como .npy junto con un manifiesto.
+
+    ultimo_id es el último register_id de los datos, si no se da se toma de
+    la columna register_id (un cubo de rutas no la tiene).
+    """
+    if ultimo_id is None:
+        ultimo_id = int(df['register_id'].max()) if len(df) else 0
+    manifiesto = {'version': VERSION_CACHE,
+                  'hash': huella,
+                  'filas': len(df),
+                  'ultimo_id': int(ultimo_id),
+                  'columnas': []}
+
+    # Escribimos en un directorio temporal y luego lo movemos, así ningún
+    #   otro proceso puede leer una caché a medio escribir
+    temporal = '{}.tmp-{}'.format(directorio, os.getpid())
+    shutil.rmtree(temporal, ignore_errors=True)
+    os.makedirs(temporal)
+
+    manifiesto['columnas'] = escribir_columnas(df, temporal)
+
+    with open(os.path.join(temporal, 'manifiesto.json'), 'w') as archivo:
+        json.dump(manifiesto, archivo)
+
+    # Cambiamos la caché vieja por la nueva
+    viejo = '{}.old-{}'.format(directorio, os.getpid())
+    try:
+        if os.path.exists(directorio):
+            os.rename(directorio, viejo)
+        os.rename(temporal, directorio)
+    except OSError:
+        # Otro worker ganó la carrera, su caché es igual de válida
+        shutil.rmtree(temporal, ignore_errors=True)
+    shutil.rmtree(viejo, ignore_errors=True)
+
+
+def leer_manifiesto(directorio):
+    """Regresa el manifiesto de la caché o None si no existe."""
+    try:
+        with open(os.path.join(directorio, 'manifiesto.json')) as archivo:
+            return json.load(archivo)
+    except (OSError, ValueError):
+        return None
+
+
+def leer_cache(directorio, manifiesto):
+    """Reconstruye el DataFrame a partir de las columnas .npy."""
+    columnas = {}
+    for entrada in manifiesto['columnas']:
+        datos = np.load(os.path.join(directorio, entrada['nombre'] + '.npy'))
+        if 'categorias' in entrada:
+            columnas[entrada['nombre']] = pd.Categorical.from_codes(
+                datos, categories=entrada['categorias'])
+        elif entrada['nombre'] == 'date':
+            columnas[entrada['nombre']] = (datos.astype('datetime64[D]')
+                                                .astype('datetime64[ns]'))
+        else:
+            columnas[entrada['nombre']] = datos
+    return pd.DataFrame(columnas)
+
+
+def cargar_datos(ruta=ARCHIVO_CSV, directorio_cache=DIRECTORIO_CACHE):
+    """Carga la base de datos, usando la caché columnar cuando es válida.
+
+    Solo se parsea el CSV si no hay caché o si el hash del archivo cambió.
+    No hace ninguna petición por red.
+    """
+    directorio, manifiesto, df = preparar_cache(ruta, directorio_cache)
+    if df is None:
+        df = leer_cache(directorio, manifiesto)
+    return df
+
+
+def preparar_cache(ruta=ARCHIVO_CSV, directorio_cache=DIRECTORIO_CACHE):
+    """Deja lista la caché columnar de un CSV.
+
+    Si la caché no existe o el hash del archivo cambió, parsea el CSV y la
+    vuelve a escribir. Regresa el directorio, el manifiesto (None si no se
+    pudo escribir la caché) y el df si se tuvo que parsear el CSV, para no
+    leerlo dos veces.
+    """
+    directorio = directorio_de(ruta, directorio_cache)
+    huella = hash_archivo(ruta)
+
+    manifiesto = leer_manifiesto(directorio)
+    if (manifiesto is not None
+            and manifiesto.get('version') == VERSION_CACHE
+            and manifiesto.get('hash') == huella):
+        return directorio, manifiesto, None
+
+    df = leer_csv(ruta)
+    try:
+        guardar_cache(df, directorio, huella)
+    except OSError:
+        # Si no podemos escribir la caché (disco de solo lectura, por
+        #   ejemplo) seguimos con los datos en memoria
+        return directorio, None, df
+    return directorio, leer_manifiesto(directorio), df
@@ -0,0 +1,437 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Fábrica de la app: create_app(config) arma el dashboard completo.
+#
+# main.py, app.py y el Procfile usan la misma función, cada uno con su
+#   configuración, así solo hay una copia de la carga de datos, el layout y
+#   los callbacks. La configuración por defecto sale de las variables
+#   SYNERGY_* y config la reemplaza llave por llave. Si existe un build de
+#   `python precalculado.py` para estos datos, este código y esta
+#   configuración, el cubo, la celda de cada registro y las gráficas sin
+#   filtros se leen de sus archivos en lugar de calcularse desde el CSV.
+
+import os
+import threading
+
+from dash import Dash
+from flask import Flask, send_file
+# Import para servir archivos en Heroku
+from whitenoise import WhiteNoise
+
+# Carga de datos con caché columnar
+from datos import (ARCHIVO_CSV, guardar_cache, hash_archivo, leer_cache,
+                   leer_csv_por_partes, leer_manifiesto, VERSION_CACHE)
+# Origen de los datos: archivo, directorio de partes o URL
+import fuentes
+from tabla import cargar_tabla
+# Cubo de rutas compartido por todas las gráficas
+import agregaciones
+# Índice para los filtros y construcción de las gráficas
+from indice import IndiceFiltros, IndiceCubo, normalizar_filtros
+import figuras
+# Series de tiempo por día, semana, mes y año
+import series
+# Caché de las gráficas de los callbacks
+from cache_figuras import CacheFiguras
+# Ingesta de registros nuevos mientras la app está corriendo
+import ingesta
+# Recarga completa de los datos en segundo plano
+import refresco
+# Cubo de rutas en varios procesos
+import paralelo
+# Registros en SQLite para datos que no caben en memoria
+import almacen
+# Gráficas, índice y layout precalculados
+import precalculado
+# Tiempos de cada etapa y métricas en /metrics
+import metricas
+from metricas import tramo
+# Layout y callbacks del dashboard
+import layout
+import callbacks
+# Agregados en JSON o Arrow para otros sistemas
+import api
+# Varios conjuntos de datos en un solo servidor
+import inquilinos
+
+
+# Tipos que comprime Flask-Compress: el HTML de la página, los JSON del
+#   layout, de los callbacks y de /api, y los streams de Arrow de /api
+TIPOS_COMPRIMIDOS = ['text/html', 'text/css', 'text/plain',
+                     'application/javascript', 'application/json',
+                     api.TIPO_ARROW]
+
+
+def configuracion(entorno=os.environ):
+    """Configuración de la app a partir de las variables SYNERGY_*."""
+    return {
+        # De dónde salen los datos: un CSV, un directorio con el CSV en partes
+        #   o una URL. Las URL se guardan en disco y solo se vuelven a pedir
+        #   cuando la copia es vieja; sin red usamos la copia o el CSV del repo
+        'fuente': entorno.get('SYNERGY_FUENTE', ARCHIVO_CSV),
+        # Leer el CSV por partes de este tamaño y solo guardar el cubo, para
+        #   archivos que no caben en memoria. En este modo no se puede
+        #   filtrar por empresa
+        'partes': int(entorno.get('SYNERGY_PARTES', 0)),
+        # Construir el cubo repartiendo el CSV en este número de procesos,
+        #   igual que con partes solo se guarda el cubo
+        'procesos': int(entorno.get('SYNERGY_PROCESOS', 0)),
+        # Archivo de SQLite con los registros, el cubo y los montos por día.
+        #   Los filtros se resuelven ahí y solo el cubo queda en memoria
+        'almacen': entorno.get('SYNERGY_ALMACEN'),
+        # Directorio donde se guarda el cubo de rutas de esos dos modos, así
+        #   el siguiente arranque lo lee en lugar de recorrer el CSV
+        'cache_cubo': entorno.get('SYNERGY_CACHE_CUBO'),
+        # Mapear las columnas de la caché con mmap para que todos los workers
+        #   compartan la misma copia, False las copia a cada proceso
+        'mmap': entorno.get('SYNERGY_MMAP', '1') != '0',
+        # Segundos entre cada revisión del CSV para sumar los registros nuevos
+        #   al índice sin reiniciar la app, 0 la apaga
+        'ingesta': float(entorno.get('SYNERGY_INGESTA', 0)),
+        # Segundos entre cada revisión de la fuente para recargar los datos
+        #   completos en segundo plano, 0 la apaga. Reemplaza a la ingesta
+        'refresco': float(entorno.get('SYNERGY_REFRESCO', 0)),
+        # Cada sección en una pestaña, sus gráficas se construyen hasta que
+        #   se abre
+        'perezoso': entorno.get('SYNERGY_PEREZOSO', '0') != '0',
+        # Usar el build de `python precalculado.py` si corresponde
+        'precalculado': entorno.get('SYNERGY_PRECALCULADO', '1') != '0',
+        # Caché de las gráficas por combinación de filtros. Con un directorio
+        #   (p. ej. en /dev/shm) todos los workers la comparten
+        'cache_entradas': int(entorno.get('SYNERGY_CACHE_ENTRADAS', 256)),
+        'cache_ttl': (float(entorno['SYNERGY_CACHE_TTL'])
+                      if entorno.get('SYNERGY_CACHE_TTL') else None),
+        'cache_figuras': entorno.get('SYNERGY_CACHE_FIGURAS'),
+        # Directorio de los perfiles de cProfile de las peticiones
+        'perfil': entorno.get('SYNERGY_PERFIL'),
+        # Comprimir con gzip las respuestas de los callbacks, el layout y
+        #   /api (Flask-Compress). Los archivos de static/ ya los comprime
+        #   WhiteNoise
+        'comprimir': entorno.get('SYNERGY_COMPRIMIR', '1') != '0',
+        # Directorio con un CSV (o un directorio de partes) por inquilino,
+        #   cada uno con su dashboard en /inquilinos/<nombre>/
+        'inquilinos': entorno.get('SYNERGY_INQUILINOS'),
+        # Megabytes aproximados de los inquilinos (cubo y app) en memoria
+        'inquilinos_memoria': float(entorno.get('SYNERGY_INQUILINOS_MEMORIA',
+                                                512)),
+        # Servir static/ con WhiteNoise, como en Heroku
+        'whitenoise': True,
+        # Ruta donde vive el dashboard, '/inquilinos/<nombre>/' en un inquilino
+        'prefijo': '/',
+    }
+
+
+class Estado:
+    """Datos, cachés e hilos de una app creada con create_app.
+
+    Los callbacks leen los datos de la instantánea actual, que la recarga en
+    segundo plano reemplaza completa.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.fuente = fuentes.fuente_de(config['fuente'])
+        with tramo('fuente'):
+            self.ruta_csv = self.fuente.ruta_local()
+        # Build de precalculado.py para estos datos, o None
+        self.paquete = None
+        if config['precalculado']:
+            with tramo('precalculado'):
+                self.paquete = precalculado.cargar(self.ruta_csv, config)
+
+        # La firma se toma antes de cargar: la ingesta empieza en ese tamaño y
+        #   no se salta lo que se agregue mientras tanto
+        firma = refresco.firma_archivo(self.ruta_csv)
+        indice = self.cargar_indice(self.ruta_csv, self.paquete)
+        # Años disponibles para el slider
+        self.anios = sorted(indice.opciones('year'))
+        self.refresco = refresco.Refresco(
+            self.fuente, self.cargar_indice,
+            refresco.Instantanea(indice, firma),
+            config['refresco'], al_cambiar=self.precalentar)
+        # El hilo de ingesta se inicia con la primera petición (ver
+        #   iniciar_hilos)
+        self.hilo_ingesta = None
+        self._candado = threading.Lock()
+        self._detenido = False
+
+        # Gráficas por combinación de filtros. El directorio compartido dura
+        #   más que el proceso, así que cada versión de los datos y del código
+        #   usa su propio subdirectorio
+        directorio_figuras = config['cache_figuras']
+        if directorio_figuras:
+            directorio_figuras = os.path.join(
+                directorio_figuras,
+                precalculado.huella_actual(self.ruta_csv)[:16])
+        self.cache_figuras = CacheFiguras(max_entradas=config['cache_entradas'],
+                                          ttl=config['cache_ttl'],
+                                          directorio=directorio_figuras)
+        # Series de tiempo de los medios de transporte por combinación de
+        #   filtros
+        self.cache_series = CacheFiguras(max_entradas=32)
+        # Registros ordenados de la tabla por filtros, consulta y orden, para
+        #   cambiar de página sin volver a ordenar
+        #   (la tabla es la del índice, solo cuentan las posiciones)
+        self.cache_registros = CacheFiguras(
+            max_entradas=8, medir=lambda valor: valor[1].nbytes)
+        # Respuestas de /api ya serializadas
+        self.cache_api = CacheFiguras(max_entradas=64, medir=len)
+
+    @property
+    def instantanea(self):
+        """Instantánea actual de los datos."""
+        return self.refresco.actual
+
+    def cargar_indice(self, ruta, paquete=None):
+        """Índice de los datos de un CSV, al arrancar y en cada recarga.
+
+        Con el paquete de un build precalculado se usan su cubo y sus celdas
+        en lugar de volver a agrupar los registros.
+        """
+        config = self.config
+        if config['almacen']:
+            with tramo('almacen'):
+                return almacen.abrir(ruta, config['almacen'],
+                                     config['partes'] or almacen.PARTES)
+        if config['procesos'] or config['partes']:
+            if paquete is not None:
+                with tramo('cubo_precalculado'):
+                    return IndiceCubo(paquete.cubo(), paquete.ultimo_id)
+            return IndiceCubo(*self.cargar_cubo(ruta))
+        # Creamos la tabla codificada del Archivo, la primera carga guarda una
+        #   caché columnar y las siguientes la leen directamente
+        with tramo('cargar_tabla'):
+            tabla = cargar_tabla(ruta, mmap=config['mmap'])
+
+        if paquete is not None and paquete.filas == len(tabla):
+            with tramo('indice_precalculado'):
+                return IndiceFiltros(tabla, paquete.celdas(config['mmap']),
+                                     paquete.cubo())
+        # El índice agrupa la tabla una sola vez en el cubo de rutas, todas las
+        #   gráficas se construyen a partir de él sin volver a recorrer la tabla
+        with tramo('indice'):
+            return IndiceFiltros(tabla)
+
+    def cargar_cubo(self, ruta):
+        """Cubo de rutas y último register_id sin cargar los registros.
+
+        Con cache_cubo el cubo se guarda en disco y solo se vuelve a armar
+        cuando cambia el hash del CSV.
+        """
+        config = self.config
+        directorio = config['cache_cubo']
+        if directorio:
+            huella = hash_archivo(ruta)
+            manifiesto = leer_manifiesto(directorio)
+            if (manifiesto is not None
+                    and manifiesto.get('version') == VERSION_CACHE
+                    and manifiesto.get('hash') == huella):
+                with tramo('cubo_cache'):
+                    return leer_cache(directorio, manifiesto), manifiesto['ultimo_id']
+        if config['procesos']:
+            with tramo('cubo_paralelo'):
+                cubo, ultimo_id = paralelo.cubo_paralelo(ruta, config['procesos'])
+        else:
+            with tramo('cubo_por_partes'):
+                cubo, ultimo_id = agregaciones.cubo_de_partes(
+                    leer_csv_por_partes(ruta, config['partes']))
+        if directorio:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(directorio)),
+                            exist_ok=True)
+                guardar_cache(cubo, directorio, huella, ultimo_id)
+            except OSError:
+                # Si no podemos escribir la caché seguimos con el cubo en
+                #   memoria
+                pass
+        return cubo, ultimo_id
+
+    def memoria(self):
+        """Bytes aproximados del cubo actual y de las cachés en memoria.
+
+        Se mide en cada llamada, así cuenta lo que crecen el cubo con la
+        ingesta y las cachés con las peticiones.
+        """
+        cubo = int(self.instantanea.indice.cubo.memory_usage(deep=True).sum())
+        return cubo + sum(cache.bytes for cache in (
+            self.cache_figuras, self.cache_series, self.cache_registros,
+            self.cache_api))
+
+    def serie_transportes(self, instantanea, filtro):
+        """Series de tiempo de los medios de transporte de una instantánea."""
+        indice = instantanea.indice
+        return self.cache_series.obtener(
+            (instantanea.version(), filtro),
+            lambda: series.SeriesTiempo(*indice.montos_por_dia('transport_mode', filtro)))
+
+    def figura_transportes(self, instantanea, filtro, rango=None,
+                           puntos=series.PUNTOS):
+        """Gráfica de medios de transporte con el nivel que cabe en el rango.
+
+        Cuando solo existe el cubo, que no tiene fechas, la gráfica se queda
+        con los montos por año.
+        """
+        with tramo('figuras_transporte'):
+            if isinstance(instantanea.indice, IndiceCubo):
+                return figuras.medios_transporte(
+                    instantanea.indice.cubo_filtrado(filtro))
+            resolucion, transportes = self.serie_transportes(
+                instantanea, filtro).serie(rango, puntos)
+            return figuras.medios_transporte_fechas(transportes, resolucion)
+
+    def figuras_sin_filtros(self):
+        """Gráficas y texto de cada componente sin ningún filtro."""
+        instantanea = self.instantanea
+        with tramo('figuras_iniciales'):
+            resultado = figuras.construir_figuras(instantanea.indice.cubo)
+        resultado['plot_medios_transporte'] = self.figura_transportes(
+                                            instantanea, normalizar_filtros())
+        return resultado
+
+    def figuras_iniciales(self):
+        """Contenido de cada componente en el layout.
+
+        En modo perezoso van gráficas vacías que los callbacks de cada
+        sección llenan; si no, las del build precalculado o las calculadas.
+        """
+        if self.config['perezoso']:
+            vacia = figuras.figura_vacia()
+            iniciales = {componente: vacia
+                         for componentes in figuras.SECCIONES.values()
+                         for componente in componentes}
+            iniciales['par_paises_descartados'] = ''
+            return iniciales
+        if self.paquete is not None:
+            with tramo('figuras_precalculadas'):
+                return self.paquete.figuras()
+        return self.figuras_sin_filtros()
+
+    def precalentar(self, instantanea):
+        """Construye las gráficas sin filtros de una instantánea nueva.
+
+        Se llama desde la recarga antes de publicar la instantánea, así la
+        primera petición con los datos nuevos ya encuentra sus gráficas.
+        """
+        filtro = normalizar_filtros([self.anios[0], self.anios[-1]])
+        cubo_filtrado = instantanea.indice.cubo_filtrado(filtro)
+        for seccion, umbral, ventana in (
+                ('rutas', None, figuras.VENTANA_INICIAL), ('pareto', 0.8, None)):
+            self.cache_figuras.obtener(
+                (instantanea.version(), seccion, filtro, umbral, ventana),
+                lambda: figuras.construir_seccion(cubo_filtrado, seccion,
+                                                  umbral, ventana))
+        if not isinstance(instantanea.indice, IndiceCubo):
+            self.serie_transportes(instantanea, filtro)
+
+    def iniciar_hilos(self):
+        """Inicia el hilo de recarga o de ingesta de este proceso.
+
+        Con gunicorn --preload el proceso maestro carga los datos y luego crea
+        los workers con fork, pero los hilos no sobreviven al fork. Por eso
+        cada proceso inicia su hilo cuando recibe su primera petición.
+        """
+        if self._detenido:
+            return
+        if self.config['refresco']:
+            if self.refresco.ident is None:
+                with self._candado:
+                    if self.refresco.ident is None:
+                        self.refresco.start()
+            return
+        if not self.config['ingesta'] or (self.hilo_ingesta is not None
+                                          and self.hilo_ingesta.is_alive()):
+            return
+        with self._candado:
+            if self.hilo_ingesta is None or not self.hilo_ingesta.is_alive():
+                instantanea = self.instantanea
+                self.hilo_ingesta = ingesta.iniciar(
+                    instantanea.firma[0], instantanea.indice,
+                    self.config['ingesta'], self.fuente,
+                    posicion=instantanea.firma[1])
+
+    def detener(self):
+        """Detiene los hilos, por ejemplo al descartar un inquilino."""
+        with self._candado:
+            self._detenido = True
+            self.refresco.detener()
+            if self.hilo_ingesta is not None:
+                self.hilo_ingesta.detener()
+
+
+def create_app(config=None, estado=None, registro=metricas.REGISTRO):
+    """Crea la app de Dash con los datos, el layout y los callbacks.
+
+    config reemplaza llaves de configuracion(), por ejemplo
+    create_app({'perezoso': True}). El Estado de la app queda en
+    app.server.extensions['synergy']. Con estado la app usa esos datos en
+    lugar de cargarlos; con registro None no se instala /metrics.
+    """
+    if estado is None:
+        config = dict(configuracion(), **(config or {}))
+        estado = Estado(config)
+    else:
+        config = dict(estado.config, **(config or {}))
+    prefijo = config['prefijo']
+
+    # Creamos la app en Dash
+    server = Flask(__name__)
+    # Flask-Compress lee los tipos al iniciarse junto con la app de Dash
+    server.config['COMPRESS_MIMETYPES'] = TIPOS_COMPRIMIDOS
+    app = Dash(__name__, server=server, url_base_pathname=prefijo,
+               compress=config['comprimir'])
+    server.extensions['synergy'] = estado
+    if config['whitenoise']:
+        server.wsgi_app = WhiteNoise(server.wsgi_app, root='static/',
+                                     mimetypes=precalculado.TIPOS)
+        # Con el build de `python precalculado.py` WhiteNoise responde
+        #   /_dash-layout con el archivo comprimido; el resto del build está
+        #   fuera de static/ y no se publica
+        if estado.paquete is not None:
+            precalculado.servir(server.wsgi_app, app, estado.paquete)
+
+    app.layout = layout.construir(estado)
+    callbacks.registrar(app, estado)
+    server.before_request(estado.iniciar_hilos)
+    # Las tablas de las gráficas en /api, para quien las necesite sin
+    #   leer las figuras
+    server.register_blueprint(api.crear_blueprint(estado),
+                              url_prefix=prefijo + 'api')
+
+    # El CSV en uso se puede descargar en la misma dirección que tenía la
+    #   copia que antes vivía en static/
+    @server.route(prefijo + ARCHIVO_CSV)
+    def descargar_csv():
+        return send_file(os.path.abspath(estado.ruta_csv), mimetype='text/csv',
+                         conditional=True)
+
+    # Con un directorio de inquilinos, sus dashboards se atienden antes de
+    #   llegar a esta app
+    if config['inquilinos']:
+        server.wsgi_app = inquilinos.Inquilinos(server.wsgi_app, config,
+                                                Estado, create_app)
+    if registro is None:
+        return app
+
+    # Tiempos de cada petición y callback, aciertos de las cachés y memoria
+    #   en /metrics. Con perfil las peticiones con el encabezado X-Perfil: 1
+    #   se perfilan con cProfile y se guardan ahí
+    registro_metricas = metricas.instalar(
+        server,
+        caches={'figuras': estado.cache_figuras, 'series': estado.cache_series,
+                'registros': estado.cache_registros, 'api': estado.cache_api},
+        directorio_perfil=config['perfil'], registro=registro,
+        callbacks=app.callback_map)
+    if config['inquilinos']:
+        server.wsgi_app.medidas(registro_metricas)
+    registro_metricas.medida('synergy_ultimo_register_id',
+                             'Último register_id cargado, cambia con la ingesta.',
+                             lambda: estado.instantanea.indice.ultimo_id)
+    registro_metricas.medida('synergy_recargas',
+                             'Recargas de los datos desde que inició el proceso.',
+                             lambda: estado.instantanea.numero)
+    return app
+
+
+def create_server(config=None):
+    """Servidor de Flask de create_app, para `gunicorn 'fabrica:create_server()'`."""
+    return create_app(config).server
@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Construcción de las gráficas del dashboard a partir del cubo de rutas.
+#
+# Las mismas funciones sirven para las gráficas iniciales del layout y para
+#   los callbacks de los filtros, que les pasan un cubo ya filtrado. Las
+#   gráficas se agrupan por sección del dashboard para poder construir solo
+#   las de la sección que se está viendo.
+#
+# Todas las gráficas usan la plantilla PLANTILLA: la de plotly recortada a los
+#   tipos de traza del dashboard y con los colores de la página. Plotly copia
+#   la plantilla completa en el JSON de cada gráfica, así que la de plotly
+#   (unos 7 KB) se enviaba en cada figura del layout y de cada callback.
+
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+
+import agregaciones
+import pareto
+from matriz import MatrizOD, VENTANA
+import series
+
+
+# Colores para los gráficos y la página
+colors = {
+    'background': '#111111',
+    'text': '#f3f6f4'
+}
+
+# Componentes que llena cada sección del dashboard
+SECCIONES = {
+    'rutas': ['heatmap_count', 'heatmap_sum'],
+    'transporte': ['plot_medios_transporte'],
+    'pareto': ['bar_origin_100', 'bar_origin_80', 'par_paises_descartados'],
+}
+
+
+# Posición (origen, destino) de la ventana inicial de los heatmaps: las rutas
+#   con más valor
+VENTANA_INICIAL = (0, 0)
+
+# Nombre de la plantilla de la página, registrada en plotly.io.templates
+PLANTILLA = 'synergy'
+# Tipos de traza que usa el dashboard, la plantilla solo lleva los suyos
+TRAZAS = ['bar', 'heatmap', 'scatter', 'scattergl']
+# Partes del layout de la plantilla de plotly que usan las gráficas
+LAYOUT_PLANTILLA = ['autotypenumbers', 'colorway', 'font', 'hoverlabel',
+                    'hovermode', 'title', 'xaxis', 'yaxis']
+
+
+def plantilla_oscura(base='plotly'):
+    """Plantilla de plotly recortada con los colores de la página."""
+    base = pio.templates[base].to_plotly_json()
+    datos = {traza: base['data'][traza] for traza in TRAZAS
+             if traza in base['data']}
+    # Las escalas de color con 3 decimales se ven igual y pesan la mitad
+    for traza in datos.get('heatmap', []):
+        if 'colorscale' in traza:
+            traza['colorscale'] = [[round(posicion, 3), color]
+                                   for posicion, color in traza['colorscale']]
+    plantilla = go.layout.Template(
+        data=datos,
+        layout={llave: base['layout'][llave] for llave in LAYOUT_PLANTILLA
+                if llave in base['layout']})
+    plantilla.layout.update(plot_bgcolor=colors['background'],
+                            paper_bgcolor=colors['background'],
+                            font_color=colors['text'])
+    return plantilla
+
+
+pio.templates[PLANTILLA] = plantilla_oscura()
+
+
+def aplicar_colores(figura):
+    """Usa la plantilla de la página y quita lo que plotly.js ya supone.
+
+    Plotly Express escribe en cada gráfica valores que son los de omisión
+    para una sola gráfica (el ancla y el dominio de los ejes, el eje de cada
+    traza), así que no hace falta enviarlos.
+    """
+    figura.update_layout(template=PLANTILLA)
+    for nombre, ancla in (('xaxis', 'y'), ('yaxis', 'x')):
+        eje = figura.layout[nombre]
+        if eje.anchor == ancla:
+            eje.anchor = None
+        if eje.domain is not None and tuple(eje.domain) == (0, 1):
+            eje.domain = None
+    for traza in figura.data:
+        if traza.xaxis == 'x':
+            traza.xaxis = None
+        if traza.yaxis == 'y':
+            traza.yaxis = None
+        if 'line' in traza and traza.line.dash == 'solid':
+            traza.line.dash = None
+        if 'marker' in traza and 'symbol' in traza.marker \
+                and traza.marker.symbol == 'circle':
+            traza.marker.symbol = None
+    return figura
+
+
+def figura_vacia():
+    """Gráfica sin datos con los colores de la página, para el layout inicial."""
+    figura = go.Figure()
+    figura.update_xaxes(visible=False)
+    figura.update_yaxes(visible=False)
+    return aplicar_colores(figura)
+
+
+def heatmap_origen_destino(matriz, valor, titulo, etiqueta,
+                           inicio=VENTANA_INICIAL):
+    """Heatmap de una ventana de la matriz origen-destino.
+
+    inicio es la posición (origen, destino) donde empieza la ventana entre
+    los nodos ordenados de mayor a menor valor. Si hay más nodos de los que
+    caben, el título dice cuáles se están viendo.
+    """
+    # Solo los nodos de la ventana visible se convierten en matriz densa,
+    #   ordenados de mayor a menor valor, así el navegador recibe el mismo
+    #   tamaño de matriz sin importar cuántos países o puertos existan
+    total_origenes = len(matriz.orden(valor, 'origen'))
+    total_destinos = len(matriz.orden(valor, 'destino'))
+    # Una posición después del último nodo muestra la última ventana
+    inicio_renglon = max(min(inicio[0], total_origenes - VENTANA), 0)
+    inicio_columna = max(min(inicio[1], total_destinos - VENTANA), 0)
+    origenes, destinos, mosaico = matriz.ventana(
+        valor, VENTANA, VENTANA, inicio_renglon, inicio_columna)
+    if len(origenes) < total_origenes or len(destinos) < total_destinos:
+        titulo += ('<br><sup>Orígenes {} a {} de {}, destinos {} a {} de {}'
+                   '</sup>').format(
+            inicio_renglon + 1, inicio_renglon + len(origenes), total_origenes,
+            inicio_columna + 1, inicio_columna + len(destinos), total_destinos)
+    figura = go.Figure(go.Heatmap(
+                    z=mosaico,
+                    # En el eje x ponemos el país de destino
+                    x=destinos,
+                    # En el eje y ponemos el país de origen
+                    y=origenes,
+                    # Agregamos texto a los cuadrados
+                    texttemplate='%{z}',
+                    colorbar={'title': {'text': etiqueta}},
+                    hovertemplate='País de origen=%{y}<br>'
+                                  'País de destino=%{x}<br>'
+                                  + etiqueta + '=%{z}<extra></extra>'))
+    figura.update_layout(
+        # Título del gráfico
+        title=titulo,
+        xaxis_title="País de destino",
+        yaxis_title="País de origen",
+        # El origen con más valor queda arriba
+        yaxis_autorange='reversed')
+    return aplicar_colores(figura)
+
+
+def heatmap_count(cubo, matriz=None, inicio=VENTANA_INICIAL):
+    """Heatmap origen-destino por cantidad de movimientos."""
+    if matriz is None:
+        matriz = MatrizOD.desde_cubo(cubo)
+    return heatmap_origen_destino(matriz, 'movimientos',
+                                  "Relación origen-destino por cantidad",
+                                  'Movimientos', inicio)
+
+
+def heatmap_sum(cubo, matriz=None, inicio=VENTANA_INICIAL):
+    """Heatmap origen-destino por monto."""
+    if matriz is None:
+        matriz = MatrizOD.desde_cubo(cubo)
+    return heatmap_origen_destino(matriz, 'monto',
+                                  "Relación origen-destino por monto",
+                                  'Monto', inicio)
+
+
+def medios_transporte(cubo):
+    """Gráfico de línea con el monto por año de cada medio de transporte."""
+    # Monto total por año y medio de transporte
+    transportes = agregaciones.transportes_por_anio(cubo)
+    # Cambiamos el nombre de las columnas
+    transportes.rename(columns={'transport_mode': 'Medio de Transporte',
+                                'monto': 'Monto total',
+                                'year': 'Año'},
+                       inplace=True)
+    figura = px.line(transportes,
+                     x='Año',
+                     y='Monto total',
+                     color='Medio de Transporte',
+                     title='Medios de transporte por monto generado')
+    return aplicar_colores(figura)
+
+
+def medios_transporte_fechas(transportes, resolucion):
+    """Gráfico de línea con el monto por periodo de cada medio de transporte.
+
+    transportes es la serie larga de SeriesTiempo.serie y resolucion el nivel
+    que se usó para construirla.
+    """
+    transportes = transportes.rename(columns={'fecha': 'Fecha',
+                                              'transport_mode': 'Medio de Transporte',
+                                              'monto': 'Monto total'})
+    # Todos los niveles empiezan en un día, sin la hora cada fecha pesa la
+    #   mitad en el JSON
+    transportes['Fecha'] = (transportes['Fecha'].to_numpy()
+                            .astype('datetime64[D]').astype(str))
+    figura = px.line(transportes,
+                     x='Fecha',
+                     y='Monto total',
+                     color='Medio de Transporte',
+                     title='Medios de transporte por monto generado (por {})'
+                           .format(series.NOMBRES[resolucion]))
+    # Conserva el zoom del usuario cuando llega la gráfica con otro nivel
+    figura.update_layout(uirevision='medios_transporte')
+    return aplicar_colores(figura)
+
+
+def origenes_pareto(cubo, umbral=pareto.UMBRAL):
+    """Rutas por país de origen del valor total y del umbral del valor."""
+    # Rutas origen-destino ordenadas de mayor a menor monto, marcando las que
+    #   tienen un porcentaje acumulado igual o menor al umbral
+    rutas_importantes = pareto.analizar(pareto.montos_por(cubo, 'ruta'),
+                                        umbral)
+    # Cantidad de rutas que salen de cada país de origen
+    count_origin_100 = pareto.contar_por(rutas_importantes, 'origin')
+    count_origin_80 = pareto.contar_por(
+        rutas_importantes.loc[rutas_importantes['dentro']], 'origin')
+    # Cambiamos el nombre de las columnas
+    for count in (count_origin_100, count_origin_80):
+        count.rename(columns={'rutas': 'Cantidad de rutas',
+                              'origin': 'País de origen'}, inplace=True)
+    return count_origin_100, count_origin_80
+
+
+def bar_origin(count_origin, title):
+    """Gráfica de barras con la cantidad de rutas por país de origen."""
+    figura = px.bar(count_origin,
+                    y="País de origen",
+                    x="Cantidad de rutas",
+                    title=title)
+    return aplicar_colores(figura)
+
+
+def paises_descartados(count_origin_100, count_origin_80):
+    """Países de origen que quedan fuera al usar el umbral del valor."""
+    return pareto.fuera(count_origin_100['País de origen'].tolist(),
+                        count_origin_80['País de origen'].tolist())
+
+
+def texto_paises_descartados(paises, umbral=pareto.UMBRAL):
+    """Contenido del párrafo con la lista de países descartados."""
+    texto = ['Los paises descartados usando el {:.0%} son: '.format(umbral)]
+    # Vamos agregando los países de la lista separados por comas
+    for i in range(len(paises)):
+        texto.append(paises[i])
+        if i < len(paises) - 2:
+            texto.append(", ")
+        if i == len(paises) - 2:
+            texto.append(" y ")
+    texto.append(".")
+    return texto
+
+
+def construir_seccion(cubo, seccion, umbral=pareto.UMBRAL,
+                      ventana=VENTANA_INICIAL):
+    """Construye solo las gráficas de una sección del dashboard.
+
+    seccion es una de las llaves de SECCIONES. umbral solo se usa en la
+    sección de Pareto y ventana, la posición (origen, destino) de los
+    heatmaps, en la de rutas. Regresa un diccionario con el id de cada componente de
+    la sección y su contenido.
+    """
+    if seccion == 'rutas':
+        # Las dos gráficas salen de la misma matriz origen-destino
+        matriz = MatrizOD.desde_cubo(cubo)
+        return {
+            'heatmap_count': heatmap_count(cubo, matriz, ventana),
+            'heatmap_sum': heatmap_sum(cubo, matriz, ventana),
+        }
+    if seccion == 'transporte':
+        return {'plot_medios_transporte': medios_transporte(cubo)}
+    if seccion == 'pareto':
+        count_origin_100, count_origin_80 = origenes_pareto(cubo, umbral)
+        return {
+            'bar_origin_100': bar_origin(
+                    count_origin_100,
+                    "Rutas por países de origen del valor total"),
+            'bar_origin_80': bar_origin(
+                    count_origin_80,
+                    "Rutas por países del {:.0%} del valor".format(umbral)),
+            'par_paises_descartados': texto_paises_descartados(
+                    paises_descartados(count_origin_100, count_origin_80),
+                    umbral),
+        }
+    raise KeyError(seccion)
+
+
+def construir_figuras(cubo, umbral=pareto.UMBRAL):
+    """Construye todas las gráficas del dashboard a partir de un cubo.
+
+    umbral es la fracción del valor total para el análisis de Pareto.
+    Regresa un diccionario con el id de cada componente y su contenido.
+    """
+    resultado = {}
+    for seccion in SECCIONES:
+        resultado.update(construir_seccion(cubo, seccion, umbral))
+    return resultado
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Origen de la base de datos: archivo local, directorio de partes o URL.
+#
+# Cada fuente deja los datos en un CSV local y regresa su ruta, así la caché
+#   columnar, la ingesta y el cubo en paralelo siguen trabajando con un
+#   archivo. Un directorio de partes se une en un solo CSV que solo se
+#   vuelve a escribir cuando cambia alguna parte. Una URL se descarga una vez
+#   a DIRECTORIO y, mientras la copia tenga menos de MAX_EDAD segundos, no se
+#   hace ninguna petición; después se revisa con If-None-Match y
+#   If-Modified-Since. Si no hay red se usa la copia que ya tenemos, o el
+#   archivo de respaldo cuando nunca se descargó.
+
+import glob
+import hashlib
+import http.client
+import json
+import logging
+import os
+import shutil
+import time
+import urllib.error
+import urllib.request
+
+from datos import ARCHIVO_CSV, DIRECTORIO_CACHE
+
+
+logger = logging.getLogger(__name__)
+
+# Donde guardamos las descargas y los CSV unidos
+DIRECTORIO = os.path.join(DIRECTORIO_CACHE, 'fuentes')
+# Segundos en que una descarga se usa sin revisar el servidor
+MAX_EDAD = float(os.environ.get('SYNERGY_FUENTE_TTL', 3600))
+# Segundos que esperamos al servidor antes de usar la copia local
+TIEMPO_LIMITE = 10.0
+
+
+def nombre_local(origen):
+    """Nombre del CSV local de un origen, con un hash para no chocar."""
+    nombre = os.path.splitext(os.path.basename(origen.rstrip('/')))[0]
+    huella = hashlib.sha256(origen.encode('utf-8')).hexdigest()[:8]
+    return '{}-{}.csv'.format(nombre or 'datos', huella)
+
+
+def leer_json(ruta):
+    """Contenido de un JSON o None si no existe."""
+    try:
+        with open(ruta) as archivo:
+            return json.load(archivo)
+    except (OSError, ValueError):
+        return None
+
+
+def escribir_json(ruta, contenido):
+    """Escribe un JSON de forma atómica."""
+    temporal = '{}.tmp-{}'.format(ruta, os.getpid())
+    with open(temporal, 'w') as archivo:
+        json.dump(contenido, archivo)
+    os.replace(temporal, ruta)
+
+
+class FuenteArchivo:
+    """Un CSV local, se usa tal cual."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+
+    def ruta_local(self):
+        return self.ruta
+
+    def __repr__(self):
+        return 'FuenteArchivo({!r})'.format(self.ruta)
+
+
+class FuenteDirectorio:
+    """Directorio con el CSV partido en varios archivos.
+
+    Las partes se unen en orden de nombre en un solo CSV con el encabezado de
+    la primera. Si se agregan partes con nombres posteriores, el CSV unido
+    solo crece al final y la ingesta lee únicamente los registros nuevos.
+    """
+
+    def __init__(self, directorio, patron='*.csv', destino=DIRECTORIO):
+        self.directorio = directorio
+        self.patron = patron
+        self.ruta = os.path.join(destino, nombre_local(os.path.abspath(directorio)))
+
+    def partes(self):
+        return sorted(glob.glob(os.path.join(self.directorio, self.patron)))
+
+    def ruta_local(self):
+        partes = self.partes()
+        if not partes:
+            raise FileNotFoundError(
+                'No hay archivos {} en {}'.format(self.patron, self.directorio))
+        # Nombre, tamaño y fecha de cada parte, si no cambian no unimos nada
+        firma = [[os.path.basename(parte), os.path.getsize(parte),
+                  os.stat(parte).st_mtime_ns] for parte in partes]
+        if (os.path.exists(self.ruta)
+                and leer_json(self.ruta + '.json') == {'partes': firma}):
+            return self.ruta
+
+        os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+        temporal = '{}.tmp-{}'.format(self.ruta, os.getpid())
+        with open(temporal, 'wb') as salida:
+            for i, parte in enumerate(partes):
+                with open(parte, 'rb') as entrada:
+                    encabezado = entrada.readline()
+                    if i == 0:
+                        salida.write(encabezado)
+                    shutil.copyfileobj(entrada, salida)
+                    # Si la parte no termina en salto de línea, su último
+                    #   registro se pegaría con el primero de la siguiente
+                    if entrada.tell() > len(encabezado):
+                        entrada.seek(-1, os.SEEK_END)
+                        if entrada.read(1) != b'\n':
+                            salida.write(b'\n')
+        os.replace(temporal, self.ruta)
+        escribir_json(self.ruta + '.json', {'partes': firma})
+        logger.info('Se unieron %d partes de %s', len(partes), self.directorio)
+        return self.ruta
+
+    def __repr__(self):
+        return 'FuenteDirectorio({!r})'.format(self.directorio)
+
+
+class FuenteHTTP:
+    """CSV en una URL con una copia en disco que se revisa por ETag."""
+
+    def __init__(self, url, destino=DIRECTORIO, max_edad=MAX_EDAD,
+                 tiempo_limite=TIEMPO_LIMITE, respaldo=None):
+        self.url = url
+        self.ruta = os.path.join(destino, nombre_local(url))
+        self.max_edad = max_edad
+        self.tiempo_limite = tiempo_limite
+        # CSV local para cuando no hay red ni copia descargada
+        self.respaldo = respaldo
+
+    def ruta_local(self):
+        """Ruta de la copia local, descargándola solo si ya es vieja."""
+        meta = leer_json(self.ruta + '.json')
+        existe = os.path.exists(self.ruta) and meta is not None
+        if existe and time.time() - meta.get('revisado', 0) < self.max_edad:
+            return self.ruta
+        try:
+            self.descargar(meta if existe else None)
+        except (OSError, http.client.HTTPException) as error:
+            if existe:
+                logger.warning('No se pudo revisar %s (%s), usamos la copia '
+                               'de %s', self.url, error, self.ruta)
+                return self.ruta
+            if self.respaldo and os.path.exists(self.respaldo):
+                logger.warning('No se pudo descargar %s (%s), usamos %s',
+                               self.url, error, self.respaldo)
+                return self.respaldo
+            raise
+        return self.ruta
+
+    def descargar(self, meta=None):
+        """Pide el archivo al servidor, regresa True si cambió.
+
+        Con el meta de la copia anterior la petición es condicional y un 304
+        solo renueva la fecha de revisión.
+        """
+        peticion = urllib.request.Request(self.url)
+        if meta is not None:
+            if meta.get('etag'):
+                peticion.add_header('If-None-Match', meta['etag'])
+            if meta.get('ultima_modificacion'):
+                peticion.add_header('If-Modified-Since',
+                                    meta['ultima_modificacion'])
+        try:
+            respuesta = urllib.request.urlopen(peticion,
+                                               timeout=self.tiempo_limite)
+        except urllib.error.HTTPError as error:
+            if error.code == 304 and meta is not None:
+                escribir_json(self.ruta + '.json',
+                              dict(meta, revisado=time.time()))
+                return False
+            raise
+
+        os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+        temporal = '{}.tmp-{}'.format(self.ruta, os.getpid())
+        with respuesta, open(temporal, 'wb') as salida:
+            shutil.copyfileobj(respuesta, salida)
+            encabezados = respuesta.headers
+        # Cambiamos la copia de una vez, nadie lee un archivo a medias
+        os.replace(temporal, self.ruta)
+        escribir_json(self.ruta + '.json', {
+            'url': self.url,
+            'etag': encabezados.get('ETag'),
+            'ultima_modificacion': encabezados.get('Last-Modified'),
+            'revisado': time.time()})
+        logger.info('Se descargó %s', self.url)
+        return True
+
+    def __repr__(self):
+        return 'FuenteHTTP({!r})'.format(self.url)
+
+
+def fuente_de(origen=ARCHIVO_CSV):
+    """Fuente que corresponde a un origen: URL, directorio o archivo.
+
+    Las URL usan el CSV del repositorio como respaldo, así la app arranca
+    aunque no haya red la primera vez.
+    """
+    if origen.startswith(('http://', 'https://')):
+        return FuenteHTTP(origen, respaldo=ARCHIVO_CSV)
+    if os.path.isdir(origen):
+        return FuenteDirectorio(origen)
+    return FuenteArchivo(origen)
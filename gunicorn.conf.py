@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Configuración de gunicorn.
+#
+# Con preload_app el proceso maestro importa la app una sola vez (lee la
+#   tabla, arma el índice y el cubo) y después crea los workers con fork. Los
+#   workers heredan esa memoria y la comparten mientras nadie la escriba. Las
+#   columnas de la tabla además son mmap de la caché, así que su memoria es
+#   la del archivo y no crece con la cantidad de workers.
+
+import gc
+
+
+# Cargamos la app antes de crear los workers
+preload_app = True
+
+
+def when_ready(server):
+    # Los objetos que ya existen pasan a la generación permanente del
+    #   recolector de basura. Si no, cada worker los recorre, escribe en sus
+    #   encabezados y termina con su propia copia de esas páginas
+    gc.freeze()
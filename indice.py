@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Índice en memoria para filtrar los registros sin recorrer el df.
+#
+# Los registros viven en la tabla codificada de tabla.py. Un filtro se
+#   resuelve con un arreglo booleano por código de cada columna (¿el valor
+#   está elegido?) que se indexa con los códigos de los registros, AND entre
+#   columnas. Los registros elegidos se suman directamente a las celdas del
+#   cubo de rutas con np.bincount, así que ningún callback hace un groupby.
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+from agregaciones import LLAVES_CUBO, construir_cubo, combinar_cubos
+from tabla import TablaCodificada
+
+
+# Columnas que se pueden filtrar desde el dashboard
+COLUMNAS_FILTRO = ['year', 'direction', 'transport_mode', 'product',
+                   'company_name']
+
+
+def normalizar_filtros(anios=None, direcciones=None, medios=None,
+                       productos=None, empresas=None):
+    """Convierte los valores de los controles en una tupla ordenada.
+
+    Un filtro vacío (None o lista vacía) significa "todos". El resultado es
+    hashable y no depende del orden en que el usuario eligió los valores.
+    """
+    def valores(lista):
+        return tuple(sorted(lista)) if lista else ()
+
+    return (tuple(anios) if anios else (),
+            valores(direcciones),
+            valores(medios),
+            valores(productos),
+            valores(empresas))
+
+
+class IndiceFiltros:
+    """Filtros y agregaciones sobre la tabla codificada de los registros."""
+
+    def __init__(self, tabla, celdas=None, cubo=None):
+        self.tabla = tabla
+        self.filas = len(tabla)
+        # Último register_id incluido, sirve como versión de los datos
+        self.ultimo_id = tabla.ultimo_id
+        # Posición de cada celda del cubo, se crea al recibir registros nuevos
+        self._posiciones = None
+        self._candado = threading.RLock()
+        # Celda del cubo de rutas a la que pertenece cada registro. Las celdas
+        #   y el cubo de un build precalculado se usan sin volver a agrupar
+        if celdas is None or cubo is None:
+            celdas, cubo = tabla.agrupar(LLAVES_CUBO)
+        self.cubo = cubo
+        self.celdas = celdas.astype(np.int32, copy=False)
+
+    def opciones(self, columna):
+        """Valores disponibles de una columna."""
+        return sorted(self.tabla.diccionarios[columna])
+
+    def agregar(self, nuevos):
+        """Suma registros nuevos a la tabla y al cubo sin recalcularlos."""
+        if len(nuevos) == 0:
+            return
+        # Agrupamos solo los registros nuevos en su propio cubo pequeño
+        delta = construir_cubo(nuevos)
+        grupos = (nuevos.groupby(LLAVES_CUBO, observed=True).ngroup()
+                        .to_numpy())
+
+        with self._candado:
+            if self._posiciones is None:
+                llaves = zip(*(self.cubo[c].tolist() for c in LLAVES_CUBO))
+                self._posiciones = {llave: i for i, llave in enumerate(llaves)}
+
+            # Celda del cubo de cada grupo del delta, las que no existían se
+            #   agregan al final
+            celdas_delta = np.empty(len(delta), dtype=np.int32)
+            faltantes = []
+            for i, llave in enumerate(zip(*(delta[c].tolist()
+                                            for c in LLAVES_CUBO))):
+                posicion = self._posiciones.get(llave)
+                if posicion is None:
+                    posicion = len(self._posiciones)
+                    self._posiciones[llave] = posicion
+                    faltantes.append(i)
+                celdas_delta[i] = posicion
+
+            total = len(self._posiciones)
+            movimientos = np.zeros(total, dtype=np.int64)
+            monto = np.zeros(total, dtype=self.cubo['monto'].dtype)
+            movimientos[:len(self.cubo)] = self.cubo['movimientos'].to_numpy()
+            monto[:len(self.cubo)] = self.cubo['monto'].to_numpy()
+            np.add.at(movimientos, celdas_delta, delta['movimientos'].to_numpy())
+            np.add.at(monto, celdas_delta, delta['monto'].to_numpy())
+
+            cubo = pd.concat([self.cubo[LLAVES_CUBO],
+                              delta.loc[faltantes, LLAVES_CUBO]],
+                             ignore_index=True)
+            cubo['movimientos'] = movimientos
+            cubo['monto'] = monto
+
+            # Cambiamos todo al final, la tabla y el cubo viejos siguen siendo
+            #   válidos para quien ya los tenga
+            self.tabla = self.tabla.extender(TablaCodificada.desde_df(nuevos))
+            self.celdas = np.concatenate([self.celdas, celdas_delta[grupos]])
+            self.cubo = cubo
+            self.filas += len(nuevos)
+            self.ultimo_id = max(self.ultimo_id, self.tabla.ultimo_id)
+
+    def seleccion(self, filtros):
+        """Arreglo booleano con los registros que cumplen los filtros.
+
+        Regresa None cuando no hay ningún filtro activo.
+        """
+        anios, direcciones, medios, productos, empresas = filtros
+        tabla = self.tabla
+        permitidos = {}
+        if anios:
+            desde, hasta = anios
+            diccionario = np.asarray(tabla.diccionarios['year'])
+            permitidos['year'] = (desde <= diccionario) & (diccionario <= hasta)
+        for columna, elegidos in (('direction', direcciones),
+                                  ('transport_mode', medios),
+                                  ('product', productos),
+                                  ('company_name', empresas)):
+            if elegidos:
+                permitidos[columna] = tabla.permitidos(columna, elegidos)
+
+        resultado = None
+        for columna, permitido in permitidos.items():
+            mascara = permitido[tabla.codigos[columna]]
+            if resultado is None:
+                resultado = mascara
+            else:
+                np.logical_and(resultado, mascara, out=resultado)
+        return resultado
+
+    def tabla_filtrada(self, filtros):
+        """Tabla actual y su máscara de los filtros (None si no hay filtros).
+
+        Las dos se toman juntas, así la máscara corresponde a la tabla aunque
+        la ingesta la cambie después.
+        """
+        with self._candado:
+            return self.tabla, self.seleccion(filtros)
+
+    def montos_por(self, columna, filtros):
+        """Monto total de cada valor de una columna con los filtros dados.
+
+        Sirve para agrupaciones que no están en el cubo, como company_name.
+        """
+        with self._candado:
+            mascara = self.seleccion(filtros)
+            codigos = self.tabla.codigos[columna]
+            valores = self.tabla.valores
+            categorias = self.tabla.diccionarios[columna]
+            if mascara is not None:
+                codigos = codigos[mascara]
+                valores = valores[mascara]
+        montos = np.bincount(codigos, weights=valores,
+                             minlength=len(categorias))
+        registros = np.bincount(codigos, minlength=len(categorias))
+        serie = pd.Series(montos.astype(np.int64),
+                          index=pd.Index(categorias, name=columna))
+        return serie.loc[registros > 0]
+
+    def montos_por_dia(self, columna, filtros):
+        """Monto de cada día y cada valor de una columna con los filtros dados.
+
+        Regresa los días con registros (días desde 1970), los valores de la
+        columna que tienen registros y una matriz de días por valores.
+        """
+        with self._candado:
+            mascara = self.seleccion(filtros)
+            codigos = self.tabla.codigos[columna]
+            dias = self.tabla.dias
+            valores = self.tabla.valores
+            categorias = self.tabla.diccionarios[columna]
+            if mascara is not None:
+                codigos = codigos[mascara]
+                dias = dias[mascara]
+                valores = valores[mascara]
+        total = len(categorias)
+        if len(dias) == 0:
+            return (np.empty(0, dtype=np.int64), [],
+                    np.empty((0, 0), dtype=np.int64))
+        # Los días ocupan un rango corto, bincount sobre (día, valor) evita
+        #   ordenar los registros
+        primero = int(dias.min())
+        renglones = int(dias.max()) - primero + 1
+        posiciones = (dias.astype(np.int64) - primero) * total + codigos
+        matriz = np.bincount(posiciones, weights=valores,
+                             minlength=renglones * total).reshape(renglones, total)
+        registros = np.bincount(posiciones, minlength=renglones * total
+                                ).reshape(renglones, total)
+        con_dias = registros.sum(axis=1) > 0
+        con_valores = registros.sum(axis=0) > 0
+        return (np.flatnonzero(con_dias) + primero,
+                [c for c, hay in zip(categorias, con_valores) if hay],
+                matriz[con_dias][:, con_valores].astype(np.int64))
+
+    def cubo_filtrado(self, filtros):
+        """Cubo de rutas calculado solo con los registros filtrados."""
+        with self._candado:
+            mascara = self.seleccion(filtros)
+            if mascara is None:
+                return self.cubo
+            celdas = self.celdas[mascara]
+            valores = self.tabla.valores[mascara]
+            base = self.cubo
+
+        movimientos = np.bincount(celdas, minlength=len(base))
+        monto = np.bincount(celdas, weights=valores, minlength=len(base))
+
+        cubo = base[LLAVES_CUBO].copy()
+        cubo['movimientos'] = movimientos
+        cubo['monto'] = monto.astype(base['monto'].dtype)
+        # Quitamos las celdas que no tienen ningún registro filtrado
+        return cubo.loc[movimientos > 0].reset_index(drop=True)
+
+
+class IndiceCubo:
+    """Filtros sobre el cubo cuando los registros no están en memoria.
+
+    Se usa con la carga por partes: solo existe el cubo, así que los filtros
+    se resuelven sobre sus celdas. company_name no es una llave del cubo, por
+    lo que con este índice no se puede filtrar por empresa.
+    """
+
+    def __init__(self, cubo, ultimo_id):
+        self.cubo = cubo
+        self.ultimo_id = ultimo_id
+        self._candado = threading.Lock()
+
+    def opciones(self, columna):
+        """Valores disponibles de una columna, vacío si no está en el cubo."""
+        if columna not in LLAVES_CUBO:
+            return []
+        return sorted(pd.unique(self.cubo[columna]).tolist())
+
+    def montos_por(self, columna, filtros):
+        """Monto total de cada valor de una llave del cubo."""
+        if columna not in LLAVES_CUBO:
+            raise KeyError('{} no es una llave del cubo'.format(columna))
+        return (self.cubo_filtrado(filtros)
+                    .groupby(columna, observed=True)['monto'].sum())
+
+    def agregar(self, nuevos):
+        """Suma registros nuevos al cubo."""
+        if len(nuevos) == 0:
+            return
+        delta = construir_cubo(nuevos)
+        with self._candado:
+            self.cubo = combinar_cubos([self.cubo, delta])
+            self.ultimo_id = max(self.ultimo_id,
+                                 int(nuevos['register_id'].max()))
+
+    def cubo_filtrado(self, filtros):
+        """Celdas del cubo que cumplen los filtros."""
+        anios, direcciones, medios, productos, _ = filtros
+        cubo = self.cubo
+        mascara = np.ones(len(cubo), dtype=bool)
+        if anios:
+            mascara &= cubo['year'].between(*anios).to_numpy()
+        for columna, valores in (('direction', direcciones),
+                                 ('transport_mode', medios),
+                                 ('product', productos)):
+            if valores:
+                mascara &= cubo[columna].isin(valores).to_numpy()
+        if mascara.all():
+            return cubo
+        return cubo.loc[mascara].reset_index(drop=True)
+
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Ingesta continua de registros nuevos del CSV.
+#
+# El CSV crece durante el día con registros nuevos al final. En lugar de
+#   reiniciar el proceso para leerlo todo de nuevo, seguimos el archivo desde
+#   el último byte leído, parseamos solo las líneas completas nuevas con un
+#   register_id mayor al último que ya tenemos y las sumamos al índice.
+
+import io
+import logging
+import os
+import threading
+
+import pandas as pd
+
+from datos import leer_csv
+
+
+logger = logging.getLogger(__name__)
+
+
+def inicio_de_linea(ruta, posicion, tamano_bloque=1 << 16):
+    """Primer byte de la línea donde cae posicion.
+
+    Si el archivo se midió con una línea a medio escribir, la volvemos a leer
+    completa; el filtro por register_id descarta lo que ya se había cargado.
+    """
+    while posicion > 0:
+        inicio = max(posicion - tamano_bloque, 0)
+        with open(ruta, 'rb') as archivo:
+            archivo.seek(inicio)
+            bloque = archivo.read(posicion - inicio)
+        salto = bloque.rfind(b'\n')
+        if salto >= 0:
+            return inicio + salto + 1
+        posicion = inicio
+    return 0
+
+
+class SeguidorCSV:
+    """Lee solo los registros que se agregan al final de un CSV."""
+
+    def __init__(self, ruta, ultimo_id, posicion=None):
+        self.ruta = ruta
+        self.ultimo_id = ultimo_id
+        # posicion es el tamaño del archivo cuando se cargó; sin ella
+        #   empezamos al final del archivo actual
+        self.posicion = (os.path.getsize(ruta) if posicion is None
+                         else inicio_de_linea(ruta, posicion))
+        with open(ruta, encoding='utf-8-sig') as archivo:
+            self.columnas = archivo.readline().strip().split(',')
+
+    def leer_nuevos(self):
+        """Regresa un df con los registros nuevos desde la última lectura."""
+        tamano = os.path.getsize(self.ruta)
+        if tamano < self.posicion:
+            # El archivo se reemplazó por uno más corto, lo leemos completo
+            #   y nos quedamos solo con los register_id nuevos
+            self.posicion = 0
+        if tamano == self.posicion:
+            return None
+
+        with open(self.ruta, 'rb') as archivo:
+            archivo.seek(self.posicion)
+            bloque = archivo.read(tamano - self.posicion)
+        # Solo procesamos líneas completas, la última puede estar a medias
+        fin = bloque.rfind(b'\n') + 1
+        if fin == 0:
+            return None
+        bloque = bloque[:fin]
+        if self.posicion == 0:
+            # Quitamos el encabezado
+            bloque = bloque[bloque.find(b'\n') + 1:]
+        self.posicion += fin
+        if not bloque.strip():
+            return None
+
+        nuevos = leer_csv(io.BytesIO(bloque), header=None,
+                          names=self.columnas)
+        nuevos = nuevos.loc[nuevos['register_id'] > self.ultimo_id]
+        if len(nuevos) == 0:
+            return None
+        self.ultimo_id = int(nuevos['register_id'].max())
+        return nuevos.reset_index(drop=True)
+
+
+class IngestaContinua(threading.Thread):
+    """Hilo que revisa el CSV cada cierto tiempo y actualiza el índice.
+
+    Con una fuente de fuentes.py, antes de cada revisión se le pide su copia
+    local, así una URL o un directorio de partes también se siguen.
+    """
+
+    def __init__(self, seguidor, indice, intervalo=5.0, fuente=None):
+        super().__init__(name='ingesta-csv', daemon=True)
+        self.seguidor = seguidor
+        self.indice = indice
+        self.intervalo = intervalo
+        self.fuente = fuente
+        self._detener = threading.Event()
+
+    def revisar(self):
+        """Agrega los registros nuevos, regresa cuántos se agregaron."""
+        if self.fuente is not None:
+            ruta = self.fuente.ruta_local()
+            if ruta != self.seguidor.ruta:
+                # Otro archivo (p. ej. la descarga que reemplaza al
+                #   respaldo), lo leemos completo filtrando por register_id
+                self.seguidor.ruta = ruta
+                self.seguidor.posicion = 0
+        nuevos = self.seguidor.leer_nuevos()
+        if nuevos is None:
+            return 0
+        self.indice.agregar(nuevos)
+        return len(nuevos)
+
+    def run(self):
+        while not self._detener.wait(self.intervalo):
+            try:
+                agregados = self.revisar()
+            except (OSError, ValueError, pd.errors.ParserError):
+                # Un renglón mal formado no debe detener la ingesta
+                logger.exception('No se pudieron leer los registros nuevos')
+                continue
+            if agregados:
+                logger.info('Se agregaron %d registros, último register_id %d',
+                            agregados, self.indice.ultimo_id)
+
+    def detener(self):
+        self._detener.set()
+
+
+def iniciar(ruta, indice, intervalo=5.0, fuente=None, posicion=None):
+    """Crea e inicia el hilo de ingesta para un CSV ya cargado en el índice.
+
+    posicion es el tamaño que tenía el CSV al cargarlo, así los registros que
+    llegaron entre la carga y el inicio del hilo también se leen.
+    """
+    ingesta = IngestaContinua(SeguidorCSV(ruta, indice.ultimo_id, posicion),
+                              indice, intervalo, fuente)
+    ingesta.start()
+    return ingesta
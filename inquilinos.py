@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Varios conjuntos de datos (inquilinos) en un solo servidor.
+#
+# Cada archivo <nombre>.csv (o directorio <nombre>/ con el CSV en partes) del
+#   directorio de inquilinos es un conjunto de datos con el esquema de
+#   synergy_logistics_database.csv. Su dashboard completo vive en
+#   /inquilinos/<nombre>/, o en / si la petición lleva el encabezado
+#   X-Synergy-Inquilino: <nombre> (p. ej. puesto por el proxy según el
+#   dominio). Las peticiones sin inquilino siguen a la app principal.
+#
+# Los datos de un inquilino se cargan con su primera petición y solo como
+#   cubo de rutas, igual que con SYNERGY_PARTES: nunca se tiene el DataFrame
+#   de sus registros en memoria (con SYNERGY_ALMACEN, cada inquilino tiene
+#   su archivo de SQLite). El cubo se guarda en disco, así que cuando
+#   la memoria de los inquilinos cargados pasa del límite se descartan los
+#   que llevan más tiempo sin usarse y la siguiente visita lee su cubo de
+#   disco en lugar de recorrer el CSV. La memoria de cada inquilino es su
+#   cubo y sus cachés, medidos de nuevo en cada revisión, más una
+#   estimación fija de su app de Dash.
+
+import collections
+import os
+import re
+import threading
+import time
+
+from werkzeug.exceptions import NotFound
+from werkzeug.utils import redirect
+
+from datos import DIRECTORIO_CACHE
+from metricas import tramo
+
+
+# Ruta bajo la que vive el dashboard de cada inquilino
+PREFIJO = '/inquilinos/'
+# Encabezado con el que un proxy elige el inquilino
+ENCABEZADO = 'X-Synergy-Inquilino'
+# Nombres de inquilino permitidos, también son nombres de archivo
+NOMBRE = re.compile(r'^[A-Za-z0-9_-]+$')
+# Registros por parte al leer el CSV de un inquilino
+PARTES = 1000000
+# Máximo de gráficas en la caché de cada inquilino
+CACHE_ENTRADAS = 32
+# Bytes aproximados de cada app de Dash de un inquilino (layout, gráficas
+#   iniciales y callbacks), medidos con el CSV del repositorio. Es lo único
+#   que no se mide: el cubo y las cachés se miden en cada revisión
+MEMORIA_APP = 512 * 1024
+# Segundos entre revisiones de la memoria cuando no se carga ningún inquilino,
+#   las cachés y la ingesta la hacen crecer entre cargas
+INTERVALO_MEMORIA = 5.0
+
+
+def ruta_de(directorio, nombre):
+    """CSV o directorio de partes de un inquilino, None si no existe."""
+    if not NOMBRE.match(nombre):
+        return None
+    for ruta in (os.path.join(directorio, nombre + '.csv'),
+                 os.path.join(directorio, nombre)):
+        if os.path.exists(ruta):
+            return ruta
+    return None
+
+
+def config_de(config, nombre, ruta):
+    """Configuración de la app de un inquilino a partir de la principal."""
+    cache_figuras = config['cache_figuras']
+    return dict(
+        config,
+        fuente=ruta,
+        # Solo el cubo de rutas en memoria, guardado en disco por inquilino
+        partes=config['partes'] or PARTES,
+        cache_cubo=os.path.join(DIRECTORIO_CACHE, 'inquilinos', nombre),
+        # Con almacén, cada inquilino tiene su propio archivo de SQLite
+        almacen=(os.path.join(DIRECTORIO_CACHE, 'inquilinos', nombre + '.sqlite')
+                 if config['almacen'] else None),
+        cache_entradas=min(config['cache_entradas'], CACHE_ENTRADAS),
+        # Las llaves de la caché compartida no incluyen el inquilino
+        cache_figuras=(os.path.join(cache_figuras, 'inquilinos', nombre)
+                       if cache_figuras else None),
+        precalculado=False,
+        whitenoise=False,
+        inquilinos=None)
+
+
+class Inquilino:
+    """Datos de un inquilino y sus apps de Dash, una por prefijo."""
+
+    def __init__(self, nombre, estado, crear_app):
+        self.nombre = nombre
+        self.estado = estado
+        self._crear_app = crear_app
+        self._apps = {}
+        self._candado = threading.Lock()
+
+    def app(self, prefijo):
+        """Servidor de Flask del dashboard en ese prefijo."""
+        if prefijo not in self._apps:
+            with self._candado:
+                if prefijo not in self._apps:
+                    self._apps[prefijo] = self._crear_app(
+                        {'prefijo': prefijo}, self.estado, registro=None).server
+        return self._apps[prefijo]
+
+    @property
+    def memoria(self):
+        """Bytes aproximados del cubo, las cachés y las apps del inquilino."""
+        return self.estado.memoria() + MEMORIA_APP * max(len(self._apps), 1)
+
+
+class Inquilinos:
+    """Middleware WSGI que manda cada petición al dashboard de su inquilino.
+
+    app es la app principal, config la de fabrica.configuracion() y
+    crear_estado y crear_app las de fabrica.py. Los inquilinos se guardan en
+    orden de uso, del menos al más reciente.
+    """
+
+    def __init__(self, app, config, crear_estado, crear_app):
+        self.app = app
+        self.config = config
+        self.directorio = config['inquilinos']
+        self.memoria_maxima = config['inquilinos_memoria'] * 1024 * 1024
+        self.crear_estado = crear_estado
+        self.crear_app = crear_app
+        self.cargados = collections.OrderedDict()
+        self.descartes = 0
+        self._revisada = time.monotonic()
+        self._candado = threading.Lock()
+        # Uno por inquilino, para no cargar dos veces el mismo
+        self._cargando = collections.defaultdict(threading.Lock)
+
+    def elegir(self, environ):
+        """Nombre del inquilino y prefijo de la petición, o (None, None)."""
+        encabezado = environ.get('HTTP_' + ENCABEZADO.upper().replace('-', '_'))
+        if encabezado:
+            return encabezado.strip(), '/'
+        ruta = environ.get('PATH_INFO', '')
+        if ruta.startswith(PREFIJO):
+            nombre = ruta[len(PREFIJO):].split('/', 1)[0]
+            return nombre, PREFIJO + nombre + '/'
+        return None, None
+
+    def obtener(self, nombre, ruta):
+        """Inquilino cargado, lo carga si hace falta y lo marca como reciente."""
+        with self._candado:
+            if nombre in self.cargados:
+                self.cargados.move_to_end(nombre)
+                if time.monotonic() - self._revisada > INTERVALO_MEMORIA:
+                    self.descartar()
+                return self.cargados[nombre]
+        with self._cargando[nombre]:
+            with self._candado:
+                if nombre in self.cargados:
+                    return self.cargados[nombre]
+            with tramo('inquilino'):
+                inquilino = Inquilino(
+                    nombre,
+                    self.crear_estado(config_de(self.config, nombre, ruta)),
+                    self.crear_app)
+            with self._candado:
+                self.cargados[nombre] = inquilino
+                self.descartar()
+        return inquilino
+
+    def descartar(self):
+        """Quita los inquilinos menos usados hasta caber en la memoria.
+
+        El más reciente siempre se queda aunque no quepa solo. Se llama con
+        el candado tomado.
+        """
+        self._revisada = time.monotonic()
+        while len(self.cargados) > 1 and self.memoria() > self.memoria_maxima:
+            _, inquilino = self.cargados.popitem(last=False)
+            # Las peticiones en curso terminan con sus datos, las siguientes
+            #   lo vuelven a cargar desde el cubo en disco
+            inquilino.estado.detener()
+            self.descartes += 1
+
+    def memoria(self):
+        """Bytes aproximados de los inquilinos cargados."""
+        return sum(inquilino.memoria for inquilino in self.cargados.values())
+
+    def medidas(self, registro):
+        """Agrega las medidas de los inquilinos a un metricas.Registro."""
+        registro.medida('synergy_inquilinos_cargados',
+                        'Inquilinos con sus datos en memoria.',
+                        lambda: len(self.cargados))
+        registro.medida('synergy_inquilinos_memoria_bytes',
+                        'Bytes aproximados de los inquilinos cargados.',
+                        self.memoria)
+        registro.medida('synergy_inquilinos_descartes_total',
+                        'Inquilinos descartados para liberar memoria.',
+                        lambda: self.descartes, tipo='counter')
+
+    def __call__(self, environ, start_response):
+        nombre, prefijo = self.elegir(environ)
+        if nombre is None:
+            return self.app(environ, start_response)
+        ruta = ruta_de(self.directorio, nombre)
+        if ruta is None:
+            return NotFound('No existe el inquilino ' + nombre)(
+                environ, start_response)
+        if prefijo != '/' and environ.get('PATH_INFO') == prefijo[:-1]:
+            return redirect(prefijo)(environ, start_response)
+        return self.obtener(nombre, ruta).app(prefijo)(environ, start_response)
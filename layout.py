@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Layout del dashboard.
+#
+# construir(estado) arma el layout con los datos de una app de fabrica.py:
+#   las gráficas iniciales (vacías en modo perezoso, del build precalculado o
+#   calculadas), los filtros con los valores del índice y las secciones en
+#   pestañas o una debajo de otra.
+
+from dash import html, dcc, dash_table
+
+from indice import IndiceFiltros
+# Tabla de registros paginada en el servidor
+import registros
+from figuras import colors
+from matriz import VENTANA
+
+
+def construir(estado):
+    """Layout de la app con las gráficas iniciales y los filtros del índice."""
+    figuras_iniciales = estado.figuras_iniciales()
+    indice = estado.instantanea.indice
+    config = estado.config
+    # Revisamos la versión de los datos con la ingesta o la recarga
+    intervalo = config['refresco'] or config['ingesta']
+
+    # Rutas importaciones y exportaciones
+    heatmap_count = figuras_iniciales['heatmap_count']
+    # Párrafo con texto explicando lá gráfica y los resultados
+    par_count = html.P(children='''
+        El siguiente gráfico muestra la distribución de las importaciones y
+        exportaciones medido por la cantidad de operaciones en cada ruta.''',
+                       style={'width': '60%', 'margin': '0 auto', 'textAlign': 'center', 'color': colors['text']})
+
+    # Tabla de exportaciones e importaciones por monto y no cantidad
+    heatmap_sum = figuras_iniciales['heatmap_sum']
+    # Párrafo con texto explicando lá gráfica y los resultados
+    par_sum = html.P(children='''
+        En este otro gráfico podemos ver las rutas de importación y exportación
+        entre países con su monto total.''',
+                       style={'width': '60%', 'margin': '0 auto', 'textAlign': 'center', 'color': colors['text']})
+    # Párrafo con texto explicando lá gráfica y los resultados
+    par_rutas_conc = html.P(children='''
+        Cómo podemos ver, no hay relación entre las rutas que más operaciones
+        tienen y las que más monto manejan. Por lo que no se recomienda implementar
+        una estrategia basada en la cantidad de importaciones y exportaciones''',
+                       style={'width': '60%', 'margin': '0 auto', 'textAlign': 'center', 'color': colors['text']})
+
+    # Medios de transporte más importantes
+    plot_medios_transporte = figuras_iniciales['plot_medios_transporte']
+    # Párrafo con texto explicando lá gráfica y los resultados
+    par_transportes = html.P(children='''
+         Los tres medios de transportes más importantes para Synergy Logistics son
+         Air, Rail y Sea. Una estrategia recomendada sería crear un plan para
+         sustituir Road por los otros medios de transportes.''',
+                             style={'margin': '0', 'textAlign': 'center', 'color': colors['text']})
+
+    # 80% del valor de exportaciones y importaciones
+    bar_origin_100 = figuras_iniciales['bar_origin_100']
+    bar_origin_80 = figuras_iniciales['bar_origin_80']
+    # Párrafos con texto explicando lá gráfica y los resultados
+    par_origin = html.P(children='''
+        En las primera gráfica, tenemos los países de origen con la cantidad de
+        rutas que pertenecen a estos. En la segunda gráfica tenemos los países
+        que generan el 80% del monto con su respectiva cantidad de rutas.''',
+                       style={'width': '60%', 'margin': '0 auto', 'textAlign': 'center', 'color': colors['text']})
+    par_origin_conc = html.P(children='''Vemos que reducimos 7 países si aplicamos
+        esta estrategia. Si consideramos que tener instalaciones en cada país tiene
+        costos de operación, si tenemos menos países dónde no se genera tanto valor
+        entonces es una buena estrategia para ahorrar costos. Así, nos podemos
+        enfocar en los países que más valor tienen sin gastar tanto.''',
+                       style={'width': '60%', 'margin': '0 auto', 'textAlign': 'center', 'color': colors['text']})
+
+    # Mostramos los países descartados
+    par_paises_descartados = html.P(id='par_paises_descartados',
+                                    children=figuras_iniciales['par_paises_descartados'],
+                                    style={'width': '60%', 'margin': '0 auto', 'textAlign': 'center', 'color': colors['text']})
+
+    # Filtros
+    anios = estado.anios
+    # Estilo de las etiquetas y de los menús de los filtros
+    estilo_etiqueta = {'color': colors['text'], 'marginTop': '10px'}
+    estilo_menu = {'color': colors['background']}
+    filtros = html.Div(children=[
+                html.Label('Años', style=estilo_etiqueta),
+                dcc.RangeSlider(id='filtro_anios',
+                                min=anios[0],
+                                max=anios[-1],
+                                step=1,
+                                marks={anio: {'label': str(anio), 'style': {'color': colors['text']}}
+                                       for anio in anios},
+                                value=[anios[0], anios[-1]]),
+                html.Label('Dirección', style=estilo_etiqueta),
+                dcc.Checklist(id='filtro_direccion',
+                              options=[{'label': d, 'value': d}
+                                       for d in indice.opciones('direction')],
+                              value=[],
+                              inline=True,
+                              style={'color': colors['text']}),
+                html.Label('Medio de transporte', style=estilo_etiqueta),
+                dcc.Dropdown(id='filtro_medio',
+                             options=[{'label': m, 'value': m}
+                                      for m in indice.opciones('transport_mode')],
+                             multi=True,
+                             placeholder='Todos',
+                             style=estilo_menu),
+                html.Label('Producto', style=estilo_etiqueta),
+                dcc.Dropdown(id='filtro_producto',
+                             options=[{'label': p, 'value': p}
+                                      for p in indice.opciones('product')],
+                             multi=True,
+                             placeholder='Todos',
+                             style=estilo_menu),
+                html.Label('Empresa', style=estilo_etiqueta),
+                dcc.Dropdown(id='filtro_empresa',
+                             options=[{'label': e, 'value': e}
+                                      for e in indice.opciones('company_name')],
+                             multi=True,
+                             placeholder='Todas',
+                             # Sin registros en memoria no hay filtro por empresa
+                             disabled=not indice.opciones('company_name'),
+                             style=estilo_menu)],
+                       style={'width': '60%', 'margin': '0 auto'})
+
+    # Contenido de cada sección del dashboard
+    seccion_rutas = [
+        # Con más de VENTANA países los heatmaps muestran una ventana, estos
+        #   campos eligen desde qué origen y qué destino (ordenados de mayor a
+        #   menor valor) empieza
+        html.Div(children=[
+            html.Label('Desde el origen número', style=estilo_etiqueta),
+            dcc.Input(id='ventana_origen', type='number', min=1,
+                      step=VENTANA, value=1, debounce=True),
+            html.Label('Desde el destino número', style=estilo_etiqueta),
+            dcc.Input(id='ventana_destino', type='number', min=1,
+                      step=VENTANA, value=1, debounce=True)],
+                 style={'width': '60%', 'margin': '0 auto'}),
+
+        par_count,
+
+        dcc.Graph(
+            id='heatmap_count',
+            figure=heatmap_count,
+            style={'height': '90vh'}
+        ),
+
+        par_sum,
+
+        dcc.Graph(
+            id='heatmap_sum',
+            figure=heatmap_sum,
+            style={'height': '100vh'}
+        ),
+
+        par_rutas_conc]
+
+    seccion_transporte = [
+        html.Div(
+            children=[
+                html.Div(children=[
+                            html.Div(par_transportes)],
+                         style={'margin': 'auto',
+                                'height': '100%',
+                                'display': 'grid',
+                                'padding': '20%',
+                                'grid-template-rows': '2fr 3fr'}),
+                dcc.Graph(
+                    id='plot_medios_transporte',
+                    figure=plot_medios_transporte,
+                    style={'height': '100%', 'margin': 'auto'})],
+            style={'height': '80vh',
+                    'display': 'grid',
+                    'width': '80%',
+                    'margin': '0 auto',
+                    # 'justify-content': 'center',
+                    # 'align-items': 'center',
+                    # 'gap': '4px',
+                    'grid-template-columns': '2fr 3fr'})]
+
+    seccion_pareto = [
+        par_origin,
+
+        # Porcentaje del valor total para el análisis de Pareto
+        html.Div(children=[
+            html.Label('Porcentaje del valor', style=estilo_etiqueta),
+            dcc.Slider(id='filtro_umbral',
+                       min=0.5,
+                       max=0.95,
+                       step=0.05,
+                       marks={u / 100: {'label': '{}%'.format(u), 'style': {'color': colors['text']}}
+                              for u in range(50, 100, 5)},
+                       value=0.8)],
+                 style={'width': '60%', 'margin': '0 auto'}),
+
+        html.Div(children=[
+            dcc.Graph(
+                id='bar_origin_100',
+                figure=bar_origin_100,
+                style={'height': '90vh', 'width': '90vh', 'margin': '0 auto'}
+            ),
+            dcc.Graph(
+                id='bar_origin_80',
+                figure=bar_origin_80,
+                style={'height': '90vh', 'width': '90vh', 'margin': '0 auto'}
+            )],
+            style={'display': 'grid',
+                    'width': '100%',
+                    'margin': '0 auto',
+                    'grid-template-columns': '1fr 1fr'}),
+
+        par_paises_descartados,
+        par_origin_conc]
+
+    # Explorador de los registros. La tabla solo recibe la página visible, el
+    #   orden y los filtros se resuelven en el servidor
+    seccion_registros = [
+        html.P(id='total_registros', style={'textAlign': 'center',
+                                            'color': colors['text']}),
+        html.Div(children=[
+            dash_table.DataTable(
+                id='tabla_registros',
+                columns=[{'name': nombre, 'id': columna, 'type': tipo}
+                         for columna, nombre, tipo in registros.COLUMNAS],
+                page_current=0,
+                page_size=registros.TAMANO_PAGINA,
+                page_action='custom',
+                sort_action='custom',
+                sort_mode='multi',
+                sort_by=[],
+                filter_action='custom',
+                filter_query='',
+                style_header={
+                    'backgroundColor': 'rgb(30, 30, 30)',
+                    'color': 'white'
+                },
+                style_filter={
+                    'backgroundColor': 'rgb(40, 40, 40)',
+                    'color': 'white'
+                },
+                style_data={
+                    'backgroundColor': 'rgb(50, 50, 50)',
+                    'color': 'white'
+                })],
+            style={'width': '90%', 'margin': '0 auto'})]
+
+    # Id, título y contenido de cada sección, en el orden de la página
+    contenido_secciones = [
+        ('rutas', 'Rutas más importantes', seccion_rutas),
+        ('transporte', 'Medios de transporte', seccion_transporte),
+        ('pareto', 'Rutas del 80% del monto generado', seccion_pareto),
+    ]
+    # Sin los registros en memoria (solo el cubo) no hay nada que explorar
+    if isinstance(indice, IndiceFiltros):
+        contenido_secciones.append(('registros', 'Registros', seccion_registros))
+    if config['perezoso']:
+        # Solo la pestaña seleccionada se muestra y construye sus gráficas
+        estilo_pestana = {'backgroundColor': colors['background'], 'color': colors['text']}
+        estilo_pestana_activa = {'backgroundColor': '#222222', 'color': colors['text'],
+                                 'borderTop': '2px solid #45a1ff'}
+        secciones = [
+            html.Hr(),
+            dcc.Tabs(id='secciones',
+                     value=contenido_secciones[0][0],
+                     children=[dcc.Tab(label=titulo,
+                                       value=seccion,
+                                       children=hijos,
+                                       style=estilo_pestana,
+                                       selected_style=estilo_pestana_activa)
+                               for seccion, titulo, hijos in contenido_secciones])]
+    else:
+        # Todas las secciones una debajo de la otra
+        secciones = []
+        for seccion, titulo, hijos in contenido_secciones:
+            secciones += [html.Hr(),
+                          html.H2(children=titulo, style={
+                                  'textAlign': 'center',
+                                  'color': colors['text']
+                              })]
+            secciones += hijos
+
+    # Declaramos el layout
+    return html.Div(
+        style={'backgroundColor': colors['background']},
+        children=[
+            html.H1(children='Synergy Logistics', style={
+                    'textAlign': 'center',
+                    'color': colors['text']
+                }),
+
+            html.Div(children='''
+                Análisis de datos de importación y exportación para el diseño de
+                una nueva estrategía en el año 2021
+            ''', style={
+                    'textAlign': 'center',
+                    'color': colors['text']
+                }),
+
+            filtros,
+
+            # Versión de los datos que muestra la página, cambia cuando la
+            #   ingesta agrega registros nuevos o la recarga cambia los datos
+            dcc.Store(id='version_datos', data=estado.instantanea.version()),
+            # Ancho en pixeles de la gráfica de medios de transporte
+            dcc.Store(id='ancho_transportes'),
+            dcc.Interval(id='intervalo_datos',
+                         interval=max(intervalo, 1) * 1000,
+                         disabled=not intervalo),
+
+            *secciones,
+
+            html.Div(style={'height': '40px'}),
+
+            html.Footer(children=[
+                        html.P(children=[
+                                'Creado por ',
+                                html.A(children='luis-barrera', href='https://github.com/luis-barrera'),
+                                ', repositorio del proyecto en ',
+                                html.A(children='GitHub', href='https://github.com/luis-barrera/proyecto2-dash'),
+                               ])],
+                        style={'display': 'flex',
+                                'justify-content': 'center',
+                                'padding': '5px',
+                                'background-color': '#45a1ff',
+                                'color': '#111'}),
+    ])
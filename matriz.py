@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Matriz origen-destino dispersa.
+#
+# Cada nodo (país, puerto, ciudad) tiene un id entero, el mismo como origen y
+#   como destino. Solo guardamos los pares que tienen movimientos, en formato
+#   CSR: para cada origen, el rango de sus celdas dentro de los arreglos de
+#   destinos y valores. Con miles de nodos la matriz densa tendría millones
+#   de celdas casi todas en cero; aquí la memoria depende de la cantidad de
+#   rutas. Para graficar se ordenan los nodos por valor y solo la ventana
+#   visible se convierte en un mosaico denso.
+
+import numpy as np
+import pandas as pd
+
+import agregaciones
+
+
+# Nodos por eje que se muestran en un heatmap
+VENTANA = 40
+# Valores que guarda la matriz por cada ruta
+VALORES = ['movimientos', 'monto']
+
+
+def rangos(inicios, largos):
+    """Posiciones de varios rangos [inicio, inicio + largo) concatenados."""
+    largos = np.asarray(largos, dtype=np.int64)
+    if len(largos) == 0:
+        return np.empty(0, dtype=np.int64)
+    desplazamientos = (np.asarray(inicios, dtype=np.int64)
+                       - np.r_[0, np.cumsum(largos)[:-1]])
+    return np.repeat(desplazamientos, largos) + np.arange(largos.sum())
+
+
+class MatrizOD:
+    """Movimientos y monto por ruta en formato CSR con ids de nodo enteros."""
+
+    def __init__(self, nodos, indptr, destinos, valores):
+        # Nombre de cada id de nodo
+        self.nodos = list(nodos)
+        # Las celdas del origen i están en indptr[i]:indptr[i + 1], ordenadas
+        #   por destino
+        self.indptr = indptr
+        self.destinos = destinos
+        # Arreglo de cada valor de VALORES, alineado con destinos
+        self.valores = valores
+
+    @classmethod
+    def desde_coo(cls, nodos, origenes, destinos, valores):
+        """Arma la matriz a partir de tripletas (origen, destino, valores).
+
+        Los pares repetidos se suman.
+        """
+        n = len(nodos)
+        llaves = (np.asarray(origenes, dtype=np.int64) * n
+                  + np.asarray(destinos, dtype=np.int64))
+        orden = np.argsort(llaves, kind='stable')
+        llaves = llaves[orden]
+        # Primera posición de cada par distinto
+        primeros = np.flatnonzero(np.r_[True, llaves[1:] != llaves[:-1]])
+        primeros = primeros[primeros < len(llaves)]
+        sumados = {}
+        for nombre in VALORES:
+            columna = np.asarray(valores[nombre], dtype=np.int64)[orden]
+            sumados[nombre] = (np.add.reduceat(columna, primeros)
+                               if len(primeros) else columna)
+        llaves = llaves[primeros]
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(llaves // n, minlength=n), out=indptr[1:])
+        return cls(nodos, indptr, (llaves % n).astype(np.int32), sumados)
+
+    @classmethod
+    def desde_cubo(cls, cubo):
+        """Matriz de las rutas de un cubo, sin importar dirección ni año."""
+        celdas = agregaciones.rebanar(cubo, ['origin', 'destination'])
+        extremos = pd.concat([celdas['origin'].astype(str),
+                              celdas['destination'].astype(str)],
+                             ignore_index=True)
+        codigos, nodos = pd.factorize(extremos, sort=True)
+        return cls.desde_coo(list(nodos), codigos[:len(celdas)],
+                             codigos[len(celdas):],
+                             {nombre: celdas[nombre].to_numpy()
+                              for nombre in VALORES})
+
+    def __len__(self):
+        """Cantidad de rutas guardadas."""
+        return len(self.destinos)
+
+    @property
+    def tamano(self):
+        return len(self.nodos)
+
+    def origenes(self):
+        """Id de origen de cada celda guardada (el renglón en formato COO)."""
+        return np.repeat(np.arange(self.tamano), np.diff(self.indptr))
+
+    def _elegir(self, posiciones):
+        """Matriz con solo las celdas de esas posiciones, en el mismo orden."""
+        origenes = self.origenes()[posiciones]
+        indptr = np.zeros(self.tamano + 1, dtype=np.int64)
+        np.cumsum(np.bincount(origenes, minlength=self.tamano),
+                  out=indptr[1:])
+        return MatrizOD(self.nodos, indptr, self.destinos[posiciones],
+                        {nombre: valores[posiciones]
+                         for nombre, valores in self.valores.items()})
+
+    def renglones(self, ids):
+        """Matriz con solo las rutas que salen de esos orígenes."""
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        return self._elegir(rangos(self.indptr[ids],
+                                   self.indptr[ids + 1] - self.indptr[ids]))
+
+    def columnas(self, ids):
+        """Matriz con solo las rutas que llegan a esos destinos."""
+        elegidos = np.zeros(self.tamano, dtype=bool)
+        elegidos[np.asarray(ids, dtype=np.int64)] = True
+        return self._elegir(np.flatnonzero(elegidos[self.destinos]))
+
+    def ids(self, nombres):
+        """Ids de nodo de una lista de nombres, los desconocidos se omiten."""
+        posiciones = {nombre: i for i, nombre in enumerate(self.nodos)}
+        return np.array([posiciones[nombre] for nombre in nombres
+                         if nombre in posiciones], dtype=np.int64)
+
+    def totales(self, valor='monto', eje='origen'):
+        """Suma de un valor por nodo como origen o como destino."""
+        nodos = self.origenes() if eje == 'origen' else self.destinos
+        return np.bincount(nodos, weights=self.valores[valor],
+                           minlength=self.tamano).astype(np.int64)
+
+    def orden(self, valor='monto', eje='origen'):
+        """Ids de los nodos con rutas en ese eje, del mayor al menor valor."""
+        totales = self.totales(valor, eje)
+        nodos = self.origenes() if eje == 'origen' else self.destinos
+        cuentas = np.bincount(nodos, minlength=self.tamano)
+        ids = np.flatnonzero(cuentas)
+        # A igual valor, en orden de nombre
+        return ids[np.lexsort((ids, -totales[ids]))]
+
+    def top(self, n=10, valor='monto'):
+        """Las n rutas con mayor valor, de mayor a menor."""
+        valores = self.valores[valor]
+        n = min(n, len(valores))
+        if n == 0:
+            elegidas = np.empty(0, dtype=np.int64)
+        else:
+            elegidas = np.argpartition(-valores, n - 1)[:n]
+        elegidas = elegidas[np.lexsort((elegidas, -valores[elegidas]))]
+        nodos = np.asarray(self.nodos, dtype=object)
+        rutas = pd.DataFrame({'origin': nodos[self.origenes()[elegidas]],
+                              'destination': nodos[self.destinos[elegidas]]})
+        for nombre, columna in self.valores.items():
+            rutas[nombre] = columna[elegidas]
+        return rutas
+
+    def mosaico(self, origenes, destinos, valor='movimientos'):
+        """Matriz densa de los orígenes (renglones) y destinos (columnas).
+
+        Solo se recorren las celdas de esos orígenes, el resultado mide
+        len(origenes) x len(destinos) sin importar el tamaño de la matriz.
+        """
+        origenes = np.asarray(origenes, dtype=np.int64)
+        columna = np.full(self.tamano, -1, dtype=np.int64)
+        columna[np.asarray(destinos, dtype=np.int64)] = np.arange(len(destinos))
+        largos = self.indptr[origenes + 1] - self.indptr[origenes]
+        posiciones = rangos(self.indptr[origenes], largos)
+        renglones = np.repeat(np.arange(len(origenes)), largos)
+        columnas = columna[self.destinos[posiciones]]
+        visibles = columnas >= 0
+        densa = np.zeros((len(origenes), len(destinos)), dtype=np.int64)
+        densa[renglones[visibles], columnas[visibles]] = (
+            self.valores[valor][posiciones[visibles]])
+        return densa
+
+    def ventana(self, valor='movimientos', renglones=VENTANA,
+                columnas=VENTANA, inicio_renglon=0, inicio_columna=0):
+        """Nombres de orígenes, de destinos y mosaico de la ventana visible.
+
+        Los nodos se ordenan por su total del valor, así la ventana inicial
+        muestra las rutas más importantes.
+        """
+        origenes = self.orden(valor, 'origen')[
+                            inicio_renglon:inicio_renglon + renglones]
+        destinos = self.orden(valor, 'destino')[
+                            inicio_columna:inicio_columna + columnas]
+        return ([self.nodos[i] for i in origenes],
+                [self.nodos[i] for i in destinos],
+                self.mosaico(origenes, destinos, valor))
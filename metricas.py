@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Métricas del servidor en formato de Prometheus.
+#
+# Medimos con histogramas cuánto tarda cada etapa de preparación de los datos
+#   (tramo) y cada petición al servidor, separando los callbacks de Dash por
+#   sus salidas. /metrics expone esos histogramas junto con los aciertos de
+#   las cachés y la memoria del proceso. Con SYNERGY_PERFIL=<directorio>, una
+#   petición con el encabezado X-Perfil: 1 se perfila con cProfile y el
+#   resultado se guarda en ese directorio. Cada worker de gunicorn tiene sus
+#   propias métricas.
+
+import cProfile
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, request
+
+
+logger = logging.getLogger(__name__)
+
+# Límites de las cubetas de los histogramas, en segundos
+CUBETAS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Encabezado que pide perfilar una petición
+ENCABEZADO_PERFIL = 'X-Perfil'
+# Funciones que se escriben en el log de cada perfil
+LINEAS_PERFIL = 25
+# Etiqueta de las peticiones que no corresponden a ninguna ruta
+SIN_RUTA = 'sin_ruta'
+
+
+def escapar(valor):
+    """Escapa el valor de una etiqueta para el formato de texto."""
+    return (str(valor).replace('\\', '\\\\').replace('"', '\\"')
+                      .replace('\n', '\\n'))
+
+
+def etiquetas(nombres, valores, extra=()):
+    """Texto {a="1",b="2"} de las etiquetas de una serie."""
+    pares = list(zip(nombres, valores)) + list(extra)
+    if not pares:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(nombre, escapar(valor))
+                          for nombre, valor in pares) + '}'
+
+
+class Histograma:
+    """Histograma acumulado por combinación de etiquetas."""
+
+    def __init__(self, nombre, ayuda, nombres_etiquetas=(), cubetas=CUBETAS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.nombres_etiquetas = tuple(nombres_etiquetas)
+        self.cubetas = tuple(cubetas)
+        # Por cada combinación de etiquetas: cuentas por cubeta, suma y total
+        self._series = {}
+        self._candado = threading.Lock()
+
+    def observar(self, valor, *etiquetas_serie):
+        with self._candado:
+            serie = self._series.get(etiquetas_serie)
+            if serie is None:
+                serie = self._series[etiquetas_serie] = [
+                    [0] * len(self.cubetas), 0.0, 0]
+            for i, limite in enumerate(self.cubetas):
+                if valor <= limite:
+                    serie[0][i] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def texto(self):
+        lineas = ['# HELP {} {}'.format(self.nombre, self.ayuda),
+                  '# TYPE {} histogram'.format(self.nombre)]
+        with self._candado:
+            series = [(llave, list(cuentas), suma, total)
+                      for llave, (cuentas, suma, total) in self._series.items()]
+        for llave, cuentas, suma, total in sorted(series):
+            for limite, cuenta in zip(self.cubetas, cuentas):
+                lineas.append('{}_bucket{} {}'.format(
+                    self.nombre,
+                    etiquetas(self.nombres_etiquetas, llave, [('le', repr(limite))]),
+                    cuenta))
+            lineas.append('{}_bucket{} {}'.format(
+                self.nombre,
+                etiquetas(self.nombres_etiquetas, llave, [('le', '+Inf')]),
+                total))
+            lineas.append('{}_sum{} {!r}'.format(
+                self.nombre, etiquetas(self.nombres_etiquetas, llave), suma))
+            lineas.append('{}_count{} {}'.format(
+                self.nombre, etiquetas(self.nombres_etiquetas, llave), total))
+        return lineas
+
+
+class Registro:
+    """Histogramas y medidas que se exponen en /metrics."""
+
+    def __init__(self):
+        self.etapas = Histograma(
+            'synergy_etapa_segundos',
+            'Segundos de cada etapa de preparación de los datos.',
+            ['etapa'])
+        self.peticiones = Histograma(
+            'synergy_peticion_segundos',
+            'Segundos de cada petición por ruta y callback.',
+            ['ruta', 'callback', 'estado'])
+        # nombre -> (ayuda, tipo, función que regresa {etiquetas: valor})
+        self._medidas = {}
+
+    def medida(self, nombre, ayuda, funcion, tipo='gauge'):
+        """Registra una medida que se calcula cada vez que se pide /metrics.
+
+        funcion regresa un número o un diccionario de etiquetas (tupla de
+        pares nombre, valor) a número.
+        """
+        self._medidas[nombre] = (ayuda, tipo, funcion)
+
+    def texto(self):
+        lineas = self.etapas.texto() + self.peticiones.texto()
+        for nombre, (ayuda, tipo, funcion) in sorted(self._medidas.items()):
+            try:
+                valores = funcion()
+            except Exception:
+                logger.exception('No se pudo calcular la medida %s', nombre)
+                continue
+            if not isinstance(valores, dict):
+                valores = {(): valores}
+            lineas.append('# HELP {} {}'.format(nombre, ayuda))
+            lineas.append('# TYPE {} {}'.format(nombre, tipo))
+            for pares, valor in valores.items():
+                lineas.append('{}{} {!r}'.format(
+                    nombre, etiquetas((), (), pares), float(valor)))
+        return '\n'.join(lineas) + '\n'
+
+
+# Registro del proceso
+REGISTRO = Registro()
+
+
+@contextmanager
+def tramo(etapa, registro=REGISTRO):
+    """Mide el tiempo de un bloque como una etapa de preparación."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        segundos = time.perf_counter() - inicio
+        registro.etapas.observar(segundos, etapa)
+        logger.debug('%s tardó %.3f s', etapa, segundos)
+
+
+def memoria_residente():
+    """Bytes de memoria residente del proceso."""
+    try:
+        with open('/proc/self/statm') as archivo:
+            paginas = int(archivo.read().split()[1])
+        return paginas * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # Fuera de Linux usamos el máximo que reporta el sistema
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def ruta_de(peticion):
+    """Regla de Flask que atendió la petición, o SIN_RUTA.
+
+    Usar la regla y no la ruta pedida deja una serie por ruta de la app
+    aunque lleguen rutas distintas (archivos, inquilinos o escaneos).
+    """
+    if peticion.url_rule is None:
+        return SIN_RUTA
+    return peticion.url_rule.rule
+
+
+def instalar(server, caches=None, directorio_perfil=None, registro=REGISTRO,
+             callbacks=None):
+    """Agrega las métricas, /metrics y el perfilador al servidor de Flask.
+
+    caches es un diccionario de nombre a CacheFiguras. Si hay
+    directorio_perfil, las peticiones con el encabezado X-Perfil: 1 se
+    perfilan y el resultado se guarda ahí. callbacks es el callback_map de
+    la app de Dash; un callback que no está ahí se cuenta como SIN_RUTA.
+    """
+    caches = caches or {}
+    # El mapa se llena con la primera petición, se guarda el mismo objeto
+    callbacks = {} if callbacks is None else callbacks
+    registro.medida(
+        'synergy_memoria_residente_bytes',
+        'Memoria residente del proceso.', memoria_residente)
+    for llave, nombre, ayuda in (
+            ('aciertos', 'synergy_cache_aciertos_total', 'Aciertos de la caché.'),
+            ('fallos', 'synergy_cache_fallos_total', 'Fallos de la caché.'),
+            ('entradas', 'synergy_cache_entradas', 'Entradas en la caché.'),
+            ('bytes', 'synergy_cache_bytes',
+             'Bytes aproximados de las entradas en memoria.'),
+            ('tasa_aciertos', 'synergy_cache_tasa_aciertos',
+             'Fracción de aciertos de la caché.')):
+        registro.medida(
+            nombre, ayuda,
+            lambda llave=llave: {(('cache', cache),): objeto.estadisticas()[llave]
+                                 for cache, objeto in caches.items()},
+            tipo='counter' if nombre.endswith('_total') else 'gauge')
+    if directorio_perfil:
+        os.makedirs(directorio_perfil, exist_ok=True)
+
+    @server.before_request
+    def iniciar_medicion():
+        g.inicio_peticion = time.perf_counter()
+        if directorio_perfil and request.headers.get(ENCABEZADO_PERFIL) == '1':
+            g.perfil = cProfile.Profile()
+            g.perfil.enable()
+
+    @server.after_request
+    def terminar_medicion(respuesta):
+        perfil = g.pop('perfil', None)
+        if perfil is not None:
+            perfil.disable()
+            respuesta.headers['X-Perfil-Archivo'] = guardar_perfil(
+                perfil, directorio_perfil)
+        inicio = g.pop('inicio_peticion', None)
+        if inicio is not None:
+            callback = ''
+            if request.path.endswith('_dash-update-component'):
+                cuerpo = request.get_json(silent=True)
+                salida = cuerpo.get('output') if isinstance(cuerpo, dict) else None
+                # La salida la manda el cliente, solo las de la app crean serie
+                callback = (salida if isinstance(salida, str)
+                            and salida in callbacks else SIN_RUTA)
+            registro.peticiones.observar(time.perf_counter() - inicio,
+                                         ruta_de(request), callback,
+                                         respuesta.status_code)
+        return respuesta
+
+    @server.route('/metrics')
+    def metricas():
+        return Response(registro.texto(),
+                        mimetype='text/plain; version=0.0.4')
+
+    return registro
+
+
+def guardar_perfil(perfil, directorio):
+    """Guarda el perfil de una petición y escribe las funciones más lentas."""
+    nombre = '{}-{}.prof'.format(
+        time.strftime('%Y%m%d-%H%M%S'),
+        re.sub(r'[^A-Za-z0-9_-]+', '_', ruta_de(request)).strip('_') or 'index')
+    perfil.dump_stats(os.path.join(directorio, nombre))
+    if logger.isEnabledFor(logging.INFO):
+        estadisticas = pstats.Stats(perfil)
+        resumen = []
+        for (archivo, linea, funcion), (_, llamadas, _, acumulado, _) in (
+                sorted(estadisticas.stats.items(), key=lambda e: -e[1][3])
+                [:LINEAS_PERFIL]):
+            resumen.append('{:9.4f} s {:>7} {}:{}({})'.format(
+                acumulado, llamadas, os.path.basename(archivo), linea, funcion))
+        logger.info('Perfil de %s:\n%s', request.path, '\n'.join(resumen))
+    return nombre
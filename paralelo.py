@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Construcción del cubo de rutas en varios procesos.
+#
+# Dividimos el CSV en rangos de bytes que empiezan y terminan en un salto de
+#   línea, cada proceso agrupa su rango en un cubo parcial y al final sumamos
+#   los cubos parciales. Cada proceso lee su rango en bloques, así la memoria
+#   de cada uno tampoco depende del tamaño del archivo.
+
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from agregaciones import combinar_cubos, cubo_de_partes
+from datos import leer_csv
+
+
+# Bytes que cada proceso parsea a la vez dentro de su rango
+TAMANO_BLOQUE = 64 << 20
+
+
+def encabezado(ruta):
+    """Regresa los nombres de las columnas y el byte donde empiezan los datos."""
+    with open(ruta, 'rb') as archivo:
+        linea = archivo.readline()
+    columnas = linea.decode('utf-8-sig').strip().split(',')
+    return columnas, len(linea)
+
+
+def rangos_archivo(ruta, partes):
+    """Divide el archivo en rangos de bytes alineados a inicios de línea."""
+    _, inicio = encabezado(ruta)
+    tamano = os.path.getsize(ruta)
+    cortes = [inicio]
+    with open(ruta, 'rb') as archivo:
+        for i in range(1, partes):
+            posicion = inicio + (tamano - inicio) * i // partes
+            if posicion <= cortes[-1]:
+                continue
+            # Avanzamos hasta el inicio de la siguiente línea
+            archivo.seek(posicion - 1)
+            archivo.readline()
+            posicion = archivo.tell()
+            if cortes[-1] < posicion < tamano:
+                cortes.append(posicion)
+    cortes.append(tamano)
+    return list(zip(cortes[:-1], cortes[1:]))
+
+
+def bloques_de_rango(ruta, inicio, fin, columnas, tamano_bloque=TAMANO_BLOQUE):
+    """Genera dfs con los registros del rango, parseados por bloques."""
+    with open(ruta, 'rb') as archivo:
+        archivo.seek(inicio)
+        pendiente = b''
+        restante = fin - inicio
+        while restante > 0:
+            datos = archivo.read(min(tamano_bloque, restante))
+            if not datos:
+                break
+            restante -= len(datos)
+            datos = pendiente + datos
+            # Dejamos la última línea incompleta para el siguiente bloque
+            corte = datos.rfind(b'\n') + 1 if restante > 0 else len(datos)
+            pendiente = datos[corte:]
+            if datos[:corte].strip():
+                yield leer_csv(io.BytesIO(datos[:corte]), header=None,
+                               names=columnas)
+
+
+def cubo_de_rango(ruta, inicio, fin, tamano_bloque=TAMANO_BLOQUE):
+    """Cubo parcial y último register_id de un rango del archivo."""
+    columnas, _ = encabezado(ruta)
+    return cubo_de_partes(bloques_de_rango(ruta, inicio, fin, columnas,
+                                           tamano_bloque))
+
+
+def _cubo_de_rango(argumentos):
+    # Función de nivel de módulo para que el pool la pueda enviar
+    return cubo_de_rango(*argumentos)
+
+
+def cubo_paralelo(ruta, procesos=None, tamano_bloque=TAMANO_BLOQUE):
+    """Construye el cubo de rutas del CSV repartiendo el trabajo en procesos.
+
+    procesos es la cantidad de workers del pool, por defecto uno por CPU.
+    Regresa el cubo y el último register_id, igual que cubo_de_partes.
+    """
+    procesos = procesos or os.cpu_count() or 1
+    rangos = rangos_archivo(ruta, procesos)
+    tareas = [(ruta, inicio, fin, tamano_bloque) for inicio, fin in rangos]
+    if procesos == 1 or len(tareas) == 1:
+        parciales = [_cubo_de_rango(tarea) for tarea in tareas]
+    else:
+        with ProcessPoolExecutor(max_workers=procesos) as pool:
+            parciales = list(pool.map(_cubo_de_rango, tareas))
+    cubo = combinar_cubos([cubo for cubo, _ in parciales])
+    ultimo_id = max((ultimo for _, ultimo in parciales), default=0)
+    return cubo, ultimo_id
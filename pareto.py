@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Análisis de Pareto (el 80% del valor) vectorizado.
+#
+# Ordenamos los montos de cualquier agrupación (ruta, país de origen,
+#   producto, empresa) con argsort, calculamos el porcentaje acumulado con
+#   cumsum y encontramos el corte con searchsorted. El umbral es configurable,
+#   así los callbacks pueden pedir el 70%, 80% o 90% en cada petición.
+
+import numpy as np
+import pandas as pd
+
+
+# Umbral por defecto, el 80% del valor total
+UMBRAL = 0.8
+
+# Agrupaciones disponibles sobre el cubo de rutas
+AGRUPACIONES = {
+    'ruta': ['origin', 'destination'],
+    'origen': ['origin'],
+    'destino': ['destination'],
+    'producto': ['product'],
+    'medio': ['transport_mode'],
+}
+# Agrupaciones que no son llaves del cubo, se suman desde los registros con
+#   el montos_por del índice
+AGRUPACIONES_REGISTROS = {
+    'empresa': 'company_name',
+}
+
+
+def montos_por(cubo, llaves):
+    """Serie con el monto total de cada grupo del cubo."""
+    if isinstance(llaves, str):
+        llaves = AGRUPACIONES[llaves]
+    return cubo.groupby(llaves, observed=True)['monto'].sum()
+
+
+def analizar(montos, umbral=UMBRAL):
+    """Ordena los grupos por monto y marca los que forman el umbral.
+
+    montos es una serie indexada por el grupo. Regresa un df ordenado de
+    mayor a menor monto con el porcentaje acumulado y la columna 'dentro',
+    verdadera para los grupos cuyo porcentaje acumulado es menor o igual al
+    umbral.
+    """
+    valores = montos.to_numpy()
+    # Orden descendente, estable para que los empates conserven su orden
+    orden = np.argsort(-valores, kind='stable')
+    ordenados = valores[orden]
+    total = ordenados.sum()
+    if total:
+        porcentaje = np.cumsum(ordenados) / total
+    else:
+        porcentaje = np.zeros(len(ordenados))
+    # Cantidad de grupos con porcentaje acumulado <= umbral
+    corte = np.searchsorted(porcentaje, umbral, side='right')
+
+    resultado = montos.iloc[orden].rename('monto').reset_index()
+    resultado['porcentaje'] = porcentaje
+    resultado['dentro'] = np.arange(len(resultado)) < corte
+    return resultado
+
+
+def dentro(montos, umbral=UMBRAL):
+    """Solo los grupos que forman el umbral del valor total."""
+    resultado = analizar(montos, umbral)
+    return resultado.loc[resultado['dentro']].reset_index(drop=True)
+
+
+def top_k(montos, k):
+    """Los k grupos con mayor monto, ordenados de mayor a menor."""
+    valores = montos.to_numpy()
+    if k < len(valores):
+        # argpartition separa los k mayores sin ordenar todo el arreglo
+        mayores = np.argpartition(-valores, k)[:k]
+    else:
+        mayores = np.arange(len(valores))
+    mayores = mayores[np.argsort(-valores[mayores], kind='stable')]
+    return montos.iloc[mayores].rename('monto').reset_index()
+
+
+def contar_por(resultado, llave):
+    """Cantidad de grupos de un análisis por cada valor de una llave."""
+    return (resultado.groupby(llave, observed=True).size()
+                     .rename('rutas').reset_index())
+
+
+def fuera(todos, elegidos):
+    """Elementos de todos que no están en elegidos, en el mismo orden."""
+    elegidos = set(elegidos)
+    return [elemento for elemento in todos if elemento not in elegidos]
+
+
+def cambios(antes, despues):
+    """Elementos que entran y salen al comparar dos conjuntos de grupos."""
+    antes, despues = set(antes), set(despues)
+    return sorted(despues - antes), sorted(antes - despues)
+
+
+def montos_de_serie(etiquetas, valores, nombre):
+    """Serie de montos a partir de arreglos, útil fuera del cubo."""
+    return pd.Series(valores, index=pd.Index(etiquetas, name=nombre))
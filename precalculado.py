@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Build precalculado: índice, gráficas y layout ya serializados.
+#
+# En el build (python precalculado.py) guardamos en .cache/precalculado el
+#   JSON de cada gráfica sin filtros, el JSON del layout junto con sus
+#   versiones .gz y .br, y el cubo de rutas con la celda de cada registro como
+#   columnas .npy. El layout ya incluye las gráficas, así que WhiteNoise solo
+#   sirve el directorio layout/ en /_dash-layout: cargar la página es enviar
+#   un archivo en lugar de serializar el layout en Python, y el manifiesto y
+#   el índice nunca se publican. Al arrancar, create_app lee el cubo y las celdas (con mmap) y
+#   las gráficas en lugar de agrupar los registros y construirlas. El
+#   manifiesto guarda la versión del formato, el hash del CSV y del código y
+#   la configuración que cambia el layout; si algo no coincide el build se
+#   ignora y todo se calcula desde el CSV.
+
+import glob
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+import numpy as np
+
+from datos import (ARCHIVO_CSV, DIRECTORIO_CACHE, escribir_columnas,
+                   hash_archivo, leer_cache)
+
+
+# Directorio de salida, fuera de static/: WhiteNoise solo sirve su layout/
+DIRECTORIO = os.path.join(DIRECTORIO_CACHE, 'precalculado')
+# Se incrementa cuando cambian los archivos que guarda el build
+VERSION = 3
+# Configuración de la app que cambia el layout o el tipo de índice, el build
+#   solo se usa con los mismos valores
+CONFIGURACION = ('perezoso', 'ingesta', 'refresco', 'partes', 'procesos',
+                 'almacen')
+# Nombre del archivo que reemplaza la respuesta de /_dash-layout
+ARCHIVO_LAYOUT = '_dash-layout'
+# Tipos de los archivos que no tienen extensión
+TIPOS = {ARCHIVO_LAYOUT: 'application/json'}
+
+_RAIZ = os.path.dirname(os.path.abspath(__file__))
+
+
+def huella_codigo():
+    """Hash del código de la app, el layout depende de él."""
+    huella = hashlib.sha256()
+    for ruta in sorted(glob.glob(os.path.join(_RAIZ, '*.py'))):
+        with open(ruta, 'rb') as archivo:
+            huella.update(archivo.read())
+    return huella.hexdigest()
+
+
+def huella_actual(ruta_csv=ARCHIVO_CSV):
+    """Hash combinado de los datos y el código."""
+    return hashlib.sha256((hash_archivo(ruta_csv) + huella_codigo())
+                          .encode('ascii')).hexdigest()
+
+
+def escribir(ruta, contenido):
+    """Escribe el archivo y sus versiones comprimidas con gzip y brotli."""
+    with open(ruta, 'wb') as archivo:
+        archivo.write(contenido)
+    with open(ruta + '.gz', 'wb') as archivo:
+        # mtime=0 para que el mismo contenido genere el mismo archivo
+        archivo.write(gzip.compress(contenido, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(ruta + '.br', 'wb') as archivo:
+            archivo.write(brotli.compress(contenido))
+
+
+def configuracion_de(config):
+    """Parte de la configuración de la app que guarda el manifiesto."""
+    return {llave: config[llave] for llave in CONFIGURACION}
+
+
+def construir(app, figuras, ruta_csv=ARCHIVO_CSV, directorio=DIRECTORIO,
+              indice=None, textos=None, config=None):
+    """Guarda el índice, las gráficas y el layout de la app ya serializados.
+
+    figuras es un diccionario con el id y la figura de plotly de cada
+    gráfica, textos el de los componentes de texto. El layout se obtiene
+    pidiendo /_dash-layout a la propia app, así el archivo es exactamente lo
+    que Dash respondería. config es la configuración con que se creó la app.
+    """
+    temporal = directorio + '.tmp'
+    shutil.rmtree(temporal, ignore_errors=True)
+    os.makedirs(os.path.join(temporal, 'figuras'))
+    os.makedirs(os.path.join(temporal, 'layout'))
+    os.makedirs(os.path.join(temporal, 'indice'))
+
+    manifiesto = {'version': VERSION,
+                  'huella': huella_actual(ruta_csv),
+                  'configuracion': configuracion_de(config) if config else None,
+                  'figuras': {},
+                  'textos': dict(textos or {})}
+    for nombre, figura in figuras.items():
+        # Solo las lee la app al arrancar, no necesitan versiones comprimidas
+        archivo = nombre + '.json'
+        with open(os.path.join(temporal, 'figuras', archivo), 'w') as salida:
+            salida.write(figura.to_json())
+        manifiesto['figuras'][nombre] = archivo
+
+    if indice is not None:
+        # El cubo y, con los registros en memoria, la celda de cada registro
+        celdas = getattr(indice, 'celdas', None)
+        if celdas is not None:
+            np.save(os.path.join(temporal, 'indice', 'celdas.npy'), celdas)
+        manifiesto['indice'] = {
+            'ultimo_id': int(indice.ultimo_id),
+            'filas': None if celdas is None else len(celdas),
+            'columnas': escribir_columnas(indice.cubo,
+                                          os.path.join(temporal, 'indice'))}
+
+    respuesta = app.server.test_client().get(
+        app.config.requests_pathname_prefix + '_dash-layout')
+    escribir(os.path.join(temporal, 'layout', ARCHIVO_LAYOUT), respuesta.data)
+
+    with open(os.path.join(temporal, 'manifiesto.json'), 'w') as archivo:
+        json.dump(manifiesto, archivo, indent=2)
+
+    shutil.rmtree(directorio, ignore_errors=True)
+    os.rename(temporal, directorio)
+    return manifiesto
+
+
+def leer_manifiesto(directorio=DIRECTORIO):
+    """Regresa el manifiesto de los archivos precalculados o None."""
+    try:
+        with open(os.path.join(directorio, 'manifiesto.json')) as archivo:
+            return json.load(archivo)
+    except (OSError, ValueError):
+        return None
+
+
+class Paquete:
+    """Build que corresponde a los datos, al código y a la configuración."""
+
+    def __init__(self, directorio, manifiesto):
+        self.directorio = directorio
+        self.manifiesto = manifiesto
+        indice = manifiesto.get('indice') or {}
+        self.ultimo_id = indice.get('ultimo_id')
+        # Registros de la tabla con que se agrupó, None si solo hay cubo
+        self.filas = indice.get('filas')
+
+    def cubo(self):
+        """Cubo de rutas guardado, igual al que agrupa el índice."""
+        return leer_cache(os.path.join(self.directorio, 'indice'),
+                          self.manifiesto['indice'])
+
+    def celdas(self, mmap=True):
+        """Celda del cubo de cada registro, o None si el build no las tiene."""
+        ruta = os.path.join(self.directorio, 'indice', 'celdas.npy')
+        if not os.path.exists(ruta):
+            return None
+        return np.load(ruta, mmap_mode='r' if mmap else None)
+
+    def figuras(self):
+        """Figura (como diccionario) o texto de cada componente."""
+        resultado = {}
+        for nombre, nombre_archivo in self.manifiesto['figuras'].items():
+            with open(os.path.join(self.directorio, 'figuras',
+                                   nombre_archivo)) as archivo:
+                resultado[nombre] = json.load(archivo)
+        resultado.update(self.manifiesto['textos'])
+        return resultado
+
+
+def cargar(ruta_csv, config, directorio=DIRECTORIO):
+    """Paquete del build si corresponde a los datos, al código y a config.
+
+    Regresa None si no hay build o si es de otra versión, otros datos u
+    otra configuración.
+    """
+    manifiesto = leer_manifiesto(directorio)
+    if (manifiesto is None
+            or manifiesto.get('version') != VERSION
+            or manifiesto.get('configuracion') != configuracion_de(config)
+            or manifiesto.get('huella') != huella_actual(ruta_csv)):
+        return None
+    return Paquete(directorio, manifiesto)
+
+
+def servir(whitenoise, app, paquete):
+    """Hace que WhiteNoise responda /_dash-layout con el archivo del build.
+
+    Solo se agrega el directorio layout/, el resto del build no se publica.
+    """
+    whitenoise.add_files(os.path.join(paquete.directorio, 'layout'),
+                         prefix=app.config.requests_pathname_prefix)
+
+
+if __name__ == '__main__':
+    from fabrica import create_app
+    # El layout se debe generar con Dash y no con el archivo anterior
+    app = create_app({'precalculado': False})
+    estado = app.server.extensions['synergy']
+    # Las gráficas sin filtros, también en modo perezoso donde el layout no
+    #   las incluye
+    figuras_iniciales = estado.figuras_sin_filtros()
+    textos = {'par_paises_descartados':
+              figuras_iniciales.pop('par_paises_descartados')}
+    manifiesto = construir(app, figuras_iniciales, estado.ruta_csv,
+                           indice=estado.instantanea.indice, textos=textos,
+                           config=estado.config)
+    for nombre, archivo in manifiesto['figuras'].items():
+        print('{:<24} {}'.format(nombre, archivo))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Recarga de los datos en segundo plano con cambio atómico de instantánea.
+#
+# Las peticiones leen los datos de una Instantanea: el índice ya construido
+#   y la versión que lo identifica. Un hilo revisa la fuente cada cierto
+#   tiempo y, si el archivo cambió, construye un índice nuevo completo (y
+#   precalienta las cachés) fuera de las peticiones. Al terminar cambia la
+#   instantánea actual con una sola asignación: cada callback toma la
+#   instantánea una vez al empezar, así ve la vieja o la nueva completa,
+#   nunca una a medio construir, y no espera ningún candado mientras se
+#   recarga.
+
+import logging
+import os
+import threading
+import time
+
+from datos import hash_archivo
+from metricas import tramo
+
+
+logger = logging.getLogger(__name__)
+
+
+def firma_archivo(ruta):
+    """Ruta, tamaño y fecha de modificación, cambia cuando cambia el archivo.
+
+    Las fuentes reemplazan la copia local solo cuando llegan datos nuevos,
+    así no hace falta leer el archivo para saber si cambió.
+    """
+    estado = os.stat(ruta)
+    return (os.path.abspath(ruta), estado.st_size, estado.st_mtime_ns)
+
+
+class Instantanea:
+    """Índice de los datos que atienden las peticiones.
+
+    Nunca se reemplaza su índice, la recarga crea otra instantánea.
+    """
+
+    def __init__(self, indice, firma, numero=0):
+        self.indice = indice
+        self.firma = firma
+        # Hash del contenido del CSV, igual en todos los workers y entre
+        #   reinicios mientras los datos no cambien
+        self.huella = hash_archivo(firma[0])[:16]
+        # Cuántas recargas hubo antes de esta instantánea
+        self.numero = numero
+        self.creada = time.time()
+
+    def version(self):
+        """Texto que identifica los datos, incluida la ingesta.
+
+        Depende del contenido del CSV y del último register_id, no de cuántas
+        recargas hubo, así un ETag viejo nunca coincide con otros datos.
+        """
+        return '{}.{}'.format(self.huella, self.indice.ultimo_id)
+
+
+class Refresco(threading.Thread):
+    """Hilo que recarga la fuente y cambia la instantánea actual.
+
+    construir recibe la ruta del CSV y regresa un índice nuevo. al_cambiar
+    recibe la instantánea nueva antes de publicarla, por ejemplo para
+    construir las gráficas sin filtros.
+    """
+
+    def __init__(self, fuente, construir, instantanea, intervalo=60.0,
+                 al_cambiar=None):
+        super().__init__(name='refresco-datos', daemon=True)
+        self.fuente = fuente
+        self.construir = construir
+        self.actual = instantanea
+        self.intervalo = intervalo
+        self.al_cambiar = al_cambiar
+        self._detener = threading.Event()
+
+    def revisar(self):
+        """Recarga si la fuente cambió, regresa True si hay instantánea nueva."""
+        ruta = self.fuente.ruta_local()
+        firma = firma_archivo(ruta)
+        if firma == self.actual.firma:
+            return False
+        with tramo('refresco'):
+            nueva = Instantanea(self.construir(ruta), firma,
+                                self.actual.numero + 1)
+            if self.al_cambiar is not None:
+                self.al_cambiar(nueva)
+        # Una sola asignación, las peticiones en curso terminan con la
+        #   instantánea que ya tomaron
+        self.actual = nueva
+        return True
+
+    def run(self):
+        while not self._detener.wait(self.intervalo):
+            try:
+                cambio = self.revisar()
+            except Exception:
+                # Si la recarga falla seguimos atendiendo con la instantánea
+                #   anterior y volvemos a intentar en la siguiente vuelta
+                logger.exception('No se pudieron recargar los datos')
+                continue
+            if cambio:
+                logger.info('Datos recargados, versión %s',
+                            self.actual.version())
+
+    def detener(self):
+        self._detener.set()
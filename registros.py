@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Explorador de los registros con paginación, orden y filtros en el servidor.
+#
+# La DataTable usa page_action, sort_action y filter_action 'custom': el
+#   navegador solo manda la página, el orden (sort_by) y el texto del filtro
+#   (filter_query), y recibe los renglones de esa página. Los filtros se
+#   evalúan sobre los diccionarios de la tabla codificada (unos cuantos
+#   valores por columna) y se indexan con los códigos de los registros, igual
+#   que los filtros del dashboard. Ordenar es un lexsort sobre códigos y
+#   montos; solo los renglones visibles se convierten a texto.
+
+import math
+import re
+
+import numpy as np
+
+from tabla import COLUMNAS_CODIFICADAS
+
+
+# Registros por página
+TAMANO_PAGINA = 20
+# Id, título y tipo de cada columna de la tabla, en orden
+COLUMNAS = [
+    ('date', 'Fecha', 'datetime'),
+    ('year', 'Año', 'numeric'),
+    ('direction', 'Dirección', 'text'),
+    ('origin', 'País de origen', 'text'),
+    ('destination', 'País de destino', 'text'),
+    ('transport_mode', 'Medio de transporte', 'text'),
+    ('product', 'Producto', 'text'),
+    ('company_name', 'Empresa', 'text'),
+    ('total_value', 'Monto', 'numeric'),
+]
+
+# Operadores de filter_query y su nombre corto, los de símbolo y palabra
+#   significan lo mismo. Los más largos van primero para que '>=' no se
+#   confunda con '>'. La tabla antepone 's' (distingue mayúsculas) o 'i' (no
+#   las distingue) a cada operador, p. ej. 'scontains' o 'i='; sin prefijo se
+#   distinguen, como en la DataTable
+OPERADORES = [('>=', 'ge'), ('<=', 'le'), ('!=', 'ne'), ('<', 'lt'),
+              ('>', 'gt'), ('=', 'eq'), ('ge', 'ge'), ('le', 'le'),
+              ('ne', 'ne'), ('lt', 'lt'), ('gt', 'gt'), ('eq', 'eq'),
+              ('contains', 'contains'), ('datestartswith', 'datestartswith')]
+
+_CONDICION = re.compile(
+    r'^\s*\{(?P<columna>[^}]+)\}\s*(?P<mayusculas>[si]?)(?P<operador>'
+    + '|'.join(re.escape(simbolo) for simbolo, _ in OPERADORES)
+    + r')\s*(?P<valor>.*?)\s*$', re.DOTALL)
+
+
+def parsear_consulta(consulta):
+    """Lista de (columna, operador, valor, sensible) de un filter_query.
+
+    Las condiciones van unidas con &&, los valores pueden ir entre comillas.
+    sensible es False si el operador lleva el prefijo 'i', entonces el texto
+    se compara sin distinguir mayúsculas. Las condiciones que no se entienden
+    se ignoran.
+    """
+    condiciones = []
+    for parte in (consulta or '').split(' && '):
+        encontrada = _CONDICION.match(parte)
+        if not encontrada:
+            continue
+        valor = encontrada.group('valor')
+        if len(valor) >= 2 and valor[0] == valor[-1] and valor[0] in '"\'`':
+            valor = valor[1:-1].replace('\\' + valor[0], valor[0])
+        condiciones.append((encontrada.group('columna'),
+                            dict(OPERADORES)[encontrada.group('operador')],
+                            valor,
+                            encontrada.group('mayusculas') != 'i'))
+    return condiciones
+
+
+def comparar(arreglo, operador, valor, sensible=True):
+    """Arreglo booleano de aplicar una condición a cada elemento.
+
+    Con sensible False el texto se compara en minúsculas.
+    """
+    if arreglo.dtype.kind in 'iuf':
+        valor = float(valor)
+        if operador == 'contains':
+            operador = 'eq'
+    else:
+        arreglo = arreglo.astype(str)
+        valor = str(valor)
+        if not sensible:
+            arreglo = np.char.lower(arreglo)
+            valor = valor.lower()
+        if operador == 'contains':
+            return np.char.find(arreglo, valor) >= 0
+    return {'eq': np.equal, 'ne': np.not_equal, 'lt': np.less,
+            'le': np.less_equal, 'gt': np.greater,
+            'ge': np.greater_equal}[operador](arreglo, valor)
+
+
+def rango_de_fecha(valor):
+    """Primer día y día siguiente al último de '2018', '2018-03' o una fecha."""
+    fecha = np.datetime64(str(valor).strip())
+    inicio = fecha.astype('datetime64[D]').astype(np.int64)
+    fin = (fecha + 1).astype('datetime64[D]').astype(np.int64)
+    return int(inicio), int(fin)
+
+
+def mascara_condicion(tabla, columna, operador, valor, sensible=True):
+    """Registros de la tabla que cumplen una condición."""
+    if columna in COLUMNAS_CODIFICADAS:
+        # Evaluamos cada valor distinto una vez y repartimos por código
+        diccionario = np.asarray(tabla.diccionarios[columna])
+        return comparar(diccionario, operador, valor,
+                        sensible)[tabla.codigos[columna]]
+    if columna == 'total_value':
+        return comparar(tabla.valores, operador, valor)
+    if columna == 'date':
+        inicio, fin = rango_de_fecha(valor)
+        if operador in ('datestartswith', 'contains', 'eq'):
+            return (inicio <= tabla.dias) & (tabla.dias < fin)
+        if operador == 'ne':
+            return (tabla.dias < inicio) | (fin <= tabla.dias)
+        # Con un año o un mes, '<= 2016' incluye todo 2016 y '> 2016' empieza
+        #   en 2017
+        if operador in ('le', 'gt'):
+            return comparar(tabla.dias, 'lt' if operador == 'le' else 'ge', fin)
+        return comparar(tabla.dias, operador, inicio)
+    raise KeyError(columna)
+
+
+def llave_orden(tabla, columna, posiciones):
+    """Arreglo numérico para ordenar las posiciones por una columna."""
+    if columna in COLUMNAS_CODIFICADAS:
+        # Lugar de cada valor del diccionario, los diccionarios que crecieron
+        #   con la ingesta no están ordenados
+        diccionario = np.asarray(tabla.diccionarios[columna])
+        lugar = np.empty(len(diccionario), dtype=np.int64)
+        lugar[np.argsort(diccionario, kind='stable')] = np.arange(len(diccionario))
+        return lugar[tabla.codigos[columna][posiciones]]
+    if columna == 'total_value':
+        return tabla.valores[posiciones]
+    if columna == 'date':
+        return tabla.dias[posiciones]
+    raise KeyError(columna)
+
+
+def ordenar(tabla, mascara, consulta='', orden=None):
+    """Posiciones de los registros que cumplen la consulta, ya ordenadas.
+
+    mascara son los filtros del dashboard (None si no hay), consulta el
+    filter_query y orden el sort_by de la DataTable. Regresa la tabla junto
+    con las posiciones, que solo son válidas para esa tabla.
+    """
+    for columna, operador, valor, sensible in parsear_consulta(consulta):
+        try:
+            condicion = mascara_condicion(tabla, columna, operador, valor,
+                                          sensible)
+        except (KeyError, ValueError, TypeError):
+            # Un valor que no corresponde a la columna (texto en el monto, una
+            #   fecha incompleta) no filtra nada
+            continue
+        mascara = condicion if mascara is None else mascara & condicion
+    posiciones = (np.arange(len(tabla)) if mascara is None
+                  else np.flatnonzero(mascara))
+
+    llaves = []
+    for criterio in orden or []:
+        try:
+            llave = llave_orden(tabla, criterio['column_id'], posiciones)
+        except KeyError:
+            continue
+        llaves.append(-llave if criterio.get('direction') == 'desc' else llave)
+    if llaves:
+        # lexsort usa la última llave como la principal, con la posición como
+        #   desempate para que las páginas no cambien entre peticiones
+        posiciones = posiciones[np.lexsort([posiciones] + llaves[::-1])]
+    return tabla, posiciones
+
+
+def renglones(tabla, posiciones):
+    """Registros de la DataTable para las posiciones de una página."""
+    columnas = {}
+    for columna in COLUMNAS_CODIFICADAS:
+        diccionario = np.asarray(tabla.diccionarios[columna], dtype=object)
+        columnas[columna] = diccionario[tabla.codigos[columna][posiciones]].tolist()
+    columnas['year'] = [int(anio) for anio in columnas['year']]
+    columnas['total_value'] = tabla.valores[posiciones].tolist()
+    columnas['date'] = (tabla.dias[posiciones].astype('datetime64[D]')
+                                              .astype(str).tolist())
+    columnas['id'] = [int(posicion) for posicion in posiciones]
+    return [dict(zip(columnas, valores)) for valores in zip(*columnas.values())]
+
+
+def pagina(tabla, posiciones, numero=0, tamano=TAMANO_PAGINA):
+    """Renglones de una página, cantidad de páginas y total de registros."""
+    tamano = max(int(tamano or TAMANO_PAGINA), 1)
+    paginas = max(math.ceil(len(posiciones) / tamano), 1)
+    numero = min(max(int(numero or 0), 0), paginas - 1)
+    visibles = posiciones[numero * tamano:(numero + 1) * tamano]
+    return renglones(tabla, visibles), paginas, len(posiciones)
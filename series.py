@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Series de tiempo del monto por día, semana, mes y año.
+#
+# Partimos de una matriz con el monto de cada día (renglones) y cada valor de
+#   una columna (columnas), por ejemplo el medio de transporte. Los niveles
+#   por semana, mes y año se calculan una sola vez sumando bloques de días
+#   consecutivos con np.add.reduceat. Para cada petición elegimos el nivel
+#   más fino que cabe en el ancho de la gráfica dentro del rango visible, así
+#   el navegador recibe unos cientos de puntos sin importar el zoom.
+
+import numpy as np
+import pandas as pd
+
+
+# Niveles de la serie, del más fino al más grueso
+RESOLUCIONES = ['dia', 'semana', 'mes', 'anio']
+# Nombre de cada nivel para los títulos de las gráficas
+NOMBRES = {'dia': 'día', 'semana': 'semana', 'mes': 'mes', 'anio': 'año'}
+# Máximo de puntos por serie cuando no se conoce el ancho de la gráfica
+PUNTOS = 300
+# Pixeles de la gráfica por cada punto de la serie
+PIXELES_POR_PUNTO = 3
+
+
+def inicio_periodo(dias, resolucion):
+    """Día en que empieza el periodo de cada día (días desde 1970-01-01)."""
+    dias = np.asarray(dias, dtype=np.int64)
+    if resolucion == 'dia':
+        return dias
+    if resolucion == 'semana':
+        # 1970-01-01 fue jueves, las semanas empiezan en lunes
+        return dias - (dias + 3) % 7
+    unidad = {'mes': 'M', 'anio': 'Y'}[resolucion]
+    return (dias.astype('datetime64[D]').astype('datetime64[' + unidad + ']')
+                .astype('datetime64[D]').astype(np.int64))
+
+
+def periodos_entre(primero, ultimo, resolucion):
+    """Inicio de todos los periodos entre dos días, incluidos los vacíos."""
+    primero = int(inicio_periodo([primero], resolucion)[0])
+    ultimo = int(ultimo)
+    if resolucion in ('dia', 'semana'):
+        return np.arange(primero, ultimo + 1, 1 if resolucion == 'dia' else 7)
+    tipo = 'datetime64[{}]'.format({'mes': 'M', 'anio': 'Y'}[resolucion])
+    desde = np.datetime64(primero, 'D').astype(tipo)
+    hasta = np.datetime64(ultimo, 'D').astype(tipo)
+    return (np.arange(desde, hasta + 1).astype('datetime64[D]')
+              .astype(np.int64))
+
+
+def a_dia(fecha):
+    """Convierte una fecha (texto, datetime o Timestamp) a días desde 1970."""
+    return int(pd.Timestamp(fecha).to_datetime64().astype('datetime64[D]')
+                 .astype(np.int64))
+
+
+def puntos_para(ancho, pixeles_por_punto=PIXELES_POR_PUNTO):
+    """Máximo de puntos por serie para una gráfica de `ancho` pixeles."""
+    if not ancho:
+        return PUNTOS
+    return max(int(ancho) // pixeles_por_punto, 10)
+
+
+def rango_de_relayout(relayout):
+    """Rango visible del eje x a partir del relayoutData de dcc.Graph.
+
+    Regresa (inicio, fin) en días o None si se ve toda la serie.
+    """
+    if not relayout or relayout.get('xaxis.autorange'):
+        return None
+    if 'xaxis.range[0]' in relayout and 'xaxis.range[1]' in relayout:
+        rango = relayout['xaxis.range[0]'], relayout['xaxis.range[1]']
+    elif 'xaxis.range' in relayout:
+        rango = relayout['xaxis.range']
+    else:
+        return None
+    try:
+        inicio, fin = sorted(a_dia(fecha) for fecha in rango)
+    except (TypeError, ValueError):
+        return None
+    return inicio, fin
+
+
+def lttb(x, y, puntos):
+    """Índices elegidos con Largest-Triangle-Three-Buckets.
+
+    Conserva la forma de la serie (picos y valles) con `puntos` puntos. x y
+    y son arreglos numéricos del mismo tamaño ordenados por x.
+    """
+    n = len(x)
+    if puntos >= n or puntos < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # El primer y el último punto siempre se quedan, el resto se divide en
+    #   puntos - 2 cubetas
+    bordes = np.linspace(1, n - 1, puntos - 1).astype(np.int64)
+    elegidos = np.empty(puntos, dtype=np.int64)
+    elegidos[0] = 0
+    elegidos[-1] = n - 1
+    anterior = 0
+    for i in range(puntos - 2):
+        inicio, fin = bordes[i], bordes[i + 1]
+        # Promedio de la siguiente cubeta, o el último punto
+        siguiente = slice(fin, bordes[i + 2]) if i + 2 < len(bordes) else slice(n - 1, n)
+        x_prom, y_prom = x[siguiente].mean(), y[siguiente].mean()
+        # Área del triángulo entre el punto anterior, cada candidato y el
+        #   promedio de la siguiente cubeta
+        areas = np.abs((x[anterior] - x_prom) * (y[inicio:fin] - y[anterior])
+                       - (x[anterior] - x[inicio:fin]) * (y_prom - y[anterior]))
+        anterior = inicio + int(np.argmax(areas))
+        elegidos[i + 1] = anterior
+    return elegidos
+
+
+class SeriesTiempo:
+    """Montos por periodo y por valor de una columna en varios niveles."""
+
+    def __init__(self, dias, categorias, matriz, columna='transport_mode'):
+        """dias es el arreglo ordenado de días (desde 1970) de los renglones
+        de matriz, categorias los valores de la columna de cada columna de
+        matriz.
+        """
+        self.columna = columna
+        self.categorias = list(categorias)
+        dias = np.asarray(dias, dtype=np.int64)
+        matriz = np.asarray(matriz)
+        self.niveles = {}
+        for resolucion in RESOLUCIONES:
+            if len(dias) == 0:
+                self.niveles[resolucion] = (dias, matriz)
+                continue
+            periodos = inicio_periodo(dias, resolucion)
+            # Los días están ordenados, cada periodo es un bloque contiguo
+            primeros = np.flatnonzero(np.r_[True, periodos[1:] != periodos[:-1]])
+            # Los periodos sin registros valen cero, así la línea no une
+            #   periodos lejanos
+            todos = periodos_entre(dias[0], dias[-1], resolucion)
+            montos = np.zeros((len(todos), matriz.shape[1]), dtype=matriz.dtype)
+            montos[np.searchsorted(todos, periodos[primeros])] = np.add.reduceat(
+                                                    matriz, primeros, axis=0)
+            self.niveles[resolucion] = (todos, montos)
+
+    def elegir(self, rango=None, puntos=PUNTOS):
+        """Nivel más fino que tiene a lo más `puntos` periodos en el rango."""
+        for resolucion in RESOLUCIONES:
+            periodos, _ = self.niveles[resolucion]
+            if self._contar(periodos, rango) <= puntos:
+                return resolucion
+        return RESOLUCIONES[-1]
+
+    @staticmethod
+    def _limites(periodos, rango):
+        """Posiciones de los periodos visibles, con uno extra a cada lado."""
+        if rango is None:
+            return 0, len(periodos)
+        inicio = max(np.searchsorted(periodos, rango[0], side='right') - 1, 0)
+        fin = min(np.searchsorted(periodos, rango[1], side='right') + 1,
+                  len(periodos))
+        return inicio, fin
+
+    def _contar(self, periodos, rango):
+        inicio, fin = self._limites(periodos, rango)
+        return fin - inicio
+
+    def serie(self, rango=None, puntos=PUNTOS, resolucion=None, metodo='nivel'):
+        """Serie larga (fecha, columna, monto) lista para graficar.
+
+        Con metodo='nivel' se usa el nivel que elige `elegir`, con
+        metodo='lttb' se usan los días y se reducen con lttb a `puntos` por
+        valor de la columna. Regresa la resolución usada y el df.
+        """
+        if metodo == 'lttb':
+            resolucion = 'dia'
+        elif resolucion is None:
+            resolucion = self.elegir(rango, puntos)
+        periodos, montos = self.niveles[resolucion]
+        inicio, fin = self._limites(periodos, rango)
+        periodos, montos = periodos[inicio:fin], montos[inicio:fin]
+
+        partes = []
+        for j, categoria in enumerate(self.categorias):
+            indices = (lttb(periodos, montos[:, j], puntos)
+                       if metodo == 'lttb' else np.arange(len(periodos)))
+            partes.append(pd.DataFrame({
+                'fecha': periodos[indices].astype('datetime64[D]'),
+                self.columna: categoria,
+                'monto': montos[indices, j]}))
+        if not partes:
+            return resolucion, pd.DataFrame(columns=['fecha', self.columna,
+                                                     'monto'])
+        return resolucion, pd.concat(partes, ignore_index=True)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Tabla de registros codificada con enteros.
+#
+# Cada columna de texto (y el año) se guarda como un arreglo de códigos int16
+#   (int32 si tiene más de 32767 valores distintos) junto con su diccionario
+#   de valores, que existe una sola vez. El monto queda en int64 y la fecha
+#   como número de día int32. Agrupar por varias columnas es combinar sus
+#   códigos en un solo entero y sumar con np.bincount, sin strings por
+#   registro ni groupby de pandas.
+#
+# Leída desde la caché con mmap, las columnas son las páginas de los archivos
+#   .npy: todos los procesos que abren la misma caché (los workers de
+#   gunicorn) comparten una sola copia en memoria.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from datos import (ARCHIVO_CSV, COLUMNAS_CATEGORICAS, DIRECTORIO_CACHE,
+                   TIPOS_NUMERICOS, a_dias, preparar_cache, tipo_codigos)
+
+
+# Columnas que se guardan como códigos con diccionario
+COLUMNAS_CODIFICADAS = COLUMNAS_CATEGORICAS + ['year']
+
+
+def codificar(valores):
+    """Códigos y diccionario ordenado de un arreglo de valores."""
+    diccionario, codigos = np.unique(np.asarray(valores), return_inverse=True)
+    return (codigos.reshape(-1).astype(tipo_codigos(len(diccionario))),
+            diccionario.tolist())
+
+
+class TablaCodificada:
+    """Registros como códigos enteros, montos y números de día."""
+
+    def __init__(self, codigos, diccionarios, valores, dias, ultimo_id):
+        # Código de cada registro y lista de valores de cada columna
+        self.codigos = codigos
+        self.diccionarios = diccionarios
+        # Monto y día (desde 1970-01-01) de cada registro
+        self.valores = valores
+        self.dias = dias
+        # Último register_id, la tabla no guarda el id de cada registro
+        self.ultimo_id = ultimo_id
+
+    @classmethod
+    def desde_df(cls, df):
+        """Codifica un df como el que regresa datos.leer_csv."""
+        codigos = {}
+        diccionarios = {}
+        for columna in COLUMNAS_CODIFICADAS:
+            serie = df[columna]
+            if isinstance(serie.dtype, pd.CategoricalDtype):
+                diccionarios[columna] = list(serie.cat.categories)
+                codigos[columna] = serie.cat.codes.to_numpy().astype(
+                    tipo_codigos(len(diccionarios[columna])))
+            else:
+                codigos[columna], diccionarios[columna] = codificar(serie)
+        return cls(codigos, diccionarios,
+                   df['total_value'].to_numpy().astype(np.int64),
+                   a_dias(df['date']),
+                   int(df['register_id'].max()) if len(df) else 0)
+
+    def __len__(self):
+        return len(self.valores)
+
+    def nbytes(self):
+        """Bytes que ocupan los arreglos de la tabla."""
+        return (sum(codigos.nbytes for codigos in self.codigos.values())
+                + self.valores.nbytes + self.dias.nbytes)
+
+    def extender(self, otra):
+        """Nueva tabla con los registros de otra al final.
+
+        Los valores que no estaban en un diccionario reciben los siguientes
+        códigos, así los códigos existentes no cambian.
+        """
+        codigos = {}
+        diccionarios = {}
+        for columna, existentes in self.diccionarios.items():
+            posiciones = {valor: i for i, valor in enumerate(existentes)}
+            todos = list(existentes)
+            for valor in otra.diccionarios[columna]:
+                if valor not in posiciones:
+                    posiciones[valor] = len(todos)
+                    todos.append(valor)
+            mapa = np.array([posiciones[valor]
+                             for valor in otra.diccionarios[columna]],
+                            dtype=np.int64)
+            tipo = tipo_codigos(len(todos))
+            nuevos = (mapa[otra.codigos[columna]] if len(mapa)
+                      else otra.codigos[columna])
+            codigos[columna] = np.concatenate(
+                [self.codigos[columna].astype(tipo, copy=False),
+                 nuevos.astype(tipo)])
+            diccionarios[columna] = todos
+        return TablaCodificada(codigos, diccionarios,
+                               np.concatenate([self.valores, otra.valores]),
+                               np.concatenate([self.dias, otra.dias]),
+                               max(self.ultimo_id, otra.ultimo_id))
+
+    def permitidos(self, columna, elegidos):
+        """Arreglo booleano por código con los valores elegidos."""
+        return np.isin(np.asarray(self.diccionarios[columna]), list(elegidos))
+
+    def agrupar(self, llaves, mascara=None):
+        """Grupo de cada registro y df con los grupos de las llaves.
+
+        Equivale a groupby(llaves, observed=True) con movimientos (cantidad
+        de registros) y monto (suma de total_value). Los grupos salen en el
+        orden de los códigos, el mismo de groupby cuando los diccionarios
+        están ordenados. Con mascara solo se agrupan esos registros.
+        """
+        codigos = [self.codigos[llave] for llave in llaves]
+        valores = self.valores
+        if mascara is not None:
+            codigos = [c[mascara] for c in codigos]
+            valores = valores[mascara]
+        tamanos = [len(self.diccionarios[llave]) for llave in llaves]
+
+        # Un solo entero por combinación de códigos, como un número en base
+        #   mixta con un dígito por llave
+        combinado = np.zeros(len(valores), dtype=np.int64)
+        for c, tamano in zip(codigos, tamanos):
+            combinado *= tamano
+            combinado += c
+        total = int(np.prod(tamanos, dtype=np.int64))
+        if total <= max(4 * len(valores), 1 << 20):
+            # Pocas combinaciones posibles, bincount encuentra las que existen
+            presentes = np.flatnonzero(np.bincount(combinado, minlength=total))
+            posicion = np.zeros(total, dtype=np.int64)
+            posicion[presentes] = np.arange(len(presentes))
+            grupos = posicion[combinado]
+        else:
+            presentes, grupos = np.unique(combinado, return_inverse=True)
+            grupos = grupos.reshape(-1)
+
+        # Separamos los dígitos de cada grupo para obtener sus llaves
+        columnas = {}
+        resto = presentes
+        for llave, tamano in reversed(list(zip(llaves, tamanos))):
+            resto, codigo = np.divmod(resto, tamano)
+            diccionario = self.diccionarios[llave]
+            if llave in TIPOS_NUMERICOS:
+                columnas[llave] = np.asarray(diccionario)[codigo].astype(
+                    TIPOS_NUMERICOS[llave])
+            else:
+                columnas[llave] = pd.Categorical.from_codes(
+                    codigo, categories=diccionario)
+        cubo = pd.DataFrame({llave: columnas[llave] for llave in llaves})
+        cubo['movimientos'] = np.bincount(grupos, minlength=len(presentes))
+        cubo['monto'] = np.bincount(grupos, weights=valores,
+                                    minlength=len(presentes)).astype(np.int64)
+        return grupos, cubo
+
+
+def leer_tabla(directorio, manifiesto, mmap=False):
+    """Arma la tabla directamente con las columnas .npy de la caché.
+
+    Con mmap los arreglos son de solo lectura y se leen del archivo cuando se
+    usan, sin copiarlos a la memoria del proceso.
+    """
+    def cargar(nombre):
+        return np.load(os.path.join(directorio, nombre + '.npy'),
+                       mmap_mode='r' if mmap else None)
+
+    entradas = {entrada['nombre']: entrada
+                for entrada in manifiesto['columnas']}
+    codigos = {}
+    diccionarios = {}
+    for columna in COLUMNAS_CODIFICADAS:
+        if 'categorias' in entradas[columna]:
+            codigos[columna] = cargar(columna)
+            diccionarios[columna] = entradas[columna]['categorias']
+        else:
+            codigos[columna], diccionarios[columna] = codificar(cargar(columna))
+    return TablaCodificada(codigos, diccionarios, cargar('total_value'),
+                           cargar('date'), manifiesto['ultimo_id'])
+
+
+def cargar_tabla(ruta=ARCHIVO_CSV, directorio_cache=DIRECTORIO_CACHE,
+                 mmap=False):
+    """Carga la base de datos como tabla codificada.
+
+    Igual que datos.cargar_datos, pero sin crear un DataFrame cuando la caché
+    columnar es válida. Con mmap las columnas se mapean desde la caché, aun
+    cuando se acaba de escribir.
+    """
+    directorio, manifiesto, df = preparar_cache(ruta, directorio_cache)
+    if manifiesto is not None and (df is None or mmap):
+        return leer_tabla(directorio, manifiesto, mmap)
+    return TablaCodificada.desde_df(df)
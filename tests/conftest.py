@@ -0,0 +1,11 @@
+# coding: utf-8
+# Las pruebas importan los módulos de la raíz del repositorio y usan su CSV.
+
+import os
+import sys
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, RAIZ)
+
+# CSV del repositorio
+CSV = os.path.join(RAIZ, 'synergy_logistics_database.csv')
@@ -0,0 +1,52 @@
+# coding: utf-8
+# Los conteos precalculados (cubo de rutas y matriz origen-destino) deben ser
+#   los mismos que agrupar los registros del CSV por par origen-destino.
+
+import numpy as np
+import pytest
+
+import agregaciones
+import figuras
+from conftest import CSV
+from datos import leer_csv
+from matriz import MatrizOD
+
+
+@pytest.fixture(scope='module')
+def df():
+    return leer_csv(CSV)
+
+
+@pytest.fixture(scope='module')
+def cubo(df):
+    return agregaciones.construir_cubo(df)
+
+
+def pares(df):
+    """Registros por par origen-destino contados directamente."""
+    conteo = df.groupby(['origin', 'destination'], observed=True).size()
+    return {(str(origen), str(destino)): int(cantidad)
+            for (origen, destino), cantidad in conteo.items()}
+
+
+def test_cubo_cuenta_los_registros_de_cada_par(df, cubo):
+    rutas = agregaciones.rebanar(cubo, ['origin', 'destination'])
+    conteo = {(str(origen), str(destino)): int(cantidad)
+              for origen, destino, cantidad in zip(
+                  rutas['origin'], rutas['destination'], rutas['movimientos'])}
+    assert conteo == pares(df)
+
+
+def test_matriz_cuenta_los_registros_de_cada_par(df, cubo):
+    matriz = MatrizOD.desde_cubo(cubo)
+    nodos = np.asarray(matriz.nodos, dtype=object)
+    conteo = {(origen, destino): int(cantidad)
+              for origen, destino, cantidad in zip(
+                  nodos[matriz.origenes()], nodos[matriz.destinos],
+                  matriz.valores['movimientos'])}
+    assert conteo == pares(df)
+
+
+def test_heatmap_suma_todos_los_registros(df, cubo):
+    figura = figuras.heatmap_count(cubo)
+    assert int(np.sum(figura.data[0].z)) == len(df) == 19056
@@ -0,0 +1,93 @@
+# coding: utf-8
+# El almacén de SQLite debe dar los mismos cubos y montos por día que el
+#   índice en memoria, también cuando el CSV cambia y se reconstruye mientras
+#   la versión anterior sigue abierta.
+
+import os
+
+import pandas as pd
+import pytest
+
+import almacen
+from agregaciones import LLAVES_CUBO
+from conftest import CSV
+from datos import leer_csv
+from indice import IndiceFiltros, normalizar_filtros
+from tabla import TablaCodificada
+
+FILTROS = [
+    normalizar_filtros(None, None, None, None, None),
+    normalizar_filtros([2016, 2018], None, None, None, None),
+    normalizar_filtros(None, ['Exports'], ['Rail', 'Road'], None, None),
+    normalizar_filtros(None, None, None, ['Cars', 'Vegetables'], None),
+    normalizar_filtros([2019, 2020], None, None, None, ['Honda', 'Volvo']),
+]
+
+
+def indice_de(ruta):
+    return IndiceFiltros(TablaCodificada.desde_df(leer_csv(ruta)))
+
+
+def ordenado(cubo):
+    """Cubo con las llaves como texto y en un orden fijo para comparar."""
+    cubo = cubo[LLAVES_CUBO + ['movimientos', 'monto']].copy()
+    for llave in LLAVES_CUBO:
+        cubo[llave] = cubo[llave].astype(str)
+    cubo['movimientos'] = cubo['movimientos'].astype('int64')
+    cubo['monto'] = cubo['monto'].astype('float64')
+    return cubo.sort_values(LLAVES_CUBO).reset_index(drop=True)
+
+
+def por_dia(dias, categorias, matriz):
+    """Monto de cada (día, valor) con registros, sin importar el orden."""
+    return {(int(dia), str(categoria)): int(matriz[renglon, columna])
+            for renglon, dia in enumerate(dias)
+            for columna, categoria in enumerate(categorias)
+            if matriz[renglon, columna]}
+
+
+def comparar(almacenado, indice):
+    assert almacenado.ultimo_id == indice.ultimo_id
+    pd.testing.assert_frame_equal(ordenado(almacenado.cubo),
+                                  ordenado(indice.cubo))
+    for filtros in FILTROS:
+        pd.testing.assert_frame_equal(
+            ordenado(almacenado.cubo_filtrado(filtros)),
+            ordenado(indice.cubo_filtrado(filtros)))
+        for columna in ('transport_mode', 'product'):
+            assert por_dia(*almacenado.montos_por_dia(columna, filtros)) == \
+                por_dia(*indice.montos_por_dia(columna, filtros))
+
+
+@pytest.fixture(scope='module')
+def memoria():
+    return indice_de(CSV)
+
+
+def test_igual_que_en_memoria(tmp_path, memoria):
+    comparar(almacen.abrir(CSV, str(tmp_path / 'synergy.sqlite')), memoria)
+
+
+def test_reconstruir_con_conexion_abierta(tmp_path):
+    with open(CSV, encoding='utf-8-sig') as archivo:
+        lineas = archivo.readlines()
+    ruta_csv = tmp_path / 'synergy_logistics_database.csv'
+    ruta_csv.write_text(''.join(lineas[:15001]), encoding='utf-8')
+    ruta = str(tmp_path / 'synergy.sqlite')
+
+    inicial = indice_de(str(ruta_csv))
+    anterior = almacen.abrir(str(ruta_csv), ruta)
+    # Deja abierta la conexión de este hilo con unas consultas
+    comparar(anterior, inicial)
+
+    ruta_csv.write_text(''.join(lineas), encoding='utf-8')
+    nuevo = almacen.abrir(str(ruta_csv), ruta)
+    assert nuevo.ruta != anterior.ruta
+    assert os.path.exists(anterior.ruta)
+
+    # Cada uno sigue con su versión del CSV
+    comparar(anterior, inicial)
+    comparar(nuevo, indice_de(str(ruta_csv)))
+
+    # Abrir la misma versión otra vez usa el archivo que ya existe
+    assert almacen.abrir(str(ruta_csv), ruta).ruta == nuevo.ruta
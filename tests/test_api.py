@@ -0,0 +1,94 @@
+# coding: utf-8
+# La API de /api con el cliente de pruebas de Flask: el ETag con
+#   If-None-Match, las respuestas en Arrow y la validación de los parámetros.
+
+import json
+
+import pytest
+
+from conftest import CSV
+from datos import leer_csv
+from fabrica import create_app
+
+
+@pytest.fixture(scope='module')
+def cliente():
+    app = create_app({'precalculado': False}, registro=None)
+    return app.server.test_client()
+
+
+def datos(respuesta):
+    assert respuesta.status_code == 200
+    return json.loads(respuesta.data)
+
+
+def test_etag(cliente):
+    respuesta = cliente.get('/api/routes?year=2018&limit=5')
+    assert respuesta.status_code == 200
+    etag = respuesta.headers['ETag']
+    assert len(datos(respuesta)['data']) == 5
+
+    repetida = cliente.get('/api/routes?year=2018&limit=5',
+                           headers={'If-None-Match': etag})
+    assert repetida.status_code == 304
+    assert repetida.data == b''
+    assert repetida.headers['ETag'] == etag
+
+    # Otra consulta tiene otro ETag y el anterior ya no coincide
+    otra = cliente.get('/api/routes?year=2019&limit=5',
+                       headers={'If-None-Match': etag})
+    assert otra.status_code == 200
+    assert otra.headers['ETag'] != etag
+
+
+def test_arrow(cliente):
+    pa = pytest.importorskip('pyarrow')
+    respuesta = cliente.get('/api/transports?format=arrow')
+    assert respuesta.status_code == 200
+    assert respuesta.mimetype == 'application/vnd.apache.arrow.stream'
+    tabla = pa.ipc.open_stream(respuesta.data).read_all()
+
+    contenido = datos(cliente.get('/api/transports'))
+    assert tabla.schema.metadata[b'version'].decode() == contenido['version']
+    assert tabla.to_pylist() == contenido['data']
+
+    # Accept también elige Arrow, pero el mismo filtro tiene otro ETag
+    aceptada = cliente.get(
+        '/api/transports',
+        headers={'Accept': 'application/vnd.apache.arrow.stream'})
+    assert aceptada.data == respuesta.data
+    assert aceptada.headers['ETag'] != cliente.get(
+        '/api/transports').headers['ETag']
+
+
+def test_pareto_por_empresa(cliente):
+    df = leer_csv(CSV)
+    esperado = df.groupby('company_name', observed=True)['total_value'].sum()
+    contenido = datos(cliente.get('/api/pareto?by=company&threshold=0.8'))
+    montos = {renglon['company_name']: renglon['monto']
+              for renglon in contenido['data']}
+    assert montos == {str(empresa): int(monto)
+                      for empresa, monto in esperado.items()}
+    porcentajes = [renglon['porcentaje'] for renglon in contenido['data']]
+    assert porcentajes == sorted(porcentajes)
+    assert porcentajes[-1] == pytest.approx(1)
+
+
+@pytest.mark.parametrize('url', [
+    '/api/pareto?by=pais',
+    '/api/pareto?threshold=2',
+    '/api/pareto?threshold=0',
+    '/api/pareto?threshold=abc',
+    '/api/routes?year=abc',
+    '/api/routes?year=2015-abc',
+    '/api/routes?limit=-1',
+    '/api/routes?format=xml',
+])
+def test_parametros_invalidos(cliente, url):
+    respuesta = cliente.get(url)
+    assert respuesta.status_code == 400
+    assert json.loads(respuesta.data)['error']
+
+
+def test_consulta_inexistente(cliente):
+    assert cliente.get('/api/rutas').status_code == 404
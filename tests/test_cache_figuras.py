@@ -0,0 +1,131 @@
+# coding: utf-8
+# La caché de las gráficas: el orden en que saca las entradas, el TTL, los
+#   bytes que cuenta y el respaldo en disco que comparten los workers.
+
+import os
+
+import pytest
+
+import cache_figuras
+from cache_figuras import CacheFiguras
+
+
+class Reloj:
+    """Reemplazo de time.time que solo avanza cuando se le pide."""
+
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def time(self):
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(cache_figuras, 'time', reloj)
+    return reloj
+
+
+def constante(valor, llamadas):
+    """Función construir que anota cada vez que se llama."""
+    def construir():
+        llamadas.append(valor)
+        return valor
+    return construir
+
+
+def stat_modo(ruta):
+    """Permisos de un archivo o directorio."""
+    return os.stat(ruta).st_mode & 0o777
+
+
+def test_orden_de_salida():
+    cache = CacheFiguras(max_entradas=2)
+    llamadas = []
+    cache.obtener('a', constante(1, llamadas))
+    cache.obtener('b', constante(2, llamadas))
+    # Usar 'a' la deja como la más reciente, así que sale 'b'
+    assert cache.obtener('a', constante(-1, llamadas)) == 1
+    cache.obtener('c', constante(3, llamadas))
+    assert list(cache._entradas) == ['a', 'c']
+
+    assert cache.obtener('b', constante(2, llamadas)) == 2
+    assert list(cache._entradas) == ['c', 'b']
+    assert llamadas == [1, 2, 3, 2]
+    assert cache.estadisticas()['aciertos'] == 1
+    assert cache.estadisticas()['fallos'] == 4
+
+
+def test_expiracion(reloj):
+    cache = CacheFiguras(ttl=10)
+    llamadas = []
+    cache.obtener('a', constante(1, llamadas))
+    reloj.ahora += 10
+    assert cache.obtener('a', constante(2, llamadas)) == 1
+    reloj.ahora += 0.5
+    assert cache.obtener('a', constante(2, llamadas)) == 2
+    assert llamadas == [1, 2]
+
+    # Sin TTL las entradas no expiran
+    cache = CacheFiguras()
+    cache.obtener('a', constante(1, llamadas))
+    reloj.ahora += 10 ** 6
+    assert cache.obtener('a', constante(2, llamadas)) == 1
+
+
+def test_bytes():
+    cache = CacheFiguras(max_entradas=2, medir=len)
+    cache.obtener('a', lambda: b'x' * 10)
+    cache.obtener('b', lambda: b'x' * 20)
+    assert cache.estadisticas()['bytes'] == 30
+    cache.obtener('c', lambda: b'x' * 40)
+    assert cache.estadisticas()['bytes'] == 60
+    cache.limpiar()
+    assert cache.estadisticas()['bytes'] == 0
+    assert cache.estadisticas()['entradas'] == 0
+
+
+def test_disco(tmp_path, reloj):
+    directorio = str(tmp_path / 'figuras')
+    llamadas = []
+    primera = CacheFiguras(ttl=60, directorio=directorio)
+    valor = {'data': [1, 2, 3], 'layout': {'title': 'Rutas'}}
+    primera.obtener(('v1', 'rutas'), constante(valor, llamadas))
+    assert stat_modo(directorio) == 0o700
+    archivos = os.listdir(directorio)
+    assert len(archivos) == 1
+    assert stat_modo(os.path.join(directorio, archivos[0])) == 0o600
+
+    # Otro worker con el mismo directorio la lee sin construirla
+    segunda = CacheFiguras(ttl=60, directorio=directorio)
+    reloj.ahora += 30
+    assert segunda.obtener(('v1', 'rutas'), constante(None, llamadas)) == valor
+    assert llamadas == [valor]
+    assert segunda.estadisticas()['aciertos'] == 1
+
+    # Conserva la fecha de creación del otro worker para el TTL
+    reloj.ahora += 31
+    tercera = CacheFiguras(ttl=60, directorio=directorio)
+    assert tercera.obtener(('v1', 'rutas'), constante(4, llamadas)) == 4
+
+    tercera.limpiar()
+    assert os.listdir(directorio) == []
+
+
+def test_recorta_archivos(tmp_path):
+    directorio = str(tmp_path / 'figuras')
+    cache = CacheFiguras(max_entradas=1, directorio=directorio, max_archivos=3)
+    for numero in range(5):
+        cache.obtener(numero, constante(numero, []))
+    assert len(os.listdir(directorio)) == 3
+
+
+def test_directorio_ajeno(tmp_path):
+    directorio = tmp_path / 'compartido'
+    directorio.mkdir()
+    directorio.chmod(0o777)
+    cache = CacheFiguras(directorio=str(directorio))
+    assert cache.directorio is None
+    cache.obtener('a', constante(1, []))
+    assert os.listdir(directorio) == []
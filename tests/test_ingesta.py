@@ -0,0 +1,129 @@
+# coding: utf-8
+# Los registros que se agregan al final del CSV y entran por la ingesta
+#   continua deben dejar el índice igual que volver a leer el archivo completo.
+
+import os
+
+import pandas as pd
+import pytest
+
+import ingesta
+from agregaciones import LLAVES_CUBO
+from conftest import CSV
+from datos import leer_csv
+from fabrica import create_app
+from indice import IndiceFiltros, normalizar_filtros
+from tabla import TablaCodificada
+
+# Renglones del CSV del repositorio con los que empieza el archivo temporal
+INICIALES = 15000
+
+FILTROS = [
+    normalizar_filtros(None, None, None, None, None),
+    normalizar_filtros([2019, 2020], None, None, None, None),
+    normalizar_filtros(None, ['Imports'], ['Sea', 'Air'], None, None),
+    normalizar_filtros(None, None, None, ['Cars'], ['Honda']),
+]
+
+
+@pytest.fixture(scope='module')
+def lineas():
+    with open(CSV, encoding='utf-8-sig') as archivo:
+        return archivo.readlines()
+
+
+@pytest.fixture
+def ruta(tmp_path, lineas):
+    ruta = tmp_path / 'synergy_logistics_database.csv'
+    ruta.write_text(''.join(lineas[:INICIALES + 1]), encoding='utf-8')
+    return str(ruta)
+
+
+def agregar_lineas(ruta, lineas, inicio, cantidad):
+    """Agrega al CSV temporal los renglones siguientes del CSV original."""
+    with open(ruta, 'a', encoding='utf-8') as archivo:
+        archivo.write(''.join(lineas[inicio + 1:inicio + cantidad + 1]))
+    return inicio + cantidad
+
+
+def indice_de(ruta):
+    return IndiceFiltros(TablaCodificada.desde_df(leer_csv(ruta)))
+
+
+def ordenado(cubo):
+    """Cubo con las llaves como texto y en un orden fijo para comparar."""
+    cubo = cubo[LLAVES_CUBO + ['movimientos', 'monto']].copy()
+    for llave in LLAVES_CUBO:
+        cubo[llave] = cubo[llave].astype(str)
+    cubo['movimientos'] = cubo['movimientos'].astype('int64')
+    cubo['monto'] = cubo['monto'].astype('float64')
+    return cubo.sort_values(LLAVES_CUBO).reset_index(drop=True)
+
+
+def comparar(indice, ruta):
+    """El índice incremental contra uno construido con el CSV completo."""
+    completo = indice_de(ruta)
+    assert indice.ultimo_id == completo.ultimo_id
+    for filtros in FILTROS:
+        pd.testing.assert_frame_equal(
+            ordenado(indice.cubo_filtrado(filtros)),
+            ordenado(completo.cubo_filtrado(filtros)))
+
+
+def test_registros_nuevos(ruta, lineas):
+    indice = indice_de(ruta)
+    seguidor = ingesta.SeguidorCSV(ruta, indice.ultimo_id)
+    assert seguidor.leer_nuevos() is None
+
+    leidos = INICIALES
+    for cantidad in (1, 250, 3000):
+        leidos = agregar_lineas(ruta, lineas, leidos, cantidad)
+        nuevos = seguidor.leer_nuevos()
+        assert len(nuevos) == cantidad
+        indice.agregar(nuevos)
+    comparar(indice, ruta)
+
+
+def test_linea_a_medias(ruta, lineas):
+    indice = indice_de(ruta)
+    seguidor = ingesta.SeguidorCSV(ruta, indice.ultimo_id)
+    renglon = lineas[INICIALES + 1]
+    with open(ruta, 'a', encoding='utf-8') as archivo:
+        archivo.write(renglon[:10])
+    assert seguidor.leer_nuevos() is None
+
+    with open(ruta, 'a', encoding='utf-8') as archivo:
+        archivo.write(renglon[10:])
+    indice.agregar(seguidor.leer_nuevos())
+    comparar(indice, ruta)
+
+
+def test_posicion_a_media_linea(ruta, lineas):
+    # Con una posición que cae a media línea se vuelve a leer esa línea
+    #   completa y el register_id descarta el renglón que ya estaba cargado
+    indice = indice_de(ruta)
+    posicion = os.path.getsize(ruta) - 5
+    seguidor = ingesta.SeguidorCSV(ruta, indice.ultimo_id, posicion)
+    assert seguidor.leer_nuevos() is None
+
+    agregar_lineas(ruta, lineas, INICIALES, 2)
+    nuevos = seguidor.leer_nuevos()
+    assert len(nuevos) == 2
+    indice.agregar(nuevos)
+    comparar(indice, ruta)
+
+
+def test_registros_antes_del_hilo(ruta, lineas):
+    # Los renglones que llegan entre la carga y la primera petición (cuando
+    #   se inicia el hilo) también deben entrar al índice
+    app = create_app({'fuente': ruta, 'precalculado': False,
+                      'ingesta': 3600.0}, registro=None)
+    estado = app.server.extensions['synergy']
+    leidos = agregar_lineas(ruta, lineas, INICIALES, 100)
+    estado.iniciar_hilos()
+    try:
+        agregar_lineas(ruta, lineas, leidos, 100)
+        assert estado.hilo_ingesta.revisar() == 200
+    finally:
+        estado.detener()
+    comparar(estado.instantanea.indice, ruta)
@@ -0,0 +1,57 @@
+# coding: utf-8
+# Los filtros de la tabla de registros con los textos que manda la DataTable,
+#   que antepone 's' o 'i' a cada operador según distinga mayúsculas o no.
+
+import pytest
+
+import registros
+from conftest import CSV
+from datos import leer_csv
+from tabla import TablaCodificada
+
+
+@pytest.fixture(scope='module')
+def df():
+    return leer_csv(CSV)
+
+
+@pytest.fixture(scope='module')
+def tabla(df):
+    return TablaCodificada.desde_df(df)
+
+
+def filtrar(tabla, consulta):
+    """Cantidad de registros que cumplen el filter_query."""
+    _, posiciones = registros.ordenar(tabla, None, consulta)
+    return len(posiciones)
+
+
+def test_parsear_prefijos():
+    assert registros.parsear_consulta(
+        '{origin} scontains Japan && {year} s= 2018 && '
+        '{total_value} s> 1000 && {origin} icontains jap') == [
+        ('origin', 'contains', 'Japan', True),
+        ('year', 'eq', '2018', True),
+        ('total_value', 'gt', '1000', True),
+        ('origin', 'contains', 'jap', False)]
+
+
+def test_filtros_de_la_tabla(df, tabla):
+    origen = df['origin'].astype(str)
+    assert filtrar(tabla, '{origin} scontains Japan') == \
+        origen.str.contains('Japan').sum()
+    assert filtrar(tabla, '{year} s= 2018') == (df['year'] == 2018).sum()
+    assert filtrar(tabla, '{total_value} s> 1000') == \
+        (df['total_value'] > 1000).sum()
+    assert filtrar(tabla, '{origin} icontains jap') == \
+        origen.str.lower().str.contains('jap').sum()
+    assert filtrar(tabla, '{origin} icontains jap') > 0
+
+
+def test_mayusculas(df, tabla):
+    origen = df['origin'].astype(str)
+    assert filtrar(tabla, '{origin} scontains japan') == 0
+    assert filtrar(tabla, '{origin} s= japan') == 0
+    assert filtrar(tabla, '{origin} i= japan') == (origen == 'Japan').sum()
+    assert filtrar(tabla, '{origin} scontains Japan && {year} s= 2018') == \
+        ((origen == 'Japan') & (df['year'] == 2018)).sum()